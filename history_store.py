@@ -0,0 +1,285 @@
+# history_store.py
+"""
+Almacén de historiales de puntos sin repeticiones entre ejecuciones.
+
+Cada jornada de un historial es un nodo inmutable (padre, jornada, puntos)
+identificado por el hash de su contenido, así que un historial completo queda
+representado por el hash de su último nodo (``head``). Los nodos se añaden a
+``nodes.log`` y nunca se reescriben: una ejecución con una jornada nueva solo
+añade un nodo por jugador, y los historiales idénticos (de distintas
+ejecuciones o jugadores) comparten nodos.
+
+Los snapshots (``snapshots/<competición>-<fecha>.jsonl``) guardan cada jugador
+con ``points_history_ref = {"head", "max_matchday"}`` en lugar del historial;
+``materialize`` reconstruye la vista completa de market.json cuando se pide.
+
+Es un almacén adicional: el sniffer sigue escribiendo market.json completo
+(lo leen el frontend y las fusiones), así que con --history-store se guarda
+además, no en su lugar. Lo que ahorra es el archivo de capturas: cada
+snapshot ocupa una fracción de una copia de market.json.
+
+    python history_store.py snapshot market.json --store history_store
+    python history_store.py materialize history_store/snapshots/laliga-….jsonl --output market.json
+    python history_store.py stats --store history_store
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+STORE_DIR = "history_store"
+NODES_FILE = "nodes.log"
+SNAPSHOTS_DIR = "snapshots"
+ROOT = "-"
+HASH_CHARS = 16
+
+
+def node_hash(parent: str, matchday: int, points_json: str) -> str:
+    return hashlib.sha1(f"{parent}:{matchday}:{points_json}".encode("utf-8")).hexdigest()[:HASH_CHARS]
+
+
+def _is_compactable(history) -> bool:
+    """Solo listas de {"matchday": entero, "points": …} se pueden reconstruir sin pérdidas."""
+    return isinstance(history, list) and all(
+        isinstance(entry, dict)
+        and set(entry) == {"matchday", "points"}
+        and isinstance(entry["matchday"], int)
+        and not isinstance(entry["matchday"], bool)
+        for entry in history
+    )
+
+
+class HistoryStore:
+    def __init__(self, path: str = STORE_DIR):
+        self.path = path
+        self.nodes: dict[str, tuple[str, int, str]] = {}
+        self.appended = 0
+        self.reused = 0
+        self.passthrough = 0
+        self._cache: dict[str, list[dict]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(path, SNAPSHOTS_DIR), exist_ok=True)
+        self._load()
+
+    @property
+    def nodes_path(self) -> str:
+        return os.path.join(self.path, NODES_FILE)
+
+    def _load(self):
+        try:
+            fh = open(self.nodes_path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        skipped = 0
+        with fh:
+            for line in fh:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 4:
+                    skipped += 1
+                    continue
+                digest, parent, matchday, points_json = parts
+                try:
+                    matchday = int(matchday)
+                except ValueError:
+                    skipped += 1
+                    continue
+                # Una línea cortada por una escritura interrumpida no cuadra con su hash.
+                if node_hash(parent, matchday, points_json) != digest:
+                    skipped += 1
+                    continue
+                self.nodes[digest] = (parent, matchday, points_json)
+        if skipped:
+            print(f"⚠️  {skipped} nodos no válidos ignorados en {self.nodes_path}")
+
+    def put_history(self, history: list[dict] | None) -> tuple[str, int]:
+        """Guarda un historial y devuelve (head, max_matchday)."""
+        head = ROOT
+        max_matchday = 0
+        new_lines = []
+        with self._lock:
+            for entry in history or []:
+                if not isinstance(entry, dict):
+                    continue
+                try:
+                    matchday = int(entry.get("matchday"))
+                except (TypeError, ValueError):
+                    continue
+                points_json = json.dumps(entry.get("points"))
+                digest = node_hash(head, matchday, points_json)
+                if digest in self.nodes:
+                    self.reused += 1
+                else:
+                    self.nodes[digest] = (head, matchday, points_json)
+                    new_lines.append(f"{digest}\t{head}\t{matchday}\t{points_json}\n")
+                head = digest
+                max_matchday = max(max_matchday, matchday)
+            if new_lines:
+                with open(self.nodes_path, "a", encoding="utf-8") as fh:
+                    fh.write("".join(new_lines))
+                self.appended += len(new_lines)
+        return head, max_matchday
+
+    def get_history(self, head: str | None) -> list[dict]:
+        if not head or head == ROOT:
+            return []
+        cached = self._cache.get(head)
+        if cached is not None:
+            return [dict(entry) for entry in cached]
+        entries = []
+        current = head
+        while current != ROOT:
+            cached = self._cache.get(current)
+            if cached is not None:
+                break
+            node = self.nodes.get(current)
+            if node is None:
+                raise KeyError(f"Nodo {current} no encontrado en {self.nodes_path}")
+            parent, matchday, points_json = node
+            entries.append({"matchday": matchday, "points": json.loads(points_json)})
+            current = parent
+        history = (list(self._cache[current]) if current != ROOT else []) + entries[::-1]
+        self._cache[head] = history
+        return [dict(entry) for entry in history]
+
+    def compact_player(self, player: dict) -> dict:
+        compact = {}
+        for key, value in player.items():
+            if key == "points_history" and _is_compactable(value):
+                head, max_matchday = self.put_history(value)
+                compact["points_history_ref"] = {"head": head, "max_matchday": max_matchday}
+            elif key == "points_history":
+                # Un historial con otro formato se guarda tal cual, sin perderlo.
+                with self._lock:
+                    self.passthrough += 1
+                compact[key] = value
+            else:
+                compact[key] = value
+        return compact
+
+    def expand_player(self, compact: dict) -> dict:
+        player = {}
+        for key, value in compact.items():
+            if key == "points_history_ref":
+                player["points_history"] = self.get_history((value or {}).get("head"))
+            else:
+                player[key] = value
+        return player
+
+    def snapshot_writer(self, label: str = "market", updated_at: str | None = None) -> "SnapshotWriter":
+        stamp = (updated_at or datetime.now(timezone.utc).isoformat()).replace(":", "").replace("+", "Z")
+        return SnapshotWriter(self, os.path.join(self.path, SNAPSHOTS_DIR, f"{label}-{stamp}.jsonl"))
+
+    def write_snapshot(self, payload: dict, label: str = "market") -> str:
+        meta = {key: value for key, value in payload.items() if key != "players"}
+        with self.snapshot_writer(label, meta.get("updated_at")) as writer:
+            for player in payload.get("players") or []:
+                if isinstance(player, dict):
+                    writer.add(player)
+            writer.meta = meta
+        return writer.path
+
+    def materialize(self, snapshot_path: str) -> dict:
+        with open(snapshot_path, "r", encoding="utf-8") as fh:
+            meta = json.loads(fh.readline() or "{}")
+            players = [self.expand_player(json.loads(line)) for line in fh if line.strip()]
+        payload = dict(meta)
+        payload["players"] = players
+        return payload
+
+    def print_summary(self):
+        if self.appended or self.reused:
+            print(
+                f"🗃️  Historiales: {self.appended} jornadas nuevas, {self.reused} ya guardadas "
+                f"({len(self.nodes)} nodos en {self.nodes_path})."
+            )
+        if self.passthrough:
+            print(f"⚠️  {self.passthrough} historiales con formato no reconocido guardados sin compactar.")
+
+
+class SnapshotWriter:
+    """
+    Escribe un snapshot jugador a jugador (sirve para la fusión en streaming).
+    La primera línea lleva las claves de primer nivel; se escribe al cerrar.
+    """
+
+    def __init__(self, store: HistoryStore, path: str):
+        self.store = store
+        self.path = path
+        self.meta: dict = {}
+        self.count = 0
+        self._body_path = f"{path}.players.tmp"
+        self._fh = open(self._body_path, "w", encoding="utf-8")
+
+    def add(self, player: dict):
+        self._fh.write(json.dumps(self.store.compact_player(player), ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self._fh.close()
+        if exc_type is not None:
+            os.remove(self._body_path)
+            return
+        self.meta.setdefault("count", self.count)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out, open(self._body_path, "r", encoding="utf-8") as body:
+            out.write(json.dumps(self.meta, ensure_ascii=False) + "\n")
+            for line in body:
+                out.write(line)
+        os.remove(self._body_path)
+        os.replace(tmp_path, self.path)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Almacén direccionado por contenido de historiales de puntos")
+    parser.add_argument("--store", default=STORE_DIR, help="Directorio del almacén")
+    sub = parser.add_subparsers(dest="command", required=True)
+    snap = sub.add_parser("snapshot", help="Guarda un market.json como snapshot compacto")
+    snap.add_argument("source", nargs="?", default="market.json")
+    snap.add_argument("--label", default="laliga", help="Prefijo del snapshot (competición)")
+    mat = sub.add_parser("materialize", help="Reconstruye market.json desde un snapshot")
+    mat.add_argument("snapshot")
+    mat.add_argument("--output", default="market.materialized.json")
+    sub.add_parser("stats", help="Tamaño del almacén y de los snapshots")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.store)
+    if args.command == "snapshot":
+        with open(args.source, "r", encoding="utf-8") as fh:
+            payload = json.load(fh)
+        path = store.write_snapshot(payload, args.label)
+        store.print_summary()
+        print(
+            f"💾 {path}: {os.path.getsize(path) / 1024:.0f} KiB "
+            f"(frente a {os.path.getsize(args.source) / 1024:.0f} KiB de {args.source})."
+        )
+    elif args.command == "materialize":
+        payload = store.materialize(args.snapshot)
+        tmp_path = f"{args.output}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, args.output)
+        print(f"💾 {args.output} reconstruido con {len(payload['players'])} jugadores.")
+    else:
+        snapshots = sorted(os.listdir(os.path.join(args.store, SNAPSHOTS_DIR)))
+        nodes_size = os.path.getsize(store.nodes_path) if os.path.exists(store.nodes_path) else 0
+        print(
+            f"🗃️  {args.store}: {len(store.nodes)} nodos ({nodes_size / 1024:.0f} KiB), "
+            f"{len(snapshots)} snapshots, {_dir_size(args.store) / 1024:.0f} KiB en total."
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+# market_query.py
+"""
+Consultas rápidas sobre market.json: el snapshot se carga una vez en columnas
+numéricas (array de doubles, NaN para los vacíos) con índices secundarios por
+equipo y posición y ventanas ordenadas por columna para filtrar por rangos con
+búsqueda binaria.
+
+Ejemplos:
+    python market_query.py --position Defensa --max value=5000000 --min diff_pct_7=0 --sort diff_pct_7
+    python market_query.py --team-id 3 --sort points_per_million --top 5
+    python market_query.py --bench
+"""
+import argparse
+import heapq
+import json
+import math
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+WINDOWS = [1, 2, 3, 7, 14, 30]
+
+NUMERIC_COLUMNS = (
+    ["value", "points_avg", "points_last5", "points_total"]
+    + [f"value_{k}" for k in WINDOWS]
+    + [f"diff_{k}" for k in WINDOWS]
+    + [f"diff_pct_{k}" for k in WINDOWS]
+)
+
+# Columnas calculadas al cargar.
+DERIVED_COLUMNS = ["points_per_million"]
+
+NAN = float("nan")
+
+
+def _as_float(value) -> float:
+    if isinstance(value, bool) or value is None:
+        return NAN
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", "."))
+    except Exception:
+        return NAN
+
+
+class MarketIndex:
+    def __init__(self, players: list[dict]):
+        self.players = [entry for entry in players or [] if isinstance(entry, dict)]
+        self.size = len(self.players)
+        self.columns: dict[str, array] = {
+            name: array("d", (_as_float(entry.get(name)) for entry in self.players))
+            for name in NUMERIC_COLUMNS
+        }
+        self.columns["points_per_million"] = array(
+            "d",
+            (
+                total / (value / 1_000_000) if value > 0 and not math.isnan(total) else NAN
+                for total, value in zip(self.columns["points_total"], self.columns["value"])
+            ),
+        )
+        self.by_team_id = self._group("team_id")
+        self.by_team = self._group("team", casefold=True)
+        self.by_position = self._group("position", casefold=True)
+        self._sorted: dict[str, tuple[list[float], list[int]]] = {}
+
+    @classmethod
+    def from_file(cls, path: str = "market.json") -> "MarketIndex":
+        with open(path, "r", encoding="utf-8") as fh:
+            payload = json.load(fh)
+        players = payload.get("players") if isinstance(payload, dict) else payload
+        return cls(players or [])
+
+    def _group(self, field: str, casefold: bool = False) -> dict[str, list[int]]:
+        groups: dict[str, list[int]] = {}
+        for row, entry in enumerate(self.players):
+            key = str(entry.get(field) or "").strip()
+            if casefold:
+                key = key.casefold()
+            if key:
+                groups.setdefault(key, []).append(row)
+        return groups
+
+    def column(self, name: str) -> array:
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise ValueError(f"Columna desconocida: {name}") from None
+
+    def sorted_window(self, name: str) -> tuple[list[float], list[int]]:
+        """(valores ordenados, filas en ese orden) sin NaN; se construye al primer uso."""
+        if name not in self._sorted:
+            col = self.column(name)
+            order = sorted(
+                (row for row in range(self.size) if not math.isnan(col[row])),
+                key=col.__getitem__,
+            )
+            self._sorted[name] = ([col[row] for row in order], order)
+        return self._sorted[name]
+
+    def range_rows(self, name: str, lo: float | None = None, hi: float | None = None) -> list[int]:
+        keys, order = self.sorted_window(name)
+        start = 0 if lo is None else bisect_left(keys, lo)
+        end = len(keys) if hi is None else bisect_right(keys, hi)
+        return order[start:end]
+
+    def query(
+        self,
+        position: str | None = None,
+        team_id: str | None = None,
+        team: str | None = None,
+        ranges: dict[str, tuple[float | None, float | None]] | None = None,
+        sort_by: str | None = None,
+        descending: bool = True,
+        limit: int | None = None,
+    ) -> list[int]:
+        """
+        Filas que cumplen todos los filtros, ordenadas por ``sort_by`` y
+        recortadas a ``limit``. Los rangos son inclusivos; None deja el extremo
+        abierto.
+        """
+        candidates: set[int] | None = None
+        groups = []
+        if position:
+            groups.append(self.by_position.get(position.strip().casefold(), []))
+        if team_id:
+            groups.append(self.by_team_id.get(str(team_id).strip(), []))
+        if team:
+            groups.append(self.by_team.get(team.strip().casefold(), []))
+        for rows in sorted(groups, key=len):
+            candidates = set(rows) if candidates is None else candidates.intersection(rows)
+
+        pending = []
+        for name, (lo, hi) in (ranges or {}).items():
+            keys, _ = self.sorted_window(name)
+            start = 0 if lo is None else bisect_left(keys, lo)
+            end = len(keys) if hi is None else bisect_right(keys, hi)
+            pending.append((end - start, name, lo, hi))
+        pending.sort(key=lambda item: item[0])
+
+        for _, name, lo, hi in pending:
+            if candidates is None:
+                candidates = set(self.range_rows(name, lo, hi))
+                continue
+            col = self.columns[name]
+            candidates = {
+                row
+                for row in candidates
+                if (lo is None or col[row] >= lo) and (hi is None or col[row] <= hi)
+            }
+
+        if sort_by is None:
+            rows = sorted(candidates) if candidates is not None else list(range(self.size))
+            return rows[:limit] if limit is not None else rows
+
+        if candidates is None:
+            # Sin filtros: la ventana ordenada ya es la respuesta.
+            _, order = self.sorted_window(sort_by)
+            rows = order[::-1] if descending else order
+            return rows[:limit] if limit is not None else list(rows)
+
+        col = self.column(sort_by)
+        valid = [row for row in candidates if not math.isnan(col[row])]
+        if limit is not None:
+            pick = heapq.nlargest if descending else heapq.nsmallest
+            return pick(limit, valid, key=col.__getitem__)
+        return sorted(valid, key=col.__getitem__, reverse=descending)
+
+    def record(self, row: int) -> dict:
+        entry = dict(self.players[row])
+        ratio = self.columns["points_per_million"][row]
+        entry["points_per_million"] = None if math.isnan(ratio) else ratio
+        return entry
+
+
+def _parse_ranges(mins: list[str] | None, maxs: list[str] | None) -> dict:
+    ranges: dict[str, list] = {}
+    for raw, slot in [(item, 0) for item in mins or []] + [(item, 1) for item in maxs or []]:
+        name, sep, value = str(raw).partition("=")
+        if not sep:
+            raise ValueError(f"Filtro no válido (se espera columna=valor): {raw}")
+        bounds = ranges.setdefault(name.strip(), [None, None])
+        bounds[slot] = float(value.replace(",", "."))
+    return {name: (lo, hi) for name, (lo, hi) in ranges.items()}
+
+
+def _naive_top_points_per_million(players: list[dict], team_id: str, limit: int) -> list[int]:
+    rows = []
+    for row, entry in enumerate(players):
+        if str(entry.get("team_id") or "").strip() != team_id:
+            continue
+        total = _as_float(entry.get("points_total"))
+        value = _as_float(entry.get("value"))
+        if value > 0 and not math.isnan(total):
+            rows.append((total / (value / 1_000_000), row))
+    rows.sort(key=lambda item: item[0], reverse=True)
+    return [row for _, row in rows[:limit]]
+
+
+def _naive_sorted(players: list[dict], rows, column: str, limit: int | None = None) -> list[int]:
+    rows = [row for row in rows if not math.isnan(_as_float(players[row].get(column)))]
+    rows.sort(key=lambda row: _as_float(players[row].get(column)), reverse=True)
+    return rows[:limit] if limit is not None else rows
+
+
+def _check_same_rows(label: str, index: MarketIndex, indexed: list[int], naive: list[int], column: str, limited: bool):
+    """El índice y el recorrido de la lista deben dar el mismo resultado (salvo el orden de los empates)."""
+    col = index.column(column)
+    same = [col[row] for row in indexed] == [col[row] for row in naive]
+    if not limited:
+        same = same and sorted(indexed) == sorted(naive)
+    if not same:
+        raise AssertionError(f"{label}: el índice y la lista no coinciden ({len(indexed)} frente a {len(naive)} filas)")
+
+
+def run_benchmark(index: MarketIndex, repeat: int = 2000):
+    players = index.players
+    team_id = max(index.by_team_id, key=lambda key: len(index.by_team_id[key]), default="")
+    # Mismo predicado en los dos lados: rangos inclusivos y sin vacíos (NaN).
+    min_rise = 0.0001
+    cases = [
+        (
+            "Defensas < 5M con subida a 7 días",
+            "diff_pct_7",
+            False,
+            lambda: index.query(
+                position="Defensa",
+                ranges={"value": (None, 5_000_000), "diff_pct_7": (min_rise, None)},
+                sort_by="diff_pct_7",
+            ),
+            lambda: _naive_sorted(
+                players,
+                [
+                    row
+                    for row, entry in enumerate(players)
+                    if str(entry.get("position") or "").strip().casefold() == "defensa"
+                    and _as_float(entry.get("value")) <= 5_000_000
+                    and _as_float(entry.get("diff_pct_7")) >= min_rise
+                ],
+                "diff_pct_7",
+            ),
+        ),
+        (
+            f"Top 5 puntos por millón (equipo {team_id})",
+            "points_per_million",
+            True,
+            lambda: index.query(team_id=team_id, sort_by="points_per_million", limit=5),
+            lambda: _naive_top_points_per_million(players, team_id, 5),
+        ),
+        (
+            "Top 10 subidas del día",
+            "diff_pct_1",
+            True,
+            lambda: index.query(sort_by="diff_pct_1", limit=10),
+            lambda: _naive_sorted(players, list(range(len(players))), "diff_pct_1", limit=10),
+        ),
+    ]
+    print(f"⏱️  Benchmark sobre {index.size} jugadores ({repeat} repeticiones):")
+    for label, column, limited, indexed, naive in cases:
+        # Calienta las ventanas ordenadas y comprueba que ambos lados coinciden.
+        _check_same_rows(label, index, list(indexed()), naive(), column, limited)
+        timings = []
+        for fn in (indexed, naive):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            timings.append((time.perf_counter() - started) / repeat * 1_000_000)
+        speedup = timings[1] / timings[0] if timings[0] else float("inf")
+        print(
+            f"   · {label}: índice {timings[0]:.1f} µs, lista {timings[1]:.1f} µs "
+            f"(x{speedup:.1f})"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas rápidas sobre market.json")
+    parser.add_argument("--market", default="market.json", help="Ruta de market.json")
+    parser.add_argument("--position", help="Posición (Portero, Defensa, Mediocampista, Delantero)")
+    parser.add_argument("--team-id", dest="team_id", help="ID de equipo (data-equipo)")
+    parser.add_argument("--team", help="Nombre del equipo")
+    parser.add_argument(
+        "--min",
+        dest="mins",
+        action="append",
+        help="Mínimo inclusivo columna=valor (puede repetirse), p. ej. diff_pct_7=0",
+    )
+    parser.add_argument(
+        "--max",
+        dest="maxs",
+        action="append",
+        help="Máximo inclusivo columna=valor (puede repetirse), p. ej. value=5000000",
+    )
+    parser.add_argument(
+        "--sort",
+        dest="sort_by",
+        help=f"Columna de orden ({', '.join(NUMERIC_COLUMNS + DERIVED_COLUMNS)})",
+    )
+    parser.add_argument("--asc", action="store_true", help="Orden ascendente")
+    parser.add_argument("--top", type=int, default=20, help="Número de resultados")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    parser.add_argument(
+        "--bench",
+        action="store_true",
+        help="Compara consultas típicas con el índice frente a recorrer la lista",
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = MarketIndex.from_file(args.market)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    if args.bench:
+        print(f"📦 {args.market}: {index.size} jugadores cargados en {load_ms:.1f} ms.")
+        run_benchmark(index)
+        return
+
+    try:
+        ranges = _parse_ranges(args.mins, args.maxs)
+        started = time.perf_counter()
+        rows = index.query(
+            position=args.position,
+            team_id=args.team_id,
+            team=args.team,
+            ranges=ranges,
+            sort_by=args.sort_by,
+            descending=not args.asc,
+            limit=args.top,
+        )
+        query_us = (time.perf_counter() - started) * 1_000_000
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    records = [index.record(row) for row in rows]
+    if args.json:
+        print(json.dumps(records, ensure_ascii=False, indent=2))
+        return
+    for entry in records:
+        value_fmt = f"{entry.get('value') or 0:,}".replace(",", ".")
+        extra = ""
+        if args.sort_by and args.sort_by != "value":
+            extra = f" | {args.sort_by}: {entry.get(args.sort_by)}"
+        print(f"→ {entry.get('name')} ({entry.get('team')}, {entry.get('position')}) | {value_fmt} €{extra}")
+    print(f"✅ {len(records)} jugadores en {query_us:.0f} µs (carga {load_ms:.1f} ms).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,525 @@
+# market_server.py
+"""
+Servidor HTTP embebido (asyncio) para market.json. Mantiene el último payload
+en memoria ya serializado y comprimido (gzip y, si está instalado el paquete
+``brotli``, br), responde con ETag fuerte y ``304 Not Modified`` y admite:
+
+    GET /api/market                     payload completo
+    GET /api/market?fields=name,value   proyección de campos por jugador
+    GET /api/market?since=<ISO 8601>    solo jugadores cambiados desde entonces y
+                                        los IDs retirados ("removed")
+    GET /healthz                        estado y versión servida
+
+Cuando market.json cambia en disco (por ejemplo, al terminar el sniffer) se
+prepara la nueva versión fuera del bucle y se sustituye de forma atómica.
+
+El seguimiento de ``since`` vive solo en memoria y empieza con el servidor: un
+``since`` anterior a la primera carga (o a la retirada de un jugador sin ID,
+que no se puede listar en ``removed``) devuelve el mercado completo sin
+``"delta": true``, y el cliente debe sustituir su copia en vez de aplicarla.
+Las proyecciones y deltas nuevos se construyen fuera del bucle de eventos.
+
+    python market_server.py --port 8001
+    python market_server.py --load-test --duration 5 --concurrency 32
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, quote, urlsplit
+
+try:
+    import brotli
+except ImportError:  # compresión br opcional
+    brotli = None
+
+MARKET_PATH = "market.json"
+PROJECTION_CACHE_SIZE = 32
+MAX_HEADER_BYTES = 16 * 1024
+
+
+def _parse_timestamp(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    # Un "+" sin escapar en la query llega como espacio.
+    text = value.strip().replace(" ", "+").replace("Z", "+00:00")
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _player_key(entry: dict, position: int):
+    pid = entry.get("id")
+    return pid if pid is not None else ("#", entry.get("name") or position)
+
+
+def _player_signature(entry: dict) -> str:
+    fingerprint = entry.get("fingerprint")
+    if fingerprint:
+        return str(fingerprint)
+    raw = json.dumps(entry, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class EncodedBody:
+    """Un cuerpo JSON con sus variantes comprimidas y sus ETag."""
+
+    def __init__(self, data: dict):
+        self.identity = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.digest = hashlib.sha256(self.identity).hexdigest()[:32]
+        self.variants = {"identity": self.identity, "gzip": gzip.compress(self.identity, 6)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(self.identity, quality=5)
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+    def matches(self, if_none_match: str | None) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return any(self.etag(encoding) in tags for encoding in self.variants)
+
+
+class MarketVersion:
+    """
+    Payload inmutable listo para servir. ``changed_at`` guarda, por jugador,
+    la marca de la primera versión en la que apareció con su contenido actual
+    (sin versión anterior, la de este payload para todos); ``removed_at``, la
+    de la versión en la que desapareció cada ID. Un ``since`` anterior a
+    ``full_before`` no admite delta.
+    """
+
+    def __init__(self, payload: dict, previous: "MarketVersion | None" = None):
+        self.payload = payload
+        self.players = [entry for entry in payload.get("players") or [] if isinstance(entry, dict)]
+        self.updated_at = payload.get("updated_at") or datetime.now(timezone.utc).isoformat()
+        stamp = _parse_timestamp(self.updated_at) or datetime.now(timezone.utc)
+
+        self.signatures: dict = {}
+        self.changed_at: list[datetime] = []
+        for position, entry in enumerate(self.players):
+            key = _player_key(entry, position)
+            signature = _player_signature(entry)
+            self.signatures[key] = signature
+            if previous is not None and previous.signatures.get(key) == signature:
+                self.changed_at.append(previous.changed_for(key) or stamp)
+            else:
+                self.changed_at.append(stamp)
+        self._changed_by_key = {
+            _player_key(entry, position): self.changed_at[position]
+            for position, entry in enumerate(self.players)
+        }
+
+        self.full_before = previous.full_before if previous is not None else stamp
+        self.removed_at: dict = {}
+        if previous is not None:
+            for key, removed in previous.removed_at.items():
+                if key not in self.signatures:
+                    self.removed_at[key] = removed
+            for key in previous.signatures:
+                if key in self.signatures or key in self.removed_at:
+                    continue
+                if isinstance(key, tuple):
+                    # Sin ID no hay nada que listar en "removed".
+                    self.full_before = max(self.full_before, stamp)
+                else:
+                    self.removed_at[key] = stamp
+
+        self.full = EncodedBody(payload)
+        self._views: OrderedDict = OrderedDict()
+        self._views_lock = threading.Lock()
+
+    def changed_for(self, key) -> datetime | None:
+        return self._changed_by_key.get(key)
+
+    def _view_key(self, fields: tuple[str, ...] | None, since: datetime | None):
+        if since is not None and since < self.full_before:
+            since = None
+        return fields, since
+
+    def cached_view(self, fields: tuple[str, ...] | None, since: datetime | None) -> EncodedBody | None:
+        """Cuerpo ya preparado, o None si hay que construirlo con ``view``."""
+        fields, since = self._view_key(fields, since)
+        if not fields and since is None:
+            return self.full
+        with self._views_lock:
+            body = self._views.get((fields, since))
+            if body is not None:
+                self._views.move_to_end((fields, since))
+            return body
+
+    def view(self, fields: tuple[str, ...] | None, since: datetime | None) -> EncodedBody:
+        body = self.cached_view(fields, since)
+        if body is not None:
+            return body
+        fields, since = self._view_key(fields, since)
+
+        players = self.players
+        removed = []
+        if since is not None:
+            players = [
+                entry
+                for entry, changed in zip(self.players, self.changed_at)
+                if changed > since
+            ]
+            removed = [key for key, stamp in self.removed_at.items() if stamp > since]
+        if fields:
+            wanted = ("id",) + tuple(field for field in fields if field != "id")
+            players = [{field: entry.get(field) for field in wanted} for entry in players]
+
+        data = {key: value for key, value in self.payload.items() if key != "players"}
+        data["count"] = len(players)
+        data["players"] = players
+        if since is not None:
+            data["since"] = since.isoformat()
+            data["delta"] = True
+            data["removed"] = removed
+
+        body = EncodedBody(data)
+        with self._views_lock:
+            self._views[(fields, since)] = body
+            if len(self._views) > PROJECTION_CACHE_SIZE:
+                self._views.popitem(last=False)
+        return body
+
+
+class MarketStore:
+    def __init__(self, path: str = MARKET_PATH):
+        self.path = path
+        self.current: MarketVersion | None = None
+        self.mtime: float | None = None
+        self.loaded_at: str | None = None
+
+    def publish(self, payload: dict):
+        # Se construye entera antes de asignarla: los lectores ven la versión
+        # anterior o la nueva, nunca una a medias.
+        version = MarketVersion(payload, self.current)
+        self.current = version
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        return version
+
+    def load_from_disk(self) -> bool:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if self.mtime is not None and mtime == self.mtime:
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                payload = json.load(fh)
+        except Exception as exc:
+            print(f"⚠️  No se pudo leer {self.path}: {exc}")
+            return False
+        self.publish(payload if isinstance(payload, dict) else {"players": payload})
+        self.mtime = mtime
+        print(f"📦 Servida nueva versión de {self.path} ({len(self.current.players)} jugadores).")
+        return True
+
+    async def watch(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(None, self.load_from_disk)
+
+
+def _pick_encoding(accept_encoding: str | None, available) -> str:
+    offered = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        offered[name] = quality
+    for encoding in ("br", "gzip"):
+        if encoding in available and offered.get(encoding, offered.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+class MarketServer:
+    def __init__(self, store: MarketStore):
+        self.store = store
+        self.requests = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._send(writer, 431, b"", {}, keep_alive=False)
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._send(writer, 400, b"", {}, keep_alive=False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._send(writer, 400, b"", {}, keep_alive=False)
+                    break
+                if length:
+                    await reader.readexactly(length)
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" and (
+                    version.upper() == "HTTP/1.1" or connection == "keep-alive"
+                )
+                await self.respond(writer, method.upper(), target, headers, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (Exception, asyncio.CancelledError):
+                pass
+
+    async def respond(self, writer, method: str, target: str, headers: dict, keep_alive: bool):
+        self.requests += 1
+        url = urlsplit(target)
+        if method not in ("GET", "HEAD"):
+            await self._json(writer, 405, {"error": "Método no permitido"}, keep_alive, method)
+            return
+        if url.path == "/healthz":
+            version = self.store.current
+            await self._json(
+                writer,
+                200,
+                {
+                    "status": "ok",
+                    "hasMarket": version is not None,
+                    "updatedAt": version.updated_at if version else None,
+                    "loadedAt": self.store.loaded_at,
+                    "etag": version.full.etag("identity") if version else None,
+                },
+                keep_alive,
+                method,
+            )
+            return
+        if url.path.rstrip("/") != "/api/market":
+            await self._json(writer, 404, {"error": "Ruta no encontrada"}, keep_alive, method)
+            return
+
+        version = self.store.current
+        if version is None:
+            await self._json(writer, 404, {"error": "market.json no disponible"}, keep_alive, method)
+            return
+
+        query = parse_qs(url.query)
+        fields = None
+        if query.get("fields"):
+            names = sorted({name.strip() for raw in query["fields"] for name in raw.split(",") if name.strip()})
+            fields = tuple(names) or None
+        since = None
+        if query.get("since"):
+            since = _parse_timestamp(query["since"][0])
+            if since is None:
+                await self._json(writer, 400, {"error": "Parámetro since no válido"}, keep_alive, method)
+                return
+
+        body = version.cached_view(fields, since)
+        if body is None:
+            # Filtrar y comprimir cuesta milisegundos: fuera del bucle de eventos.
+            loop = asyncio.get_running_loop()
+            body = await loop.run_in_executor(None, version.view, fields, since)
+        encoding = _pick_encoding(headers.get("accept-encoding"), body.variants)
+        common = {
+            "ETag": body.etag(encoding),
+            "Vary": "Accept-Encoding",
+            "Cache-Control": "no-cache",
+        }
+        if body.matches(headers.get("if-none-match")):
+            await self._send(writer, 304, b"", common, keep_alive)
+            return
+        extra = dict(common)
+        extra["Content-Type"] = "application/json; charset=utf-8"
+        if encoding != "identity":
+            extra["Content-Encoding"] = encoding
+        payload = body.variants[encoding]
+        await self._send(writer, 200, payload, extra, keep_alive, head_only=method == "HEAD")
+
+    async def _json(self, writer, status: int, data: dict, keep_alive: bool, method: str = "GET"):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        await self._send(
+            writer,
+            status,
+            body,
+            {"Content-Type": "application/json; charset=utf-8"},
+            keep_alive,
+            head_only=method == "HEAD",
+        )
+
+    async def _send(self, writer, status: int, body: bytes, headers: dict, keep_alive: bool, head_only: bool = False):
+        reasons = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+                   405: "Method Not Allowed", 431: "Request Header Fields Too Large"}
+        lines = [f"HTTP/1.1 {status} {reasons.get(status, 'OK')}"]
+        for name, value in headers.items():
+            lines.append(f"{name}: {value}")
+        if status != 304:
+            lines.append(f"Content-Length: {len(body)}")
+        lines.append("Access-Control-Allow-Origin: *")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if body and not head_only and status != 304:
+            writer.write(body)
+        await writer.drain()
+
+
+async def serve(store: MarketStore, host: str, port: int, poll: float):
+    server = MarketServer(store)
+    tcp = await asyncio.start_server(server.handle, host, port, limit=MAX_HEADER_BYTES)
+    watcher = asyncio.create_task(store.watch(poll)) if poll > 0 else None
+    print(f"🌐 Sirviendo {store.path} en http://{host}:{port}/api/market")
+    try:
+        async with tcp:
+            await tcp.serve_forever()
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+
+async def _load_client(host: str, port: int, paths: list[tuple[str, dict]], deadline: float, latencies: list[float], statuses: dict):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            path, headers = paths[i % len(paths)]
+            i += 1
+            request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n" + "".join(
+                f"{name}: {value}\r\n" for name, value in headers.items()
+            ) + "\r\n"
+            started = time.perf_counter()
+            writer.write(request.encode("latin-1"))
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            if length:
+                await reader.readexactly(length)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run_load_test(store: MarketStore, duration: float, concurrency: int):
+    server = MarketServer(store)
+    tcp = await asyncio.start_server(server.handle, "127.0.0.1", 0, limit=MAX_HEADER_BYTES)
+    port = tcp.sockets[0].getsockname()[1]
+    # Versión sintética con un 10 % de jugadores cambiados y algunos retirados
+    # para que el delta desde la versión anterior no salga vacío.
+    since = store.current.updated_at
+    changed_payload = dict(store.current.payload)
+    players = []
+    for position, entry in enumerate(store.current.players):
+        if position % 25 == 1:
+            continue
+        if position % 10 == 0:
+            entry = dict(entry)
+            entry["value"] = (entry.get("value") or 0) + 1
+            entry.pop("fingerprint", None)
+        players.append(entry)
+    changed_payload["players"] = players
+    stamp = _parse_timestamp(since) or datetime.now(timezone.utc)
+    changed_payload["updated_at"] = (stamp + timedelta(seconds=1)).isoformat()
+    store.publish(changed_payload)
+    delta_count = sum(1 for changed in store.current.changed_at if changed > stamp)
+    removed_count = sum(1 for removed in store.current.removed_at.values() if removed > stamp)
+    etag_gzip = store.current.full.etag("gzip")
+    scenarios = {
+        "completo gzip": [("/api/market", {"Accept-Encoding": "gzip"})],
+        "condicional (304)": [("/api/market", {"Accept-Encoding": "gzip", "If-None-Match": etag_gzip})],
+        "proyección fields": [("/api/market?fields=name,value,diff_pct_1", {"Accept-Encoding": "gzip"})],
+        f"delta since ({delta_count} cambiados, {removed_count} retirados)": [(f"/api/market?since={quote(since)}", {"Accept-Encoding": "gzip"})],
+    }
+    async with tcp:
+        print(f"⏱️  Prueba de carga: {concurrency} conexiones keep-alive, {duration:.0f}s por escenario.")
+        for label, paths in scenarios.items():
+            latencies: list[float] = []
+            statuses: dict[int, int] = {}
+            deadline = time.perf_counter() + duration
+            started = time.perf_counter()
+            await asyncio.gather(*[
+                _load_client("127.0.0.1", port, paths, deadline, latencies, statuses)
+                for _ in range(concurrency)
+            ])
+            elapsed = time.perf_counter() - started
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] if latencies else 0.0
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+            print(
+                f"   · {label}: {len(latencies) / elapsed:.0f} req/s, p50 {p50:.2f} ms, "
+                f"p99 {p99:.2f} ms, estados {statuses}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor HTTP en memoria para market.json")
+    parser.add_argument("--market", default=MARKET_PATH, help="Ruta de market.json")
+    parser.add_argument("--host", default="127.0.0.1", help="Interfaz de escucha")
+    parser.add_argument("--port", type=int, default=8001, help="Puerto HTTP")
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=2.0,
+        help="Segundos entre comprobaciones de cambios en market.json (0 = nunca)",
+    )
+    parser.add_argument("--load-test", action="store_true", help="Mide req/s contra un servidor local")
+    parser.add_argument("--duration", type=float, default=5.0, help="Segundos por escenario de carga")
+    parser.add_argument("--concurrency", type=int, default=16, help="Conexiones simultáneas de carga")
+    args = parser.parse_args()
+
+    store = MarketStore(args.market)
+    if not store.load_from_disk() and not args.load_test:
+        print(f"⚠️  {args.market} no disponible todavía; se servirá cuando aparezca.")
+    if args.load_test:
+        if store.current is None:
+            parser.error(f"{args.market} es necesario para la prueba de carga")
+        asyncio.run(run_load_test(store, args.duration, args.concurrency))
+        return
+    try:
+        asyncio.run(serve(store, args.host, args.port, args.poll))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,539 @@
+# market_snapshot.py
+"""
+Formato binario de market.json (``market.bin``) para cargas repetidas sin
+pasar por el parser JSON.
+
+Estructura (little endian, secciones alineadas a 8 bytes):
+
+    cabecera      b"MFSNAP01", versión u32, jugadores u32, secciones u32, reservado u32
+    tabla         por sección: nombre 16s, offset u64, longitud u64, tipo 1s, relleno 7x
+    columnas      una por campo numérico (q = entero, NULL_INT para vacíos;
+                  d = double, NaN para vacíos) y una por campo de texto
+                  (I = índice en la tabla de cadenas, NULL_STR para vacíos)
+    cadenas       str_offsets (I) + str_data (utf-8), sin repetidos
+    historiales   hist_offsets (I, jugadores + 1), hist_matchday (i), hist_points (d),
+                  hist_int (B, 1 si el punto era entero en el JSON)
+    points_stats  agregados por jugador: ps_kind (B, 0 = sin agregados o en extras,
+                  1 = suma decimal, 2 = suma entera), ps_sum (d), ps_count (q),
+                  ps_max_matchday (q), ps_digest (Q); los últimos puntos son la
+                  cola del historial compacto
+    meta / extras JSON con las claves del payload y los valores que no encajan
+                  en las columnas
+    keys          JSON con el orden de las claves de primer nivel
+
+La vuelta a JSON conserva el orden de claves (del payload y de cada jugador) y
+el tipo entero/decimal de los puntos del historial.
+
+MarketSnapshot abre el fichero con mmap y devuelve las columnas como
+memoryview sobre el propio mapa, sin copiar.
+
+    python market_snapshot.py from-json market.json market.bin
+    python market_snapshot.py to-json market.bin market.json
+    python market_snapshot.py bench market.json
+"""
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from points_stats import POINTS_LAST_N
+
+MAGIC = b"MFSNAP01"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIII")
+SECTION = struct.Struct("<16sQQc7x")
+
+NULL_INT = -(2 ** 63)
+NULL_STR = 0xFFFFFFFF
+
+WINDOWS = [1, 2, 3, 7, 14, 30]
+
+INT_COLUMNS = (
+    ["id", "value"]
+    + [f"value_{k}" for k in WINDOWS]
+    + [f"diff_{k}" for k in WINDOWS]
+)
+FLOAT_COLUMNS = ["points_avg", "points_last5", "points_total"] + [f"diff_pct_{k}" for k in WINDOWS]
+STRING_COLUMNS = ["name", "team_id", "team", "position", "fingerprint"]
+
+# Orden de claves con el que el sniffer escribe cada jugador.
+PLAYER_FIELDS = (
+    ["id", "name", "team_id", "team", "position", "value",
+     "points_avg", "points_last5", "points_total", "points_history"]
+    + [field for k in WINDOWS for field in (f"value_{k}", f"diff_{k}", f"diff_pct_{k}")]
+    + ["points_stats", "fingerprint"]
+)
+OPTIONAL_FIELDS = {"points_stats", "fingerprint"}
+
+
+class SnapshotBuilder:
+    """Acumula jugadores en columnas compactas; sirve también para escribir en streaming."""
+
+    def __init__(self):
+        self.count = 0
+        self.ints = {name: array("q") for name in INT_COLUMNS}
+        self.floats = {name: array("d") for name in FLOAT_COLUMNS}
+        self.strings = {name: array("I") for name in STRING_COLUMNS}
+        self.string_ids: dict[str, int] = {}
+        self.hist_offsets = array("I", [0])
+        self.hist_matchday = array("i")
+        self.hist_points = array("d")
+        self.hist_int = array("B")
+        self.ps_kind = array("B")
+        self.ps_sum = array("d")
+        self.ps_count = array("q")
+        self.ps_max_matchday = array("q")
+        self.ps_digest = array("Q")
+        self.extras: dict[str, dict] = {}
+
+    def _string_id(self, text: str) -> int:
+        idx = self.string_ids.get(text)
+        if idx is None:
+            idx = len(self.string_ids)
+            self.string_ids[text] = idx
+        return idx
+
+    def add(self, player: dict):
+        row = self.count
+        extra = {}
+        for name in INT_COLUMNS:
+            value = player.get(name)
+            if isinstance(value, int) and not isinstance(value, bool) and NULL_INT < value < 2 ** 63:
+                self.ints[name].append(value)
+            else:
+                self.ints[name].append(NULL_INT)
+                if value is not None or name not in player:
+                    extra[name] = value
+        for name in FLOAT_COLUMNS:
+            value = player.get(name)
+            # Los enteros van a extras para no volver como decimales.
+            if isinstance(value, float):
+                self.floats[name].append(value)
+            else:
+                self.floats[name].append(math.nan)
+                if value is not None or name not in player:
+                    extra[name] = value
+        for name in STRING_COLUMNS:
+            value = player.get(name)
+            if isinstance(value, str):
+                self.strings[name].append(self._string_id(value))
+            else:
+                self.strings[name].append(NULL_STR)
+                if value is not None or (name not in player and name not in OPTIONAL_FIELDS):
+                    extra[name] = value
+
+        history = player.get("points_history")
+        compact = isinstance(history, list) and all(
+            isinstance(entry, dict)
+            and set(entry) == {"matchday", "points"}
+            and isinstance(entry["matchday"], int)
+            and isinstance(entry["points"], (int, float))
+            for entry in history
+        )
+        if compact:
+            for entry in history:
+                self.hist_matchday.append(entry["matchday"])
+                self.hist_points.append(float(entry["points"]))
+                self.hist_int.append(isinstance(entry["points"], int))
+        else:
+            extra["points_history"] = history
+        self.hist_offsets.append(len(self.hist_matchday))
+
+        stats = player.get("points_stats")
+        kind = _stats_kind(stats, history) if compact else 0
+        self.ps_kind.append(kind)
+        if kind:
+            self.ps_sum.append(float(stats["sum"]))
+            self.ps_count.append(stats["count"])
+            self.ps_max_matchday.append(stats["max_matchday"])
+            self.ps_digest.append(int(stats["digest"], 16))
+        else:
+            self.ps_sum.append(math.nan)
+            self.ps_count.append(NULL_INT)
+            self.ps_max_matchday.append(NULL_INT)
+            self.ps_digest.append(0)
+            if "points_stats" in player:
+                extra["points_stats"] = stats
+
+        for key, value in player.items():
+            if key not in PLAYER_FIELDS:
+                extra[key] = value
+        order = list(player)
+        if order != [field for field in PLAYER_FIELDS if field in player] + [
+            key for key in player if key not in PLAYER_FIELDS
+        ]:
+            extra["$order"] = order
+        if extra:
+            # Claves ausentes en el original se marcan para no inventarlas al leer.
+            self.extras[str(row)] = {
+                key: ({"$missing": True} if key not in player and key != "$order" else value)
+                for key, value in extra.items()
+            }
+        self.count += 1
+
+    def write(self, path: str, meta: dict | None = None, keys: list[str] | None = None):
+        sections: list[tuple[str, bytes, bytes]] = []
+        for name, values in self.ints.items():
+            sections.append((name, b"q", _le_bytes(values)))
+        for name, values in self.floats.items():
+            sections.append((name, b"d", _le_bytes(values)))
+        for name, values in self.strings.items():
+            sections.append((f"s:{name}", b"I", _le_bytes(values)))
+
+        offsets = array("I", [0])
+        blob = bytearray()
+        for text in self.string_ids:
+            blob.extend(text.encode("utf-8"))
+            offsets.append(len(blob))
+        sections.append(("str_offsets", b"I", _le_bytes(offsets)))
+        sections.append(("str_data", b"B", bytes(blob)))
+        sections.append(("hist_offsets", b"I", _le_bytes(self.hist_offsets)))
+        sections.append(("hist_matchday", b"i", _le_bytes(self.hist_matchday)))
+        sections.append(("hist_points", b"d", _le_bytes(self.hist_points)))
+        sections.append(("hist_int", b"B", _le_bytes(self.hist_int)))
+        sections.append(("ps_kind", b"B", _le_bytes(self.ps_kind)))
+        sections.append(("ps_sum", b"d", _le_bytes(self.ps_sum)))
+        sections.append(("ps_count", b"q", _le_bytes(self.ps_count)))
+        sections.append(("ps_max_matchday", b"q", _le_bytes(self.ps_max_matchday)))
+        sections.append(("ps_digest", b"Q", _le_bytes(self.ps_digest)))
+        sections.append(("meta", b"B", json.dumps(meta or {}, ensure_ascii=False).encode("utf-8")))
+        if self.extras:
+            sections.append(("extras", b"B", json.dumps(self.extras, ensure_ascii=False).encode("utf-8")))
+        if keys:
+            sections.append(("keys", b"B", json.dumps(keys, ensure_ascii=False).encode("utf-8")))
+
+        position = _align(HEADER.size + SECTION.size * len(sections))
+        table = []
+        for name, dtype, data in sections:
+            table.append(SECTION.pack(name.encode("ascii"), position, len(data), dtype))
+            position = _align(position + len(data))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.count, len(sections), 0))
+            fh.write(b"".join(table))
+            for (_, _, data), entry in zip(sections, table):
+                offset = SECTION.unpack(entry)[1]
+                fh.write(b"\0" * (offset - fh.tell()))
+                fh.write(data)
+        os.replace(tmp_path, path)
+
+
+STATS_KEYS = ["sum", "count", "last", "max_matchday", "digest"]
+
+
+def _stats_kind(stats, history: list[dict]) -> int:
+    """Tipo de ps_kind si los agregados caben en las columnas sin perder nada."""
+    if not isinstance(stats, dict) or list(stats) != STATS_KEYS:
+        return 0
+    total, count, last = stats["sum"], stats["count"], stats["last"]
+    digest, max_matchday = stats["digest"], stats["max_matchday"]
+    if not (
+        isinstance(count, int) and not isinstance(count, bool) and 0 <= count < 2 ** 63
+        and isinstance(max_matchday, int) and not isinstance(max_matchday, bool)
+        and NULL_INT < max_matchday < 2 ** 63
+        and isinstance(digest, str) and len(digest) == 16
+        and digest == digest.lower() and all(ch in "0123456789abcdef" for ch in digest)
+    ):
+        return 0
+    if isinstance(total, bool) or not isinstance(total, (int, float)):
+        return 0
+    if isinstance(total, int) and abs(total) > 2 ** 53:
+        return 0
+    # Los últimos puntos se leen de la cola del historial.
+    tail = min(POINTS_LAST_N, count)
+    if tail > len(history) or last != [entry["points"] for entry in history[len(history) - tail:]]:
+        return 0
+    if any(type(a) is not type(entry["points"]) for a, entry in zip(last, history[len(history) - tail:])):
+        return 0
+    return 2 if isinstance(total, int) else 1
+
+
+def _align(value: int) -> int:
+    return (value + 7) & ~7
+
+
+def _le_bytes(values: array) -> bytes:
+    if sys.byteorder == "little":
+        return values.tobytes()
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def write_snapshot(payload: dict, path: str = "market.bin"):
+    builder = SnapshotBuilder()
+    for player in payload.get("players") or []:
+        if isinstance(player, dict):
+            builder.add(player)
+    builder.write(path, {key: value for key, value in payload.items() if key != "players"}, list(payload))
+
+
+class MarketSnapshot:
+    """
+    Lector de market.bin sobre mmap. ``column(nombre)`` devuelve una
+    memoryview tipada sobre el mapa (sin copia); ``player(i)`` reconstruye un
+    jugador con el mismo esquema que market.json.
+    """
+
+    def __init__(self, path: str = "market.bin"):
+        self.path = path
+        self._fh = open(path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        magic, version, count, section_count, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} no es un snapshot binario compatible")
+        self.count = count
+        self.sections: dict[str, tuple[int, int, str]] = {}
+        for i in range(section_count):
+            name, offset, length, dtype = SECTION.unpack_from(self._mm, HEADER.size + i * SECTION.size)
+            self.sections[name.rstrip(b"\0").decode("ascii")] = (offset, length, dtype.decode("ascii"))
+        self._columns: dict[str, memoryview] = {}
+        self.meta = json.loads(bytes(self._raw("meta")).decode("utf-8"))
+        self.extras = (
+            json.loads(bytes(self._raw("extras")).decode("utf-8")) if "extras" in self.sections else {}
+        )
+        self.keys = json.loads(bytes(self._raw("keys")).decode("utf-8")) if "keys" in self.sections else None
+        self._str_offsets = self._typed("str_offsets")
+        self._str_data = self._raw("str_data")
+        self._id_index: dict[int, int] | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self):
+        for view in self._columns.values():
+            view.release()
+        self._columns.clear()
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+            self._view = None
+        if getattr(self, "_mm", None) is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # Quedan memoryviews de columnas en uso fuera del lector.
+                pass
+        self._fh.close()
+
+    def _raw(self, name: str) -> memoryview:
+        offset, length, _ = self.sections[name]
+        return self._view[offset:offset + length]
+
+    def _typed(self, name: str):
+        view = self._columns.get(name)
+        if view is None:
+            offset, length, dtype = self.sections[name]
+            raw = self._view[offset:offset + length]
+            if sys.byteorder != "little":
+                values = array(dtype, raw.tobytes())
+                values.byteswap()
+                return values
+            view = raw.cast(dtype)
+            self._columns[name] = view
+        return view
+
+    def column(self, name: str):
+        if name in STRING_COLUMNS:
+            return self._typed(f"s:{name}")
+        if name not in self.sections:
+            raise KeyError(f"Columna desconocida: {name}")
+        return self._typed(name)
+
+    def string(self, idx: int) -> str | None:
+        if idx == NULL_STR:
+            return None
+        start, end = self._str_offsets[idx], self._str_offsets[idx + 1]
+        return bytes(self._str_data[start:end]).decode("utf-8")
+
+    def history(self, row: int) -> list[dict]:
+        offsets = self._typed("hist_offsets")
+        start, end = offsets[row], offsets[row + 1]
+        matchdays = self._typed("hist_matchday")
+        points = self._typed("hist_points")
+        # Snapshots anteriores a hist_int devuelven todos los puntos como decimales.
+        as_int = self._typed("hist_int") if "hist_int" in self.sections else None
+        return [
+            {"matchday": matchdays[i], "points": int(points[i]) if as_int is not None and as_int[i] else points[i]}
+            for i in range(start, end)
+        ]
+
+    def _points_stats(self, row: int, history: list[dict] | None) -> dict | None:
+        kind = self._typed("ps_kind")[row] if "ps_kind" in self.sections else 0
+        if not kind:
+            return None
+        count = self._typed("ps_count")[row]
+        total = self._typed("ps_sum")[row]
+        if history is None:
+            history = self.history(row)
+        tail = min(POINTS_LAST_N, count)
+        return {
+            "sum": int(total) if kind == 2 else total,
+            "count": count,
+            "last": [entry["points"] for entry in history[len(history) - tail:]],
+            "max_matchday": self._typed("ps_max_matchday")[row],
+            "digest": f"{self._typed('ps_digest')[row]:016x}",
+        }
+
+    def find(self, player_id: int) -> int | None:
+        if self._id_index is None:
+            ids = self._typed("id")
+            self._id_index = {ids[row]: row for row in range(self.count) if ids[row] != NULL_INT}
+        return self._id_index.get(player_id)
+
+    def player(self, row: int) -> dict:
+        if not 0 <= row < self.count:
+            raise IndexError(row)
+        extra = self.extras.get(str(row), {})
+        data = {}
+        for field in PLAYER_FIELDS:
+            if field in extra:
+                value = extra[field]
+                if value == {"$missing": True}:
+                    continue
+                data[field] = value
+            elif field == "points_history":
+                data[field] = self.history(row)
+            elif field == "points_stats":
+                stats = self._points_stats(row, data.get("points_history"))
+                if stats is not None:
+                    data[field] = stats
+            elif field in STRING_COLUMNS:
+                value = self.string(self._typed(f"s:{field}")[row])
+                if value is None and field in OPTIONAL_FIELDS:
+                    continue
+                data[field] = value
+            elif field in INT_COLUMNS:
+                value = self._typed(field)[row]
+                data[field] = None if value == NULL_INT else value
+            else:
+                value = self._typed(field)[row]
+                data[field] = None if math.isnan(value) else value
+        for key, value in extra.items():
+            if key not in data and key not in PLAYER_FIELDS and key != "$order":
+                data[key] = value
+        order = extra.get("$order")
+        if order:
+            data = {key: data[key] for key in order if key in data}
+        return data
+
+    def players(self):
+        for row in range(self.count):
+            yield self.player(row)
+
+    def to_payload(self) -> dict:
+        players = list(self.players())
+        payload = {}
+        for key in self.keys or []:
+            if key == "players":
+                payload[key] = players
+            elif key in self.meta:
+                payload[key] = self.meta[key]
+        for key, value in self.meta.items():
+            payload.setdefault(key, value)
+        payload.setdefault("players", players)
+        return payload
+
+
+def convert_json_to_snapshot(json_path: str, bin_path: str):
+    with open(json_path, "r", encoding="utf-8") as fh:
+        payload = json.load(fh)
+    write_snapshot(payload, bin_path)
+
+
+def convert_snapshot_to_json(bin_path: str, json_path: str):
+    with MarketSnapshot(bin_path) as snapshot:
+        payload = snapshot.to_payload()
+    tmp_path = f"{json_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, json_path)
+
+
+def run_benchmark(json_path: str, repeat: int = 20):
+    bin_path = f"{os.path.splitext(json_path)[0]}.bin"
+    convert_json_to_snapshot(json_path, bin_path)
+
+    def load_json():
+        with open(json_path, "r", encoding="utf-8") as fh:
+            players = json.load(fh)["players"]
+        return sum(entry.get("value") or 0 for entry in players)
+
+    def load_binary():
+        with MarketSnapshot(bin_path) as snapshot:
+            values = snapshot.column("value")
+            total = sum(values)
+            del values
+            return total
+
+    def single_player_json():
+        with open(json_path, "r", encoding="utf-8") as fh:
+            players = json.load(fh)["players"]
+        return players[len(players) // 2]
+
+    def single_player_binary():
+        with MarketSnapshot(bin_path) as snapshot:
+            return snapshot.player(snapshot.count // 2)
+
+    print(
+        f"⏱️  {json_path} ({os.path.getsize(json_path) / 1024:.0f} KiB) frente a "
+        f"{bin_path} ({os.path.getsize(bin_path) / 1024:.0f} KiB), {repeat} repeticiones:"
+    )
+    for label, json_fn, bin_fn in [
+        ("Suma de la columna value", load_json, load_binary),
+        ("Un jugador", single_player_json, single_player_binary),
+    ]:
+        timings = []
+        for fn in (json_fn, bin_fn):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            timings.append((time.perf_counter() - started) / repeat * 1000)
+        print(f"   · {label}: JSON {timings[0]:.2f} ms, binario {timings[1]:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversión y pruebas del snapshot binario de mercado")
+    sub = parser.add_subparsers(dest="command", required=True)
+    to_bin = sub.add_parser("from-json", help="market.json → market.bin")
+    to_bin.add_argument("source", nargs="?", default="market.json")
+    to_bin.add_argument("target", nargs="?", default="market.bin")
+    to_json = sub.add_parser("to-json", help="market.bin → market.json")
+    to_json.add_argument("source", nargs="?", default="market.bin")
+    to_json.add_argument("target", nargs="?", default="market.from-bin.json")
+    info = sub.add_parser("info", help="Resumen de secciones de un market.bin")
+    info.add_argument("source", nargs="?", default="market.bin")
+    bench = sub.add_parser("bench", help="Compara la carga JSON con la binaria")
+    bench.add_argument("source", nargs="?", default="market.json")
+    args = parser.parse_args()
+
+    if args.command == "from-json":
+        convert_json_to_snapshot(args.source, args.target)
+        print(f"💾 {args.target} generado desde {args.source}.")
+    elif args.command == "to-json":
+        convert_snapshot_to_json(args.source, args.target)
+        print(f"💾 {args.target} generado desde {args.source}.")
+    elif args.command == "info":
+        with MarketSnapshot(args.source) as snapshot:
+            print(f"📦 {args.source}: {snapshot.count} jugadores, meta {snapshot.meta}")
+            for name, (offset, length, dtype) in snapshot.sections.items():
+                print(f"   · {name}: {length} bytes ({dtype}) @ {offset}")
+    else:
+        run_benchmark(args.source)
+
+
+if __name__ == "__main__":
+    main()
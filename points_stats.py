@@ -0,0 +1,85 @@
+# points_stats.py
+"""
+Agregados de puntos por jugador (``points_stats`` en market.json): suma,
+número de jornadas, últimos POINTS_LAST_N puntos, última jornada y un
+resumen encadenado (``digest``) de las jornadas que cubren. Con los
+agregados del registro anterior, una jornada nueva solo suma esa jornada.
+Se confía en que las jornadas ya cubiertas no cambian (mismo número y misma
+última jornada); el ``digest`` permite comprobarlo recalculando todo con
+--verify-aggregates.
+"""
+import hashlib
+from collections import deque
+
+# Partidos de la media reciente (points_last5).
+POINTS_LAST_N = 5
+
+
+def _chain(digest: str, entry: dict) -> str:
+    # Encadenado por jornada para poder ampliarlo sin repasar el historial.
+    raw = f"{digest}|{entry['matchday']}:{float(entry['points'])!r}".encode("ascii")
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def _is_point(entry: dict) -> bool:
+    return isinstance(entry.get("points"), (int, float))
+
+
+def update_points_stats(stats: dict | None, history: list[dict]) -> dict:
+    """
+    Agregados de un historial ordenado por jornada. Si ``stats`` viene del
+    registro anterior y su última jornada sigue siendo la misma entrada del
+    historial, solo se suman las posteriores a su ``max_matchday``; si no,
+    se recalculan desde cero.
+    """
+    start = 0
+    if (
+        isinstance(stats, dict)
+        and isinstance(stats.get("count"), int)
+        and stats.get("max_matchday") is not None
+        and stats.get("digest")
+    ):
+        start = len(history)
+        while start > 0 and history[start - 1]["matchday"] > stats["max_matchday"]:
+            start -= 1
+        last = stats.get("last") or []
+        if (
+            start != stats["count"]
+            or not last
+            or history[start - 1]["matchday"] != stats["max_matchday"]
+            or history[start - 1].get("points") != last[-1]
+        ):
+            start = 0
+    if start == 0:
+        stats = {"sum": 0, "count": 0, "last": [], "max_matchday": 0, "digest": ""}
+    elif start == len(history):
+        return dict(stats)
+    total = stats["sum"]
+    count = stats["count"]
+    last = deque(stats["last"], maxlen=POINTS_LAST_N)
+    max_matchday = stats["max_matchday"]
+    digest = stats["digest"]
+    for entry in history[start:]:
+        if not _is_point(entry):
+            continue
+        total += entry["points"]
+        count += 1
+        last.append(entry["points"])
+        max_matchday = max(max_matchday, entry["matchday"])
+        digest = _chain(digest, entry)
+    return {
+        "sum": total,
+        "count": count,
+        "last": list(last),
+        "max_matchday": max_matchday,
+        "digest": digest,
+    }
+
+
+def points_stats_metrics(stats: dict | None) -> tuple[float | None, float | None, float | None]:
+    """(media, media de los últimos partidos, total) a partir de los agregados."""
+    if not stats or not stats.get("count"):
+        return None, None, None
+    last = stats.get("last") or []
+    recent = sum(last) / len(last) if last else None
+    return stats["sum"] / stats["count"], recent, float(stats["sum"])
@@ -0,0 +1,51 @@
+# proc_memory.py
+"""
+Memoria de procesos leída de /proc (Linux), sin dependencias: la usan el
+sniffer (--memory-report / --memory-budget) y el arnés de standin_server.py.
+Fuera de Linux todas las lecturas devuelven 0.
+"""
+import os
+from contextlib import suppress
+
+
+def read_status_kib(pid, field: str) -> int:
+    """Campo en KiB de /proc/<pid>/status (VmRSS, VmHWM…); ``pid`` puede ser "self"."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as fh:
+            for line in fh:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except Exception:
+        pass
+    return 0
+
+
+def process_tree_pids(root_pid: int, include_root: bool = True) -> set[int]:
+    """PIDs de un proceso y todos sus descendientes."""
+    parents: dict[int, int] = {}
+    with suppress(Exception):
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "r") as fh:
+                    fields = fh.read().rsplit(")", 1)[1].split()
+                parents[int(entry)] = int(fields[1])
+            except Exception:
+                continue
+    tree = {root_pid}
+    changed = True
+    while changed:
+        changed = False
+        for pid, ppid in parents.items():
+            if ppid in tree and pid not in tree:
+                tree.add(pid)
+                changed = True
+    if not include_root:
+        tree.discard(root_pid)
+    return tree
+
+
+def process_tree_rss_kib(root_pid: int, include_root: bool = True) -> int:
+    """RSS (KiB) de un proceso y sus descendientes."""
+    return sum(read_status_kib(pid, "VmRSS") for pid in process_tree_pids(root_pid, include_root))
@@ -0,0 +1,331 @@
+# refresh_scheduler.py
+"""
+Planificador de refrescos según volatilidad. En lugar de rehacer todo el
+mercado cada pocas horas, estima para cada jugador cuánto se mueve su valor
+(ventanas diff_pct_{k} de market.json y cambios observados entre refrescos,
+guardados en refresh_schedule.json) y le asigna un intervalo de refresco:
+
+    intervalo = max_interval / (1 + volatilidad / REFERENCE_PCT_PER_DAY)
+
+limitado a [min_interval, max_interval]. En modo puntos, cada ciclo lanza
+el sniffer con ``--player-id`` para un lote de los jugadores vencidos de
+mayor prioridad y, cada ``--full-every`` horas, un barrido completo. En modo
+mercado una ejecución dirigida carga y recorre igualmente la página entera,
+así que cuando hay jugadores vencidos se hace una sola pasada completa; la
+carga se estima en cargas de la página de mercado, que es lo que cuesta.
+
+    python refresh_scheduler.py --dry-run --once
+    python refresh_scheduler.py --interval 15 --batch-size 25 --full-every 24
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+MARKET_PATH = "market.json"
+STATE_PATH = "refresh_schedule.json"
+SNIFFER_SCRIPT = "sniff_market_json_v3_debug.py"
+
+WINDOWS = [1, 2, 3, 7, 14, 30]
+# Un 1 %/día de movimiento reduce el intervalo a la mitad del máximo.
+REFERENCE_PCT_PER_DAY = 1.0
+# Peso de cada cambio nuevo en la media móvil de cambios observados.
+CHANGE_ALPHA = 0.3
+SNIFFER_TIMEOUT_S = 30 * 60
+# Cadencia del refresco completo del servidor Node (MARKET_REFRESH_CRON).
+FIXED_CRON_HOURS = 6
+
+
+def _now() -> float:
+    return time.time()
+
+
+def _fmt_ts(ts: float | None) -> str:
+    if not ts:
+        return "nunca"
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="seconds")
+
+
+def window_volatility(player: dict) -> float:
+    """%/día estimado con las ventanas diff_pct_k, dando más peso a las cortas."""
+    total = 0.0
+    weights = 0.0
+    for k in WINDOWS:
+        pct = player.get(f"diff_pct_{k}")
+        if not isinstance(pct, (int, float)) or isinstance(pct, bool) or math.isnan(pct):
+            continue
+        weight = 1 / k
+        total += weight * abs(pct) / k
+        weights += weight
+    return total / weights if weights else 0.0
+
+
+class RefreshState:
+    """Historial persistido: último refresco, último valor visto y ritmo de cambio por jugador."""
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self.last_full: float | None = None
+        self.players: dict[str, dict] = {}
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return
+        except Exception as exc:
+            print(f"⚠️  No se pudo leer {self.path}: {exc}")
+            return
+        self.last_full = data.get("last_full")
+        players = data.get("players")
+        self.players = players if isinstance(players, dict) else {}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump({"last_full": self.last_full, "players": self.players}, fh, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def observe(self, players: list[dict], now: float):
+        """
+        Actualiza el ritmo de cambio con los valores de market.json. Solo se
+        cuenta una observación si el valor cambió o si el jugador se refrescó
+        (dirigido o en un barrido completo) después de la última: así un
+        jugador que no se ha vuelto a consultar no se da por estable, y uno
+        que el barrido ha visto sin cambios sí baja su volatilidad.
+        """
+        for player in players:
+            pid = player.get("id")
+            value = player.get("value")
+            if pid is None or not isinstance(value, (int, float)) or value <= 0:
+                continue
+            entry = self.players.setdefault(str(pid), {})
+            prev = entry.get("value")
+            observed_at = entry.get("observed_at")
+            if prev is None or observed_at is None:
+                entry["value"] = value
+                entry["observed_at"] = now
+                continue
+            refreshed_at = max(entry.get("refreshed_at") or 0, self.last_full or 0)
+            refreshed_since = refreshed_at > observed_at
+            if value == prev and not refreshed_since:
+                continue
+            days = max(now - observed_at, 3600) / 86400
+            rate = abs(value - prev) / prev * 100 / days
+            previous_rate = entry.get("change_rate")
+            entry["change_rate"] = (
+                rate if previous_rate is None else CHANGE_ALPHA * rate + (1 - CHANGE_ALPHA) * previous_rate
+            )
+            entry["samples"] = entry.get("samples", 0) + 1
+            entry["value"] = value
+            entry["observed_at"] = now
+
+    def mark_refreshed(self, ids, now: float):
+        for pid in ids:
+            self.players.setdefault(str(pid), {})["refreshed_at"] = now
+
+
+class RefreshPlanner:
+    def __init__(
+        self,
+        state: RefreshState,
+        min_interval_h: float = 1.0,
+        max_interval_h: float = 24.0,
+        batch_size: int = 25,
+    ):
+        self.state = state
+        self.min_interval_s = min_interval_h * 3600
+        self.max_interval_s = max_interval_h * 3600
+        self.batch_size = batch_size
+
+    def volatility(self, player: dict) -> float:
+        estimate = window_volatility(player)
+        entry = self.state.players.get(str(player.get("id"))) or {}
+        observed = entry.get("change_rate")
+        if observed is None:
+            return estimate
+        # Cuanto más historial propio, más pesa frente a las ventanas.
+        weight = min(entry.get("samples", 1), 3)
+        return (estimate + weight * observed) / (1 + weight)
+
+    def interval_s(self, volatility: float) -> float:
+        interval = self.max_interval_s / (1 + volatility / REFERENCE_PCT_PER_DAY)
+        return min(max(interval, self.min_interval_s), self.max_interval_s)
+
+    def plan(self, players: list[dict], now: float) -> list[dict]:
+        """Jugadores vencidos ordenados por prioridad (volatilidad × retraso relativo)."""
+        due = []
+        for player in players:
+            pid = player.get("id")
+            if pid is None:
+                continue
+            entry = self.state.players.get(str(pid)) or {}
+            refreshed_at = max(entry.get("refreshed_at") or 0, self.state.last_full or 0)
+            volatility = self.volatility(player)
+            interval = self.interval_s(volatility)
+            age = now - refreshed_at if refreshed_at else math.inf
+            if age < interval:
+                continue
+            overdue = age / interval if math.isfinite(age) else 1e6
+            due.append(
+                {
+                    "id": pid,
+                    "name": player.get("name"),
+                    "volatility": volatility,
+                    "interval_h": interval / 3600,
+                    "priority": (volatility + 0.01) * overdue,
+                }
+            )
+        due.sort(key=lambda item: item["priority"], reverse=True)
+        return due
+
+
+def load_players(path: str) -> list[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            payload = json.load(fh)
+    except FileNotFoundError:
+        return []
+    except Exception as exc:
+        print(f"⚠️  No se pudo leer {path}: {exc}")
+        return []
+    players = payload.get("players") if isinstance(payload, dict) else payload
+    return [entry for entry in players or [] if isinstance(entry, dict)]
+
+
+def run_sniffer(python: str, mode: str, ids: list | None = None, headless: bool = True) -> bool:
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    command = [python, os.path.join(base_dir, SNIFFER_SCRIPT), "--mode", mode]
+    command.append("--headless" if headless else "--no-headless")
+    for pid in ids or []:
+        command.extend(["--player-id", str(pid)])
+    label = f"{len(ids)} jugadores" if ids else "barrido completo"
+    print(f"🚀 Lanzando sniffer ({label}, modo {mode}) …")
+    started = time.perf_counter()
+    try:
+        result = subprocess.run(command, cwd=base_dir, timeout=SNIFFER_TIMEOUT_S)
+    except subprocess.TimeoutExpired:
+        print(f"⚠️  El sniffer superó {SNIFFER_TIMEOUT_S} s y se canceló.")
+        return False
+    except Exception as exc:
+        print(f"⚠️  No se pudo lanzar el sniffer: {exc}")
+        return False
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        print(f"⚠️  El sniffer terminó con código {result.returncode} tras {elapsed:.0f} s.")
+        return False
+    print(f"✅ Sniffer completado en {elapsed:.0f} s.")
+    return True
+
+
+def estimate_page_loads(args, planner: RefreshPlanner, players: list[dict]) -> tuple[float, float]:
+    """(cargas de la página de mercado/día, refrescos de jugador/día) si cada jugador sigue su intervalo."""
+    intervals = [planner.interval_s(planner.volatility(p)) for p in players]
+    if not intervals:
+        return 0.0, 0.0
+    if args.mode == "market":
+        # Una pasada cada vez que vence el jugador más volátil; refresca a todos.
+        loads = 86400 / min(intervals)
+        return loads, loads * len(intervals)
+    refreshes = sum(86400 / interval for interval in intervals)
+    batches = min(1440 / args.interval, math.ceil(refreshes / max(1, args.batch_size)))
+    return batches + 24 / args.full_every, refreshes
+
+
+def run_cycle(args, state: RefreshState, planner: RefreshPlanner):
+    now = _now()
+    players = load_players(args.market)
+    state.observe(players, now)
+
+    full_due = not players or state.last_full is None or now - state.last_full >= args.full_every * 3600
+    if full_due:
+        print(f"🧹 Barrido completo pendiente (último: {_fmt_ts(state.last_full)}).")
+        if not args.dry_run:
+            if run_sniffer(args.python, args.mode, headless=args.headless):
+                finished = _now()
+                state.last_full = finished
+                state.observe(load_players(args.market), finished)
+            state.save()
+            return
+
+    due = planner.plan(players, now)
+    batch = due if args.mode == "market" else due[: args.batch_size]
+    if not batch:
+        print(
+            "ℹ️ Ningún jugador vencido; próximo barrido completo tras "
+            f"{_fmt_ts((state.last_full or now) + args.full_every * 3600)}."
+        )
+        return
+
+    loads, refreshes = estimate_page_loads(args, planner, players)
+    label = "pasada completa de mercado" if args.mode == "market" else f"lote de {len(batch)}"
+    print(
+        f"📋 {len(due)} jugadores vencidos; {label}. "
+        f"Carga estimada: {loads:.1f} cargas de la página de mercado/día ({refreshes:.0f} refrescos "
+        f"de jugador) frente a {24 / FIXED_CRON_HOURS:.0f} con el cron fijo de {FIXED_CRON_HOURS} h."
+    )
+    for item in batch[: args.batch_size]:
+        print(
+            f"   ↳ {item['name']} ({item['id']}): {item['volatility']:.2f} %/día, "
+            f"cada {item['interval_h']:.1f} h, prioridad {item['priority']:.2f}"
+        )
+    if args.dry_run:
+        return
+    if args.mode == "market":
+        if run_sniffer(args.python, args.mode, headless=args.headless):
+            finished = _now()
+            state.last_full = finished
+            state.observe(load_players(args.market), finished)
+        state.save()
+        return
+    ids = [item["id"] for item in batch]
+    if run_sniffer(args.python, args.mode, ids, headless=args.headless):
+        finished = _now()
+        state.mark_refreshed(ids, finished)
+        state.observe(load_players(args.market), finished)
+    state.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refrescos de mercado priorizados por volatilidad")
+    parser.add_argument("--market", default=MARKET_PATH, help="Ruta de market.json")
+    parser.add_argument("--state", default=STATE_PATH, help="Historial de refrescos")
+    parser.add_argument("--mode", choices=["market", "points"], default="market", help="Modo del sniffer")
+    parser.add_argument("--interval", type=float, default=15.0, help="Minutos entre ciclos")
+    parser.add_argument("--batch-size", type=int, default=25, help="Jugadores por refresco dirigido")
+    parser.add_argument("--min-interval", type=float, default=1.0, help="Horas mínimas entre refrescos de un jugador")
+    parser.add_argument("--max-interval", type=float, default=24.0, help="Horas máximas entre refrescos de un jugador")
+    parser.add_argument("--full-every", type=float, default=24.0, help="Horas entre barridos completos")
+    parser.add_argument("--python", default=sys.executable, help="Intérprete para lanzar el sniffer")
+    parser.add_argument("--no-headless", dest="headless", action="store_false", help="Navegador visible")
+    parser.add_argument("--dry-run", action="store_true", help="Muestra el plan sin lanzar el sniffer")
+    parser.add_argument("--once", action="store_true", help="Ejecuta un solo ciclo")
+    parser.set_defaults(headless=True)
+    args = parser.parse_args()
+
+    state = RefreshState(args.state)
+    state.load()
+    planner = RefreshPlanner(state, args.min_interval, args.max_interval, args.batch_size)
+
+    while True:
+        try:
+            run_cycle(args, state, planner)
+        except KeyboardInterrupt:
+            raise
+        except Exception as exc:
+            print(f"⚠️  Ciclo de refresco fallido: {exc}")
+        if args.once:
+            return
+        try:
+            time.sleep(args.interval * 60)
+        except KeyboardInterrupt:
+            return
+
+
+if __name__ == "__main__":
+    main()
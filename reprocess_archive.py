@@ -0,0 +1,140 @@
+# reprocess_archive.py
+"""
+Reprocesa en paralelo snapshots archivados (páginas de mercado .html y
+market.json de ejecuciones anteriores) con la normalización actual del
+sniffer y escribe los resultados, según van terminando, en un JSON Lines
+consolidado: una línea por snapshot.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from sniff_market_json_v3_debug import (
+    apply_points_history,
+    build_player_record,
+    parse_attribute_history,
+    parse_market_html,
+    renormalize_player_record,
+)
+
+ARCHIVE_SUFFIXES = (".html", ".htm", ".json")
+
+
+def find_snapshots(root: str) -> list[str]:
+    if os.path.isfile(root):
+        return [root]
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.lower().endswith(ARCHIVE_SUFFIXES):
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)
+
+
+def _file_timestamp(path: str) -> str:
+    return datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).isoformat()
+
+
+def reprocess_snapshot(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as fh:
+        raw = fh.read()
+
+    if path.lower().endswith(".json"):
+        payload = json.loads(raw)
+        entries = payload.get("players") if isinstance(payload, dict) else payload
+        players = [
+            renormalize_player_record(entry)
+            for entry in entries or []
+            if isinstance(entry, dict)
+        ]
+        updated_at = (
+            payload.get("updated_at") if isinstance(payload, dict) else None
+        ) or _file_timestamp(path)
+    else:
+        players = []
+        for snapshot in parse_market_html(raw):
+            record = build_player_record(snapshot, warn=False)
+            apply_points_history(record, parse_attribute_history(snapshot.get("attrs")))
+            players.append(record)
+        updated_at = _file_timestamp(path)
+
+    return {
+        "source": path,
+        "updated_at": updated_at,
+        "count": len(players),
+        "players": players,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reprocesa snapshots archivados del mercado con la normalización actual"
+    )
+    parser.add_argument(
+        "archive",
+        help="Directorio (o fichero) con páginas .html y market.json archivados",
+    )
+    parser.add_argument(
+        "--output",
+        default="market_archive.jsonl",
+        help="Fichero JSON Lines consolidado (una línea por snapshot)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Procesos en paralelo (1 = sin pool, útil para comparar)",
+    )
+    args = parser.parse_args()
+
+    paths = find_snapshots(args.archive)
+    if not paths:
+        print(f"⚠️  No se encontraron snapshots en {args.archive}.")
+        return
+    workers = max(1, min(args.workers, len(paths)))
+    print(f"🗂️  Reprocesando {len(paths)} snapshots con {workers} procesos…")
+
+    started = time.perf_counter()
+    done = 0
+    failed = 0
+    total_players = 0
+    with open(args.output, "w", encoding="utf-8") as out:
+
+        def emit(result: dict):
+            nonlocal done, total_players
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            done += 1
+            total_players += result["count"]
+            print(f"→ {done}/{len(paths)}: {result['source']} ({result['count']} jugadores)")
+
+        if workers == 1:
+            for path in paths:
+                try:
+                    emit(reprocess_snapshot(path))
+                except Exception as exc:
+                    failed += 1
+                    print(f"⚠️  No se pudo reprocesar {path}: {exc}")
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(reprocess_snapshot, path): path for path in paths}
+                for future in as_completed(futures):
+                    try:
+                        emit(future.result())
+                    except Exception as exc:
+                        failed += 1
+                        print(f"⚠️  No se pudo reprocesar {futures[future]}: {exc}")
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"💾 {args.output}: {done} snapshots y {total_players} jugadores en {elapsed:.1f}s "
+        f"({total_players / elapsed if elapsed else 0:.0f} jugadores/s, {workers} procesos)."
+    )
+    if failed:
+        print(f"⚠️  {failed} snapshots con errores.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,39 @@
 # sniff_market_json_v3_debug.py
+from playwright.async_api import async_playwright
 from playwright.sync_api import sync_playwright
 import argparse
-import json, re, unicodedata
+import asyncio
+import hashlib
+import os
+import json, math, queue, re, sys, threading, time, tracemalloc, unicodedata
+from collections import deque
 from datetime import datetime, timezone
+from html.parser import HTMLParser
 from contextlib import suppress
+from urllib.parse import urlsplit
+
+from history_store import HistoryStore
+from market_snapshot import write_snapshot
+from points_stats import POINTS_LAST_N, points_stats_metrics, update_points_stats
+from proc_memory import process_tree_rss_kib, read_status_kib
 
 URL = "https://www.futbolfantasy.com/analytics/laliga-fantasy/mercado"
 PLAYER_API_BASE = "https://www.laligafantasymarca.com/api/v3/player"
 PLAYER_API_COMPETITION = "laliga-fantasy"
 
-
-FETCH_POINTS_HISTORY = False
+# Competiciones conocidas. ``output`` es el market.json de cada una y
+# ``rate_limit`` el máximo de peticiones por segundo a cada host que usa.
+# --competitions-file añade o sustituye entradas con el mismo formato.
+COMPETITIONS = {
+    "laliga": {
+        "url": URL,
+        "api_base": PLAYER_API_BASE,
+        "api_competition": PLAYER_API_COMPETITION,
+        "output": "market.json",
+        "rate_limit": 5.0,
+    },
+}
+DEFAULT_COMPETITION = "laliga"
 
 
 def to_int(s: str | None) -> int:
@@ -206,67 +229,600 @@ def parse_points_history_payload(payload) -> list[dict]:
     return dedupe_points_history(results)
 
 
-def gather_datasets(locator) -> list:
+# Recorre el subárbol una sola vez (cola con índice, sin queue.shift()) y se
+# queda solo con las claves data-* que parse_points_history_payload sabe
+# interpretar, sin duplicar dataset/getAttributeNames ni entradas repetidas.
+DATASET_COLLECTOR_SCRIPT = """
+(root, includeRootValues) => {
+  const MATCHDAY = new Set(['matchday', 'jornada', 'round', 'day', 'gw']);
+  const POINTS = new Set(['points', 'puntos', 'score', 'valor', 'value']);
+  const NESTED = new Set([
+    'historial', 'history', 'puntuaciones', 'scores',
+    'matchdays', 'jornadas', 'points', 'values',
+  ]);
+  const KEYED = /^(?:j|jor|jornada|gw|md)[_-]?[0-9]{1,3}/;
+  const ROOT_VALUE = /punto|point|jorn|match|score/;
+  const entries = [];
+  const seen = new Set();
+  const values = [];
+  const queue = [root];
+  for (let i = 0; i < queue.length; i++) {
+    const node = queue[i];
+    const names = node.getAttributeNames ? node.getAttributeNames() : [];
+    let entry = null;
+    let hasMatchday = false;
+    let hasPoints = false;
+    let hasHistory = false;
+    for (const name of names) {
+      if (!name.startsWith('data-')) continue;
+      const key = name.slice(5).toLowerCase();
+      const value = node.getAttribute(name);
+      if (includeRootValues && node === root && value && ROOT_VALUE.test(name)) {
+        values.push(value);
+      }
+      const isMatchday = MATCHDAY.has(key);
+      const isPoints = POINTS.has(key);
+      const isHistory = NESTED.has(key) || KEYED.test(key);
+      if (!isMatchday && !isPoints && !isHistory) continue;
+      hasMatchday = hasMatchday || isMatchday;
+      hasPoints = hasPoints || isPoints;
+      hasHistory = hasHistory || isHistory;
+      (entry = entry || {})[key] = value;
+    }
+    if (entry && (hasHistory || (hasMatchday && hasPoints))) {
+      const signature = JSON.stringify(entry);
+      if (!seen.has(signature)) {
+        seen.add(signature);
+        entries.push(entry);
+      }
+    }
+    const children = node.children;
+    for (let j = 0; children && j < children.length; j++) {
+      queue.push(children[j]);
+    }
+  }
+  return { entries, values };
+}
+"""
+
+
+def collect_history_payloads(locator, include_root_values: bool = False) -> dict:
     try:
-        return locator.evaluate(
-            """
-            (root) => {
-              const entries = [];
-              const queue = [root];
-              const visited = new Set();
-              while (queue.length) {
-                const node = queue.shift();
-                if (!node || visited.has(node)) continue;
-                visited.add(node);
-                if (node.dataset && Object.keys(node.dataset).length) {
-                  entries.push({ ...node.dataset });
-                }
-                if (node.getAttributeNames) {
-                  const attrs = {};
-                  for (const name of node.getAttributeNames()) {
-                    if (name.startsWith('data-')) {
-                      attrs[name.slice(5)] = node.getAttribute(name);
-                    }
-                  }
-                  if (Object.keys(attrs).length) {
-                    entries.push(attrs);
-                  }
-                }
-                for (const child of Array.from(node.children || [])) {
-                  queue.push(child);
+        result = locator.evaluate(DATASET_COLLECTOR_SCRIPT, include_root_values) or {}
+    except Exception:
+        result = {}
+    return {
+        "entries": result.get("entries") or [],
+        "values": result.get("values") or [],
+    }
+
+
+def gather_datasets(locator) -> list:
+    return collect_history_payloads(locator)["entries"]
+
+
+class LatencyTracker:
+    """
+    Latencias observadas (ms) de una espera para derivar timeouts adaptativos:
+    con pocas muestras se usa el valor por defecto y después el p95 con margen,
+    acotado entre ``min_ms`` y ``max_ms``.
+    """
+
+    def __init__(self, default_ms: int, min_ms: int, max_ms: int, window: int = 50):
+        self.default_ms = default_ms
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.samples: deque[float] = deque(maxlen=window)
+        # Últimos intentos (True = la señal llegó) para la tasa de fallos.
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.misses = 0
+
+    def observe(self, elapsed_ms: float):
+        self.samples.append(elapsed_ms)
+        self.outcomes.append(True)
+
+    def miss(self):
+        self.misses += 1
+        self.outcomes.append(False)
+
+    @property
+    def reliable(self) -> bool:
+        # Si la señal casi nunca llega, esperar por ella solo añade timeouts.
+        recent_misses = self.outcomes.count(False)
+        return recent_misses < 3 or recent_misses / len(self.outcomes) < 0.5
+
+    def percentile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[idx]
+
+    def timeout(self) -> int:
+        if len(self.samples) < 5:
+            return self.default_ms
+        p95 = self.percentile(0.95) or 0.0
+        return int(min(self.max_ms, max(self.min_ms, p95 * 1.5 + 50)))
+
+
+class WaitReport:
+    """Compara las esperas por eventos con las pausas fijas que sustituyen."""
+
+    def __init__(self):
+        self.entries: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, legacy_ms: float, actual_ms: float):
+        with self._lock:
+            entry = self.entries.setdefault(operation, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += legacy_ms
+            entry[2] += actual_ms
+
+    def print_summary(self):
+        if not self.entries:
+            return
+        total_legacy = sum(entry[1] for entry in self.entries.values())
+        total_actual = sum(entry[2] for entry in self.entries.values())
+        print("⏱️  Esperas del navegador (eventos frente a pausas fijas):")
+        for operation, (count, legacy_ms, actual_ms) in self.entries.items():
+            print(
+                f"   · {operation}: {count} esperas, {actual_ms / 1000:.1f}s "
+                f"(antes {legacy_ms / 1000:.1f}s)"
+            )
+        print(f"   · Ahorro total: {(total_legacy - total_actual) / 1000:.1f}s")
+
+
+class HistoryTimes:
+    """Duración de la obtención del historial de cada jugador, medida dentro de la extracción."""
+
+    def __init__(self):
+        self.samples: list[float] = []
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float):
+        with self._lock:
+            self.samples.append(elapsed_ms)
+
+    def print_summary(self):
+        if not self.samples:
+            return
+        ordered = sorted(self.samples)
+
+        def pick(q: float) -> float:
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+        # standin_server.py --harness lee esta línea.
+        print(
+            f"⏱️  Historial por jugador: {len(ordered)} consultas, p50 {pick(0.5):.1f} ms, "
+            f"p95 {pick(0.95):.1f} ms, p99 {pick(0.99):.1f} ms, máx {ordered[-1]:.1f} ms"
+        )
+
+
+MODAL_SELECTOR = "div[id*='detalle'], div[class*='detalle'], div.modal, div[class*='player']"
+
+MODAL_WAITS = {
+    "detalle": LatencyTracker(default_ms=1500, min_ms=300, max_ms=4000),
+    "apertura": LatencyTracker(default_ms=4000, min_ms=500, max_ms=4000),
+    "cierre": LatencyTracker(default_ms=1000, min_ms=150, max_ms=1000),
+}
+WAIT_REPORT = WaitReport()
+HISTORY_TIMES = HistoryTimes()
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    pass
+
+
+class MemoryReport:
+    """
+    Puntos de control de memoria por fase: memoria Python (tracemalloc, solo
+    con --memory-report), RSS propio y RSS de los procesos hijos (driver de
+    Playwright y Chromium). Con presupuesto, superarlo en cualquier punto de
+    control corta la captura con MemoryBudgetExceeded.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.budget_kib: int | None = None
+        self.top = 10
+        self.checkpoints: list[dict] = []
+        self.peak_snapshot = None
+        self.peak_label = ""
+        self._peak_traced = 0
+        self._last_budget_check = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.enabled or self.budget_kib is not None
+
+    def configure(self, enabled: bool = False, budget_mib: float | None = None, top: int = 10):
+        self.enabled = enabled
+        self.budget_kib = int(budget_mib * 1024) if budget_mib else None
+        self.top = top
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def checkpoint(self, phase: str, detail: str | None = None):
+        if not self.active:
+            return
+        self_kib = read_status_kib("self", "VmRSS")
+        children_kib = process_tree_rss_kib(os.getpid(), include_root=False)
+        traced, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        label = f"{phase} ({detail})" if detail else phase
+        with self._lock:
+            self.checkpoints.append(
+                {
+                    "label": label,
+                    "traced": traced,
+                    "traced_peak": traced_peak,
+                    "self_kib": self_kib,
+                    "children_kib": children_kib,
                 }
-              }
-              return entries;
-            }
-            """,
+            )
+            # La instantánea de asignaciones se toma donde la memoria Python es máxima.
+            if tracemalloc.is_tracing() and traced > self._peak_traced:
+                self._peak_traced = traced
+                self.peak_snapshot = tracemalloc.take_snapshot()
+                self.peak_label = label
+        self._enforce_budget(label, self_kib, children_kib)
+
+    def check_budget(self, label: str):
+        """
+        Comprobación del presupuesto entre puntos de control (por tarjeta),
+        como mucho cada BUDGET_CHECK_INTERVAL_S para no recorrer /proc sin parar.
+        """
+        if self.budget_kib is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_budget_check < BUDGET_CHECK_INTERVAL_S:
+                return
+            self._last_budget_check = now
+        self._enforce_budget(
+            label,
+            read_status_kib("self", "VmRSS"),
+            process_tree_rss_kib(os.getpid(), include_root=False),
         )
-    except Exception:
-        return []
+
+    def _enforce_budget(self, label: str, self_kib: int, children_kib: int):
+        total_kib = self_kib + children_kib
+        if self.budget_kib is not None and total_kib > self.budget_kib:
+            raise MemoryBudgetExceeded(
+                f"Presupuesto de memoria superado en {label}: {total_kib / 1024:.0f} MiB "
+                f"(propio {self_kib / 1024:.0f} MiB + hijos {children_kib / 1024:.0f} MiB) "
+                f"> {self.budget_kib / 1024:.0f} MiB"
+            )
+
+    def print_summary(self):
+        if not self.enabled or not self.checkpoints:
+            return
+        print("🧠 Memoria por fase (Python actual/pico, RSS propio, RSS hijos):")
+        for entry in self.checkpoints:
+            print(
+                f"   · {entry['label']}: {entry['traced'] / 2**20:.1f}/{entry['traced_peak'] / 2**20:.1f} MiB, "
+                f"{entry['self_kib'] / 1024:.0f} MiB, {entry['children_kib'] / 1024:.0f} MiB"
+            )
+        print(f"   · Pico de RSS propio (VmHWM): {read_status_kib('self', 'VmHWM') / 1024:.0f} MiB")
+        if self.peak_snapshot is None:
+            return
+        snapshot = self.peak_snapshot.filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ]
+        )
+        print(f"🧠 Principales asignaciones Python en {self.peak_label}:")
+        for stat in snapshot.statistics("lineno")[: self.top]:
+            frame = stat.traceback[0]
+            print(
+                f"   · {os.path.basename(frame.filename)}:{frame.lineno}: "
+                f"{stat.size / 1024:.0f} KiB en {stat.count} bloques"
+            )
+
+
+MEMORY_REPORT = MemoryReport()
+# Cada cuántas tarjetas se toma un punto de control durante el historial.
+MEMORY_CHECK_EVERY = 100
+# Entre puntos de control, el presupuesto se comprueba a lo sumo con esta cadencia.
+BUDGET_CHECK_INTERVAL_S = 0.5
+
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo para --profile. Un hilo aparte lee la pila de
+    cada hilo registrado cada ``interval`` segundos y reparte el tiempo real
+    transcurrido entre sus funciones, así que el coste no depende de cuántas
+    llamadas haga el scraper.
+
+    La API síncrona de Playwright espera las respuestas del driver cambiando
+    a otro greenlet (el despachador): durante la espera la pila del hilo es
+    la de ese despachador y la del scraper queda suspendida en el greenlet
+    principal (``gr_frame``). Esas muestras se atribuyen a la llamada del
+    scraper que esperaba, con una hoja ``Playwright: <método>``.
+    """
+
+    PYTHON = "python"
+    PLAYWRIGHT = "playwright"
+    PLAYWRIGHT_CLIENT = "playwright_client"
+    ASYNCIO = "asyncio"
+    CATEGORY_LABELS = {
+        PYTHON: "Python",
+        PLAYWRIGHT: "bloqueado en Playwright",
+        PLAYWRIGHT_CLIENT: "cliente Python de Playwright",
+        ASYNCIO: "espera de E/S (asyncio)",
+    }
+    _LIBRARY_DIRS = (
+        f"{os.sep}playwright{os.sep}",
+        f"{os.sep}greenlet{os.sep}",
+    )
+
+    def __init__(self):
+        self.enabled = False
+        self.interval = 0.005
+        self.top = 25
+        self.frames: list[tuple[str, str, int]] = []
+        self._frame_ids: dict[tuple[str, str, int], int] = {}
+        # nombre de hilo -> pila (ids de frames, raíz primero) -> segundos
+        self.stacks: dict[str, dict[tuple[int, ...], float]] = {}
+        self.categories: dict[str, float] = {}
+        self.samples = 0
+        self.started_at: float | None = None
+        self.elapsed = 0.0
+        self._threads: dict[int, tuple[str, object]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    def configure(self, enabled: bool = False, interval_ms: float = 5.0, top: int = 25):
+        self.enabled = enabled
+        self.interval = max(interval_ms, 0.5) / 1000
+        self.top = top
+
+    def register_thread(self):
+        """Lo llama cada hilo que captura, antes de arrancar Playwright."""
+        if not self.enabled:
+            return
+        main_greenlet = None
+        with suppress(Exception):
+            import greenlet
+
+            main_greenlet = greenlet.getcurrent()
+        current = threading.current_thread()
+        with self._lock:
+            self._threads[current.ident] = (current.name, main_greenlet)
+
+    def start(self):
+        if not self.enabled or self._sampler is not None:
+            return
+        self.started_at = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name="perfilador", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        if self._sampler is None:
+            return
+        self._stop.set()
+        self._sampler.join()
+        self._sampler = None
+        self.elapsed = time.perf_counter() - (self.started_at or time.perf_counter())
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+
+    def _frame_id(self, name: str, filename: str = "", line: int = 0) -> int:
+        key = (name, filename, line)
+        frame_id = self._frame_ids.get(key)
+        if frame_id is None:
+            frame_id = self._frame_ids[key] = len(self.frames)
+            self.frames.append(key)
+        return frame_id
+
+    def _is_library(self, code) -> bool:
+        return any(part in code.co_filename for part in self._LIBRARY_DIRS)
+
+    def _classify(self, frame, main_greenlet) -> tuple[list, str, str | None]:
+        """(pila de objetos de código con la raíz primero, categoría, llamada de Playwright)."""
+        # Con el greenlet principal suspendido el hilo está en el despachador de Playwright.
+        blocked = main_greenlet is not None and getattr(main_greenlet, "gr_frame", None) is not None
+        if blocked:
+            frame = main_greenlet.gr_frame
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        for index, code in enumerate(codes):
+            if self._is_library(code):
+                # La pila interna de Playwright se resume en una hoja con el método llamado.
+                category = self.PLAYWRIGHT if blocked else self.PLAYWRIGHT_CLIENT
+                return codes[:index], category, code.co_name
+        if blocked:
+            return codes, self.PLAYWRIGHT, None
+        leaf = codes[-1].co_filename if codes else ""
+        if leaf.endswith(f"{os.sep}selectors.py") or leaf.endswith(f"{os.sep}asyncio{os.sep}base_events.py"):
+            return codes, self.ASYNCIO, None
+        return codes, self.PYTHON, None
+
+    def _sample(self, weight: float):
+        current_frames = sys._current_frames()
+        with self._lock:
+            threads = list(self._threads.items())
+        for ident, (name, main_greenlet) in threads:
+            frame = current_frames.get(ident)
+            if frame is None:
+                continue
+            try:
+                codes, category, api_call = self._classify(frame, main_greenlet)
+            except Exception:
+                continue
+            stack = [self._frame_id(code.co_name, code.co_filename, code.co_firstlineno) for code in codes]
+            if category == self.PLAYWRIGHT:
+                stack.append(self._frame_id(f"Playwright: {api_call or 'espera'}"))
+            elif category == self.PLAYWRIGHT_CLIENT:
+                stack.append(self._frame_id(f"Playwright (cliente): {api_call}"))
+            elif category == self.ASYNCIO:
+                stack.append(self._frame_id("asyncio: espera de E/S"))
+            key = tuple(stack)
+            per_thread = self.stacks.setdefault(name, {})
+            per_thread[key] = per_thread.get(key, 0.0) + weight
+            self.categories[category] = self.categories.get(category, 0.0) + weight
+            self.samples += 1
+
+    def _frame_label(self, frame_id: int) -> str:
+        name, filename, line = self.frames[frame_id]
+        return f"{name} ({os.path.basename(filename)}:{line})" if filename else name
+
+    def write_speedscope(self, path: str):
+        profiles = []
+        for name, stacks in self.stacks.items():
+            total = sum(stacks.values())
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": round(total, 6),
+                    "samples": [list(stack) for stack in stacks],
+                    "weights": [round(weight, 6) for weight in stacks.values()],
+                }
+            )
+        payload = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": "sniff_market_json_v3_debug",
+            "exporter": "sniff_market_json_v3_debug --profile",
+            "activeProfileIndex": 0,
+            "shared": {
+                "frames": [
+                    {"name": name, "file": filename, "line": line} if filename else {"name": name}
+                    for name, filename, line in self.frames
+                ]
+            },
+            "profiles": profiles,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def summary_lines(self) -> list[str]:
+        sampled = sum(self.categories.values())
+        lines = [
+            f"Perfil de {self.elapsed:.1f}s de ejecución: {self.samples} muestras cada "
+            f"{self.interval * 1000:g} ms en {len(self.stacks)} hilos ({sampled:.1f}s muestreados).",
+            "",
+            "Tiempo por categoría:",
+        ]
+        for category, seconds in sorted(self.categories.items(), key=lambda item: item[1], reverse=True):
+            share = seconds / sampled * 100 if sampled else 0.0
+            lines.append(f"  {self.CATEGORY_LABELS[category]:<26} {seconds:9.2f}s {share:6.1f}%")
+
+        self_time: dict[int, float] = {}
+        inclusive: dict[int, float] = {}
+        for stacks in self.stacks.values():
+            for stack, weight in stacks.items():
+                if stack:
+                    self_time[stack[-1]] = self_time.get(stack[-1], 0.0) + weight
+                for frame_id in set(stack):
+                    inclusive[frame_id] = inclusive.get(frame_id, 0.0) + weight
+        for title, totals in (("propio", self_time), ("inclusivo", inclusive)):
+            lines.extend(["", f"Top {self.top} funciones por tiempo {title}:"])
+            ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[: self.top]
+            for frame_id, seconds in ranked:
+                share = seconds / sampled * 100 if sampled else 0.0
+                lines.append(f"  {seconds:9.2f}s {share:6.1f}%  {self._frame_label(frame_id)}")
+        return lines
+
+    def write_reports(self, output: str) -> tuple[str, str]:
+        stem = os.path.splitext(output)[0]
+        speedscope_path = f"{stem}.profile.speedscope.json"
+        summary_path = f"{stem}.profile.txt"
+        self.write_speedscope(speedscope_path)
+        lines = self.summary_lines()
+        with open(summary_path, "w", encoding="utf-8") as fh:
+            fh.write("\n".join(lines) + "\n")
+        return speedscope_path, summary_path
+
+    def print_summary(self, output: str):
+        if not self.enabled or not self.samples:
+            return
+        try:
+            speedscope_path, summary_path = self.write_reports(output)
+        except Exception as exc:
+            print(f"⚠️  No se pudo guardar el perfil: {exc}")
+            return
+        print("⏱️  Perfil de ejecución:")
+        sampled = sum(self.categories.values())
+        for category, seconds in sorted(self.categories.items(), key=lambda item: item[1], reverse=True):
+            share = seconds / sampled * 100 if sampled else 0.0
+            print(f"   · {self.CATEGORY_LABELS[category]}: {seconds:.1f}s ({share:.0f}%)")
+        print(f"   ↳ Flamegraph: {speedscope_path} (https://www.speedscope.app)")
+        print(f"   ↳ Resumen: {summary_path}")
+
+
+PROFILER = SamplingProfiler()
 
 
-def close_detail_modal(page):
+def _elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+def wait_until_hidden(target, tracker: LatencyTracker, timeout_ms: float | None = None) -> bool:
+    if target is None or not tracker.reliable:
+        return False
+    timeout_ms = tracker.timeout() if timeout_ms is None else timeout_ms
+    if timeout_ms <= 0:
+        return False
+    started = time.perf_counter()
+    try:
+        target.wait_for_element_state("hidden", timeout=timeout_ms)
+    except Exception:
+        tracker.miss()
+        return False
+    tracker.observe(_elapsed_ms(started))
+    return True
+
+
+CLOSE_BUTTON_SELECTORS = [
+    "button:has-text('Cerrar')",
+    "button:has-text('Close')",
+    "button.cerrar",
+    "button.close",
+    "div.modal button.btn",
+    "div.modal-header button",
+    "div.swal2-container button.swal2-close",
+]
+
+
+def close_detail_modal(page, modal=None):
+    started = time.perf_counter()
+    tracker = MODAL_WAITS["cierre"]
+    # Escape y el botón de cerrar comparten un único plazo de espera.
+    budget_ms = tracker.timeout()
     try:
         page.keyboard.press("Escape")
     except Exception:
         pass
-    selectors = [
-        "button:has-text('Cerrar')",
-        "button:has-text('Close')",
-        "button.cerrar",
-        "button.close",
-        "div.modal button.btn",
-        "div.modal-header button",
-        "div.swal2-container button.swal2-close",
-    ]
-    for sel in selectors:
+    # Antes: 200 ms tras el clic en "Cerrar" y 150 ms fijos al terminar.
+    if wait_until_hidden(modal, tracker, budget_ms):
+        WAIT_REPORT.record("cierre del detalle", 350, _elapsed_ms(started))
+        return
+    for sel in CLOSE_BUTTON_SELECTORS:
         try:
             btn = page.locator(sel).first
             if btn.is_visible():
                 btn.click(timeout=1000)
-                page.wait_for_timeout(200)
+                wait_until_hidden(modal, tracker, budget_ms - _elapsed_ms(started))
                 break
         except Exception:
             continue
+    WAIT_REPORT.record("cierre del detalle", 350, _elapsed_ms(started))
 
 
 def collect_history_from_modal(modal) -> list[dict]:
@@ -283,49 +839,238 @@ def collect_history_from_modal(modal) -> list[dict]:
     return dedupe_points_history(history)
 
 
-def fetch_points_history_via_api(page, pid, label: str | None = None) -> list[dict]:
+class CircuitBreaker:
+    """
+    Cortocircuito para un servicio remoto: con demasiados errores recientes se
+    abre y las llamadas fallan al instante; pasado el enfriamiento deja pasar
+    una sola sonda (semiabierto) y vuelve a cerrarse si responde bien.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        error_rate: float = 0.5,
+        cooldown_s: float = 30.0,
+        max_cooldown_s: float = 300.0,
+    ):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.base_cooldown_s = cooldown_s
+        self.max_cooldown_s = max_cooldown_s
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.latency = LatencyTracker(default_ms=10_000, min_ms=1_500, max_ms=10_000, window=200)
+        self.trips = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.cooldown_s:
+                    self.rejected += 1
+                    return False
+                self.state = "half_open"
+                self.probe_in_flight = False
+            if self.probe_in_flight:
+                self.rejected += 1
+                return False
+            self.probe_in_flight = True
+            return True
+
+    def is_open(self) -> bool:
+        """Abierto y todavía enfriándose: llamar ahora fallaría al instante."""
+        return self.state == "open" and time.monotonic() - self.opened_at < self.cooldown_s
+
+    def timeout_ms(self) -> int:
+        # La sonda semiabierta espera el máximo: con el timeout adaptativo un
+        # servicio que se ha vuelto más lento fallaría todas las sondas.
+        if self.state == "half_open":
+            return self.latency.max_ms
+        return self.latency.timeout()
+
+    def record_success(self, elapsed_ms: float):
+        with self._lock:
+            self.latency.observe(elapsed_ms)
+            self.outcomes.append(True)
+            if self.state == "half_open":
+                print(f"   ↳ {self.name}: servicio recuperado, se cierra el circuito.")
+                self.state = "closed"
+                self.outcomes.clear()
+                self.cooldown_s = self.base_cooldown_s
+            self.probe_in_flight = False
+
+    def record_timeout(self, elapsed_ms: float, timeout_ms: int):
+        """
+        Error de red. Si se agotó el timeout se anota como muestra censurada en
+        ese valor para que el timeout adaptativo pueda crecer; otros errores
+        (conexión rechazada) no son una latencia real.
+        """
+        self.record_failure(timeout_ms if elapsed_ms >= timeout_ms else None)
+
+    def record_failure(self, elapsed_ms: float | None = None):
+        with self._lock:
+            if elapsed_ms is not None:
+                self.latency.observe(elapsed_ms)
+            self.outcomes.append(False)
+            self.probe_in_flight = False
+            if self.state == "half_open":
+                self.cooldown_s = min(self.max_cooldown_s, self.cooldown_s * 2)
+                self._trip()
+                return
+            errors = self.outcomes.count(False)
+            if (
+                self.state == "closed"
+                and len(self.outcomes) >= self.min_calls
+                and errors / len(self.outcomes) >= self.error_rate
+            ):
+                self._trip()
+
+    def _trip(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        print(
+            f"   ↳ {self.name}: demasiados errores, circuito abierto durante "
+            f"{self.cooldown_s:.0f}s."
+        )
+
+    def print_summary(self):
+        if not self.latency.samples and not self.rejected:
+            return
+        p50 = self.latency.percentile(0.5) or 0.0
+        p95 = self.latency.percentile(0.95) or 0.0
+        p99 = self.latency.percentile(0.99) or 0.0
+        print(
+            f"🔌 {self.name}: estado {self.state}, {self.trips} aperturas, "
+            f"{self.rejected} llamadas descartadas; latencia p50 {p50:.0f} ms, "
+            f"p95 {p95:.0f} ms, p99 {p99:.0f} ms; timeout actual {self.timeout_ms()} ms"
+        )
+
+
+class HostRateLimiter:
+    """
+    Límite de peticiones por host compartido entre hilos: cada llamada a
+    ``wait`` reserva el siguiente hueco libre del host y duerme hasta él
+    fuera del candado.
+    """
+
+    def __init__(self, default_rps: float = 5.0):
+        self.default_rps = default_rps
+        self.rates: dict[str, float] = {}
+        self.next_slot: dict[str, float] = {}
+        self.waited_s: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, url: str, rps: float | None):
+        host = urlsplit(url).netloc
+        if not host or not rps or rps <= 0:
+            return
+        with self._lock:
+            # Si dos competiciones comparten host manda el límite más estricto.
+            self.rates[host] = min(rps, self.rates.get(host, rps))
+
+    def reserve(self, url: str) -> float:
+        """Reserva el siguiente hueco del host y devuelve los segundos que hay que esperar."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            interval = 1.0 / self.rates.get(host, self.default_rps)
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, 0.0))
+            self.next_slot[host] = slot + interval
+            delay = slot - now
+            if delay > 0:
+                self.waited_s[host] = self.waited_s.get(host, 0.0) + delay
+        return delay
+
+    def wait(self, url: str):
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    def print_summary(self):
+        for host, waited in sorted(self.waited_s.items()):
+            print(f"🚦 {host}: {waited:.1f}s de espera por límite de peticiones.")
+
+
+RATE_LIMITER = HostRateLimiter()
+
+_BREAKERS: dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    """Un cortocircuito por host: los errores de un servicio no cortan los demás."""
+    host = urlsplit(url).netloc or url
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(host)
+        if breaker is None:
+            breaker = _BREAKERS[host] = CircuitBreaker(f"API de jugadores ({host})")
+        return breaker
+
+
+def _api_request(page, pid, label: str | None, run):
+    """(contexto, url, cortocircuito, descripción) o None si no hay que llamar a la API."""
     if pid is None:
-        return []
+        return None
     try:
         context = page.context
     except Exception:
         context = None
     if context is None:
-        return []
+        return None
 
+    config = run.config if run is not None else COMPETITIONS[DEFAULT_COMPETITION]
+    breaker = run.api_breaker if run is not None else breaker_for(config["api_base"])
     descriptor = f"ID {pid}" if label is None else f"{label} (ID {pid})"
-    url = f"{PLAYER_API_BASE}/{pid}?competition={PLAYER_API_COMPETITION}"
-    print(f"   ↳ Consultando historial vía API para {descriptor}…")
+    url = f"{config['api_base']}/{pid}?competition={config['api_competition']}"
+    if not breaker.allow():
+        return None
+    return context, url, breaker, descriptor
+
+
+def _record_api_status(breaker: CircuitBreaker, response, started: float, descriptor: str) -> bool:
     try:
-        response = context.request.get(url, timeout=10_000)
-    except Exception as exc:
-        print(f"   ↳ No se pudo acceder a la API para {descriptor}: {exc}")
-        return []
+        status = response.status
+    except Exception:
+        status = 200
+    # 404 y similares son respuestas válidas del servicio; solo los 5xx y el
+    # 429 cuentan como fallos para el cortocircuito.
+    if status >= 500 or status == 429:
+        breaker.record_failure(_elapsed_ms(started))
+    else:
+        breaker.record_success(_elapsed_ms(started))
 
     try:
         if not response.ok:
             print(
                 f"   ↳ La API devolvió un estado {response.status} para {descriptor}."
             )
-            return []
+            return False
     except Exception:
         pass
+    return True
+
 
+def _api_history_from_body(payload, text, error, descriptor: str) -> list[dict]:
     history: list[dict] = []
-    try:
-        payload = response.json()
+    if error is None:
         history.extend(parse_points_history_payload(payload))
-    except Exception as exc:
-        try:
-            text = response.text()
-        except Exception:
-            text = None
-        if text:
-            history.extend(parse_points_history_payload(text))
-        else:
-            print(
-                f"   ↳ No se pudo interpretar la respuesta de la API para {descriptor}: {exc}"
-            )
+    elif text:
+        history.extend(parse_points_history_payload(text))
+    else:
+        print(
+            f"   ↳ No se pudo interpretar la respuesta de la API para {descriptor}: {error}"
+        )
 
     normalized = dedupe_points_history(history)
     if normalized:
@@ -335,6 +1080,124 @@ def fetch_points_history_via_api(page, pid, label: str | None = None) -> list[di
     return normalized
 
 
+def fetch_points_history_via_api(page, pid, label: str | None = None, run=None) -> list[dict]:
+    request = _api_request(page, pid, label, run)
+    if request is None:
+        return []
+    context, url, breaker, descriptor = request
+    RATE_LIMITER.wait(url)
+    print(f"   ↳ Consultando historial vía API para {descriptor}…")
+    timeout_ms = breaker.timeout_ms()
+    started = time.perf_counter()
+    try:
+        response = context.request.get(url, timeout=timeout_ms)
+    except Exception as exc:
+        breaker.record_timeout(_elapsed_ms(started), timeout_ms)
+        print(f"   ↳ No se pudo acceder a la API para {descriptor}: {exc}")
+        return []
+
+    if not _record_api_status(breaker, response, started, descriptor):
+        return []
+
+    payload = text = error = None
+    try:
+        payload = response.json()
+    except Exception as exc:
+        error = exc
+        try:
+            text = response.text()
+        except Exception:
+            text = None
+    return _api_history_from_body(payload, text, error, descriptor)
+
+
+class _DetailNotOpened(Exception):
+    pass
+
+
+# Alternativa al clic: la función de la web que abre el detalle o el clic
+# desde el DOM sobre la tarjeta con ese ID.
+SHOW_PLAYER_DETAIL_SCRIPT = """
+(playerId) => {
+  const fn = window?.app?.Analytics?.showPlayerDetail
+    || window?.Analytics?.showPlayerDetail
+    || window?.showPlayerDetail;
+  if (typeof fn === 'function') {
+    try {
+      fn('laliga-fantasy', '', playerId);
+      return true;
+    } catch (err) {
+      console.warn('No se pudo ejecutar showPlayerDetail', err);
+    }
+  }
+  const card = Array.from(document.querySelectorAll('div.elemento_jugador'))
+    .find((el) => (el.getAttribute('onclick') || '').includes(String(playerId)));
+  if (card) {
+    card.click();
+    return true;
+  }
+  return false;
+}
+"""
+
+# Estado del detalle que algunas versiones de la web dejan en window.
+PLAYER_DETAIL_STATE_SCRIPT = (
+    "() => window?.app?.Analytics?.playerDetail || window?.playerDetail || window?.detalleJugador || null"
+)
+
+
+def _detail_response_matcher(pid):
+    pid_text = str(pid)
+
+    def is_detail_response(response) -> bool:
+        url = response.url
+        return f"/{pid_text}" in url or f"={pid_text}" in url
+
+    return is_detail_response
+
+
+def _trigger_player_detail(page, locator, pid) -> bool:
+    try:
+        locator.click(timeout=1500)
+        return True
+    except Exception:
+        pass
+
+    if pid is None:
+        return False
+    try:
+        return bool(page.evaluate(SHOW_PLAYER_DETAIL_SCRIPT, pid))
+    except Exception:
+        return False
+
+
+def open_player_detail(page, locator, pid) -> bool:
+    """
+    Abre el detalle del jugador y, si la web lo carga por red, espera a la
+    respuesta que contiene su ID en lugar de dormir un tiempo fijo.
+    """
+    tracker = MODAL_WAITS["detalle"]
+    if pid is None or not tracker.reliable:
+        return _trigger_player_detail(page, locator, pid)
+
+    started = time.perf_counter()
+    try:
+        with page.expect_response(_detail_response_matcher(pid), timeout=tracker.timeout()):
+            if not _trigger_player_detail(page, locator, pid):
+                raise _DetailNotOpened()
+    except _DetailNotOpened:
+        return False
+    except Exception:
+        # Abierto, pero sin petición de detalle reconocible.
+        tracker.miss()
+        # Espera nueva (no sustituye ninguna pausa fija): cuenta como coste.
+        WAIT_REPORT.record("respuesta del detalle", 0, _elapsed_ms(started))
+        return True
+    tracker.observe(_elapsed_ms(started))
+    WAIT_REPORT.record("respuesta del detalle", 0, _elapsed_ms(started))
+    return True
+
+
 def fetch_points_history_via_modal(page, locator, pid, label: str | None = None) -> list[dict]:
     if label:
         descriptor = f"{label} (ID {pid})" if pid is not None else label
@@ -348,70 +1211,41 @@ def fetch_points_history_via_modal(page, locator, pid, label: str | None = None)
     except Exception:
         pass
 
-    opened = False
-    try:
-        locator.click(timeout=1500)
-        opened = True
-    except Exception:
-        pass
-
-    if not opened and pid is not None:
-        try:
-            opened = page.evaluate(
-                """
-                (playerId) => {
-                  const fn = window?.app?.Analytics?.showPlayerDetail
-                    || window?.Analytics?.showPlayerDetail
-                    || window?.showPlayerDetail;
-                  if (typeof fn === 'function') {
-                    try {
-                      fn('laliga-fantasy', '', playerId);
-                      return true;
-                    } catch (err) {
-                      console.warn('No se pudo ejecutar showPlayerDetail', err);
-                    }
-                  }
-                  const card = Array.from(document.querySelectorAll('div.elemento_jugador'))
-                    .find((el) => (el.getAttribute('onclick') || '').includes(String(playerId)));
-                  if (card) {
-                    card.click();
-                    return true;
-                  }
-                  return false;
-                }
-                """,
-                pid,
-            )
-        except Exception:
-            opened = False
-
+    opened = open_player_detail(page, locator, pid)
     if not opened:
         print(f"   ↳ No se pudo abrir el detalle para {descriptor}.")
         return []
 
     history: list[dict] = []
+    modal = None
     try:
-        modal = page.wait_for_selector(
-            "div[id*='detalle'], div[class*='detalle'], div.modal, div[class*='player']",
-            state="visible",
-            timeout=4000,
-        )
-        page.wait_for_timeout(300)
+        started = time.perf_counter()
+        tracker = MODAL_WAITS["apertura"]
+        try:
+            modal = page.wait_for_selector(
+                MODAL_SELECTOR,
+                state="visible",
+                timeout=tracker.timeout(),
+            )
+        except Exception:
+            tracker.miss()
+            raise
+        tracker.observe(_elapsed_ms(started))
+        # Antes: 300 ms fijos para la animación; ahora esperamos a que el
+        # modal deje de moverse (dos frames con la misma caja).
+        settled = time.perf_counter()
+        with suppress(Exception):
+            modal.wait_for_element_state("stable", timeout=1000)
+        WAIT_REPORT.record("apertura del detalle", 300, _elapsed_ms(settled))
         history = collect_history_from_modal(modal)
     except Exception:
         try:
-            raw = page.evaluate(
-                "() => window?.app?.Analytics?.playerDetail || window?.playerDetail || window?.detalleJugador || null"
-            )
+            raw = page.evaluate(PLAYER_DETAIL_STATE_SCRIPT)
             history = parse_points_history_payload(raw)
         except Exception:
             history = []
     finally:
-        close_detail_modal(page)
-        try:
-            page.wait_for_timeout(150)
-        except Exception:
-            pass
+        close_detail_modal(page, modal)
 
     return dedupe_points_history(history)
 
@@ -436,6 +1270,49 @@ def compute_total_points(history: list[dict]) -> float | None:
         return None
     return float(sum(values))
 
+
+def verify_points_stats(players: list[dict]) -> int:
+    """
+    --verify-aggregates: recalcula los agregados de cada jugador con el
+    historial completo y los compara con los guardados. Corrige y devuelve
+    los que no cuadran.
+    """
+    mismatches = 0
+    for player in players:
+        history = player.get("points_history") or []
+        if not history:
+            continue
+        stored = player.get("points_stats")
+        full = update_points_stats(None, history)
+        expected = (
+            compute_average_from_history(history),
+            compute_average_from_history(history, last=POINTS_LAST_N),
+            compute_total_points(history),
+        )
+        consistent = (
+            isinstance(stored, dict)
+            and stored.get("count") == full["count"]
+            and stored.get("max_matchday") == full["max_matchday"]
+            and stored.get("last") == full["last"]
+            # El digest detecta jornadas ya cubiertas que cambiaron después.
+            and stored.get("digest") == full["digest"]
+            and all(
+                math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+                for a, b in zip(points_stats_metrics(stored), expected)
+            )
+        )
+        if not consistent:
+            mismatches += 1
+            print(f"⚠️  Agregados de puntos incoherentes para {player.get('name')} (ID {player.get('id')}); se recalculan.")
+            player["points_stats"] = full
+    checked = sum(1 for player in players if player.get("points_history"))
+    if mismatches:
+        print(f"⚠️  {mismatches}/{checked} jugadores con agregados de puntos corregidos.")
+    else:
+        print(f"✅ Agregados de puntos coherentes en {checked} jugadores.")
+    return mismatches
+
+
 def normalize_name_text(text: str | None) -> str:
     if not text:
         return ""
@@ -606,6 +1483,129 @@ def clean_name_candidate(text: str | None) -> str:
     )
 
 
+def fold_name(text: str | None) -> str:
+    """Forma de comparación: sin acentos, en minúsculas y solo letras/dígitos."""
+    base = unicodedata.normalize("NFD", normalize_name_text(text))
+    base = re.sub(r"[\u0300-\u036f]", "", base).casefold()
+    return re.sub(r"[^0-9a-zß-ÿ]+", " ", base).strip()
+
+
+def _name_grams(folded: str) -> set[str]:
+    padded = f"  {folded} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """
+    Índice difuso de nombres de jugador. Cada nombre se pliega (fold_name) y se
+    indexa por trigramas; una consulta solo puntúa los nombres que comparten
+    algún trigrama con ella, así que no recorre la lista completa.
+
+    La puntuación (0-1) es la mejor entre el coeficiente de Dice de los
+    trigramas y la coincidencia por palabras, que admite nombres parciales
+    ("yamal"), prefijos ("vini" → "vinicius") y erratas leves ("mbape").
+    """
+
+    MIN_SHARED = 0.4
+
+    def __init__(self, names=None):
+        self.keys: list = []
+        self.folded: list[str] = []
+        self.tokens: list[list[str]] = []
+        self.grams: list[set[str]] = []
+        self.postings: dict[str, list[int]] = {}
+        for key, name in names or []:
+            self.add(key, name)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key, name: str | None):
+        folded = fold_name(clean_name_candidate(name))
+        if not folded:
+            return
+        idx = len(self.keys)
+        grams = _name_grams(folded)
+        self.keys.append(key)
+        self.folded.append(folded)
+        self.tokens.append(folded.split())
+        self.grams.append(grams)
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(idx)
+
+    @staticmethod
+    def _token_similarity(token: str, candidate: str) -> float:
+        if token == candidate or (len(token) >= 3 and candidate.startswith(token)):
+            return 1.0
+        token_grams = _name_grams(token)
+        candidate_grams = _name_grams(candidate)
+        dice = 2 * len(token_grams & candidate_grams) / (len(token_grams) + len(candidate_grams))
+        return dice if dice >= 0.5 else 0.0
+
+    @classmethod
+    def _token_score(cls, query_tokens: list[str], name_tokens: list[str]) -> float:
+        if not query_tokens or not name_tokens:
+            return 0.0
+        total = 0.0
+        matched = 0
+        for token in query_tokens:
+            similarity = max(cls._token_similarity(token, candidate) for candidate in name_tokens)
+            if similarity:
+                total += similarity
+                matched += 1
+        if not matched:
+            return 0.0
+        coverage = matched / len(name_tokens)
+        return (total / len(query_tokens)) * (0.85 + 0.15 * min(1.0, coverage))
+
+    def search(self, query: str | None, limit: int = 5, threshold: float = 0.0) -> list[tuple]:
+        folded = fold_name(clean_name_candidate(query))
+        if not folded:
+            return []
+        query_grams = _name_grams(folded)
+        query_tokens = folded.split()
+        # Filtro por prefijo: un candidato útil comparte al menos MIN_SHARED de
+        # los trigramas de la consulta, así que basta con recorrer las listas de
+        # los trigramas más raros (los comunes como "  a" no aportan).
+        ordered = sorted(query_grams, key=lambda gram: len(self.postings.get(gram, ())))
+        min_common = max(1, math.ceil(len(ordered) * self.MIN_SHARED))
+        candidates: set[int] = set()
+        for gram in ordered[: len(ordered) - min_common + 1]:
+            candidates.update(self.postings.get(gram, ()))
+
+        ranked = []
+        for idx in candidates:
+            if self.folded[idx] == folded:
+                score = 1.0
+            else:
+                common = len(query_grams & self.grams[idx])
+                if common < min_common:
+                    continue
+                dice = 2 * common / (len(query_grams) + len(self.grams[idx]))
+                score = max(dice, self._token_score(query_tokens, self.tokens[idx]))
+            if score >= threshold:
+                ranked.append((score, idx))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [(self.keys[idx], score, self.folded[idx]) for score, idx in ranked[:limit]]
+
+    def best(self, query: str | None, threshold: float, margin: float = 0.0):
+        """Clave del mejor candidato si supera el umbral y se distingue del segundo."""
+        matches = self.search(query, limit=2)
+        if not matches or matches[0][1] < threshold:
+            return None
+        if len(matches) > 1 and matches[0][1] - matches[1][1] < margin:
+            return None
+        return matches[0][0]
+
+
+# Confianza mínima para --player-name y, más estricta, para fusionar por
+# nombre un registro sin ID coincidente en market.json.
+NAME_TARGET_THRESHOLD = 0.7
+NAME_TARGET_MARGIN = 0.02
+NAME_MERGE_THRESHOLD = 0.92
+NAME_MERGE_MARGIN = 0.05
+
+
 def load_existing_market_payload(path: str = "market.json") -> dict | None:
     try:
         with open(path, "r", encoding="utf-8") as fh:
@@ -617,6 +1617,15 @@ def load_existing_market_payload(path: str = "market.json") -> dict | None:
         return None
 
 
+def write_market_payload(payload: dict, path: str = "market.json"):
+    # Fichero temporal + os.replace: quien lea market.json (el servidor, el
+    # frontend) ve la versión anterior o la nueva completa, nunca una a medias.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
 def _build_player_indexes(players: list[dict]) -> tuple[dict, dict]:
     by_id: dict = {}
     by_name: dict = {}
@@ -636,12 +1645,22 @@ def _build_player_indexes(players: list[dict]) -> tuple[dict, dict]:
     return by_id, by_name
 
 
+def _other_player(existing: dict, entry: dict) -> bool:
+    """Ambos registros tienen ID y no coincide: el nombre no basta para fusionarlos."""
+    existing_id = str(existing.get("id") if existing.get("id") is not None else "").strip()
+    entry_id = str(entry.get("id") if entry.get("id") is not None else "").strip()
+    return bool(existing_id and entry_id and existing_id != entry_id)
+
+
 def merge_player_payload(existing_players: list[dict] | None, updates: list[dict] | None) -> tuple[list[dict], int]:
     base = list(existing_players or [])
     if not updates:
         return base, 0
 
     by_id, by_name = _build_player_indexes(base)
+    # El índice difuso solo se construye si alguna actualización no encaja
+    # por ID ni por nombre exacto.
+    name_index: NameIndex | None = None
     updated = 0
 
     for entry in updates:
@@ -664,6 +1683,34 @@ def merge_player_payload(existing_players: list[dict] | None, updates: list[dict
             name_key = clean_name_candidate(entry.get("name"))
             if name_key:
                 idx = by_name.get(name_key.casefold())
+            if idx is not None and _other_player(base[idx], entry):
+                idx = None
+
+        if idx is None and entry.get("name"):
+            if name_index is None:
+                name_index = NameIndex(
+                    (i, player.get("name"))
+                    for i, player in enumerate(base)
+                    if isinstance(player, dict)
+                )
+            candidate = name_index.best(
+                entry.get("name"), NAME_MERGE_THRESHOLD, NAME_MERGE_MARGIN
+            )
+            team_id = str(entry.get("team_id") or "").strip()
+            # Solo variantes del mismo nombre (acentos, orden, puntuación):
+            # "carlos martin" puntúa alto frente a "juan carlos martin".
+            if candidate is not None and (
+                sorted(fold_name(clean_name_candidate(entry.get("name"))).split())
+                != sorted(fold_name(clean_name_candidate(base[candidate].get("name"))).split())
+                or _other_player(base[candidate], entry)
+            ):
+                candidate = None
+            if candidate is not None and (
+                not team_id
+                or not str(base[candidate].get("team_id") or "").strip()
+                or str(base[candidate].get("team_id")).strip() == team_id
+            ):
+                idx = candidate
 
         if idx is not None:
             merged = dict(base[idx])
@@ -672,6 +1719,8 @@ def merge_player_payload(existing_players: list[dict] | None, updates: list[dict
         else:
             base.append(entry)
             idx = len(base) - 1
+            if name_index is not None:
+                name_index.add(idx, entry.get("name"))
 
         if pid_str:
             by_id[pid_str] = idx
@@ -685,86 +1734,922 @@ def merge_player_payload(existing_players: list[dict] | None, updates: list[dict
     return base, updated
 
 
-def extract_points_history(page, locator, pid, label: str | None = None) -> list[dict]:
-    history: list[dict] = []
-    try:
-        attr_names = locator.evaluate("el => el.getAttributeNames()") or []
-    except Exception:
-        attr_names = []
-
-    for name in attr_names:
-        if not name or not name.startswith("data-"):
-            continue
-        lowered = name.lower()
-        if not any(keyword in lowered for keyword in ["punto", "point", "jorn", "match", "score"]):
-            continue
-        try:
-            value = locator.get_attribute(name)
-        except Exception:
-            value = None
-        if not value:
-            continue
-        history.extend(parse_points_history_payload(value))
+# A partir de este tamaño las actualizaciones puntuales (--player-id /
+# --player-name) fusionan market.json en streaming en lugar de cargarlo entero.
+STREAMING_MERGE_MIN_BYTES = 64 * 1024 * 1024
 
-    for payload in gather_datasets(locator):
-        history.extend(parse_points_history_payload(payload))
 
-    attr_history = dedupe_points_history(history)
-    fallback_history = attr_history or []
+class MarketStreamReader:
+    """
+    Lector incremental de market.json: recorre el objeto de primer nivel por
+    trozos y genera (clave, valor); los elementos de "players" salen de uno en
+    uno como ("players", jugador), sin tener nunca la lista completa en memoria.
+    """
 
-    if attr_history:
-        if not FETCH_POINTS_HISTORY:
-            return attr_history
-        max_matchday = 0
+    def __init__(self, fh, chunk_size: int = 1 << 16):
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        chunk = self.fh.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Se esperaba {char!r} y se encontró {repr(found) if found else 'fin de fichero'}")
+        self.pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                value, end = None, None
+            # Un número al final del trozo puede estar cortado: solo se acepta
+            # si detrás queda algo más o ya no hay más fichero.
+            if end is not None and (end < len(self.buf) or self.eof):
+                self.pos = end
+                return value
+            if not self._fill():
+                if end is None:
+                    self.decoder.raw_decode(self.buf, self.pos)
+                self.pos = end
+                return value
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise ValueError("Clave de primer nivel no válida en market.json")
+            self._expect(":")
+            if key == "players" and self._peek() == "[":
+                self.pos += 1
+                if self._peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self._value()
+                        if self._peek() == ",":
+                            self.pos += 1
+                            continue
+                        self._expect("]")
+                        break
+            else:
+                yield key, self._value()
+            if self._peek() == ",":
+                self.pos += 1
+                continue
+            self._expect("}")
+            return
+
+
+def _player_keys(entry: dict) -> tuple[list, str | None]:
+    ids = []
+    pid = entry.get("id")
+    pid_str = str(pid).strip() if pid is not None else ""
+    if pid_str:
+        ids.append(pid_str)
+        with suppress(Exception):
+            ids.append(int(pid_str))
+    name_key = clean_name_candidate(entry.get("name"))
+    return ids, name_key.casefold() if name_key else None
+
+
+def _dump_indented(value, level: int) -> str:
+    # Mismo formato que json.dump(..., indent=2) para un valor anidado.
+    return json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n" + "  " * level)
+
+
+def stream_merge_market_payload(
+    updates: list[dict] | None,
+    overrides: dict,
+    path: str = "market.json",
+    on_player=None,
+) -> tuple[dict, int, int]:
+    """
+    Fusiona ``updates`` en ``path`` sin cargarlo: una primera pasada localiza
+    por ID o nombre exacto la fila que sustituye cada actualización y la
+    segunda copia el fichero registro a registro a un temporal, aplicando las
+    sustituciones y añadiendo al final las que no encajan. ``overrides``
+    reemplaza claves de primer nivel; ``count`` se escribe al final.
+    Devuelve (claves de primer nivel, jugadores, actualizados).
+    """
+    updates = [entry for entry in updates or [] if isinstance(entry, dict)]
+    update_keys = [_player_keys(entry) for entry in updates]
+    wanted_ids = {pid for ids, _ in update_keys for pid in ids}
+    wanted_names = {name for _, name in update_keys if name}
+
+    # Primera pasada: última fila con cada ID o nombre buscado, como hace
+    # _build_player_indexes sobre la lista completa.
+    id_rows: dict = {}
+    # Por nombre: (fila, IDs de esa fila) para no fusionar jugadores con otro ID.
+    name_rows: dict = {}
+    with open(path, "r", encoding="utf-8") as fh:
+        row = 0
+        for key, entry in MarketStreamReader(fh):
+            if key != "players":
+                continue
+            if isinstance(entry, dict):
+                ids, name_key = _player_keys(entry)
+                for pid in ids:
+                    if pid in wanted_ids:
+                        id_rows[pid] = row
+                if name_key in wanted_names:
+                    name_rows[name_key] = (row, ids)
+            row += 1
+    total_rows = row
+
+    replacements: dict[int, list[dict]] = {}
+    appended: list[list[dict]] = []
+    for entry, (ids, name_key) in zip(updates, update_keys):
+        target = next((id_rows[pid] for pid in ids if pid in id_rows), None)
+        if target is None and name_key in name_rows:
+            row, row_ids = name_rows[name_key]
+            if not (ids and row_ids and not set(ids) & set(row_ids)):
+                target = row
+        if target is None:
+            target = total_rows + len(appended)
+            appended.append([])
+        if target >= total_rows:
+            appended[target - total_rows].append(entry)
+        else:
+            replacements.setdefault(target, []).append(entry)
+        # Las siguientes actualizaciones del mismo jugador caen en la misma fila.
+        for pid in ids:
+            id_rows[pid] = target
+        if name_key:
+            name_rows[name_key] = (target, ids or name_rows.get(name_key, (None, []))[1])
+
+    meta: dict = {}
+    written_meta: set = set()
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with open(path, "r", encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as out:
+        out.write("{")
+        first_key = True
+
+        def write_key(key, value):
+            nonlocal first_key
+            out.write(("\n" if first_key else ",\n") + f"  {json.dumps(key, ensure_ascii=False)}: ")
+            first_key = False
+            out.write(_dump_indented(value, 1))
+
+        def write_player(entry):
+            nonlocal count
+            out.write(("\n    " if count == 0 else ",\n    ") + _dump_indented(entry, 2))
+            count += 1
+            if on_player is not None:
+                on_player(entry)
+
+        def close_players():
+            if "players" in written_meta:
+                return
+            nonlocal first_key
+            if "players" not in meta:
+                out.write(("\n" if first_key else ",\n") + '  "players": [')
+                first_key = False
+                meta["players"] = None
+            for group in appended:
+                merged = {}
+                for entry in group:
+                    merged.update(entry)
+                write_player(merged)
+            out.write("\n  ]" if count else "]")
+            written_meta.add("players")
+
+        row = 0
+        in_players = False
+        for key, value in MarketStreamReader(src):
+            if key == "players":
+                if not in_players:
+                    in_players = True
+                    out.write(("\n" if first_key else ",\n") + '  "players": [')
+                    first_key = False
+                    meta["players"] = None
+                if isinstance(value, dict) and row in replacements:
+                    value = dict(value)
+                    for entry in replacements[row]:
+                        value.update(entry)
+                write_player(value)
+                row += 1
+                continue
+            if in_players:
+                close_players()
+                in_players = False
+            if key == "count":
+                continue
+            value = overrides.get(key, value)
+            meta[key] = value
+            write_key(key, value)
+            written_meta.add(key)
+        close_players()
+        for key, value in overrides.items():
+            if key not in written_meta and key not in ("players", "count"):
+                meta[key] = value
+                write_key(key, value)
+        meta.pop("players", None)
+        meta["count"] = count
+        write_key("count", count)
+        out.write("\n}")
+    os.replace(tmp_path, path)
+    updated = sum(len(group) for group in replacements.values()) + sum(len(g) for g in appended)
+    return meta, count, updated
+
+
+def read_attribute_history(page, locator, pid, label: str | None = None) -> list[dict]:
+    # Atributos data-* de la tarjeta con historial serializado (data-puntos="J1: 6, …")
+    # y datasets de sus descendientes, en una única llamada al navegador.
+    return history_from_payloads(collect_history_payloads(locator, include_root_values=True))
+
+
+def history_from_payloads(payloads: dict) -> list[dict]:
+    history: list[dict] = []
+    for value in payloads.get("values") or []:
+        history.extend(parse_points_history_payload(value))
+    for payload in payloads.get("entries") or []:
+        history.extend(parse_points_history_payload(payload))
+    return dedupe_points_history(history)
+
+
+HISTORY_SOURCES_PATH = "history_sources.json"
+
+
+class HistorySource:
+    """
+    Fuente de historial de puntos con sus estadísticas acumuladas. Las fuentes
+    locales se consultan siempre y en orden; las remotas se ordenan por coste
+    esperado (latencia media / tasa de éxito).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fetch,
+        *,
+        local: bool = False,
+        prior_ms: float = 1000.0,
+        available=None,
+    ):
+        self.name = name
+        self.fetch = fetch
+        self.local = local
+        self.prior_ms = prior_ms
+        self.available = available
+        self.unavailable = 0
+        self.attempts = 0.0
+        self.successes = 0.0
+        self.total_ms = 0.0
+        self.run_attempts = 0
+        self.run_successes = 0
+        self.run_ms = 0.0
+        self.skipped = 0
+
+    def success_rate(self) -> float:
+        # Suavizado de Laplace para no descartar una fuente por un único fallo.
+        return (self.successes + 1) / (self.attempts + 2)
+
+    def mean_ms(self) -> float:
+        return self.total_ms / self.attempts if self.attempts else self.prior_ms
+
+    def expected_cost(self) -> float:
+        return self.mean_ms() / self.success_rate()
+
+    def record(self, success: bool, elapsed_ms: float):
+        self.attempts += 1
+        self.total_ms += elapsed_ms
+        self.run_attempts += 1
+        self.run_ms += elapsed_ms
+        if success:
+            self.successes += 1
+            self.run_successes += 1
+
+
+class HistorySourcePipeline:
+    # Por debajo de esta tasa de éxito (con muestras suficientes) la fuente se
+    # omite, salvo una sonda periódica para detectar que se ha recuperado.
+    SKIP_MIN_ATTEMPTS = 20
+    SKIP_SUCCESS_RATE = 0.05
+    PROBE_EVERY = 25
+
+    def __init__(self, sources: list[HistorySource]):
+        self.sources = {source.name: source for source in sources}
+        self.orders: dict[str, int] = {}
+        self.runs = 0
+
+    def call(self, source: HistorySource, page, locator, pid, label: str | None = None) -> list[dict]:
+        started = time.perf_counter()
         try:
-            max_matchday = max(
-                int(float(entry.get("matchday", 0)))
-                if isinstance(entry, dict)
-                else 0
-                for entry in attr_history
-            )
-        except Exception:
-            max_matchday = 0
-        if len(attr_history) > 1 or max_matchday > 1:
-            return attr_history
-    else:
-        if not FETCH_POINTS_HISTORY:
+            history = source.fetch(page, locator, pid, label) or []
+        except Exception as exc:
+            print(f"   ↳ Falló la fuente '{source.name}': {exc}")
+            history = []
+        source.record(bool(history), _elapsed_ms(started))
+        return history
+
+    def should_skip(self, source: HistorySource) -> bool:
+        if source.attempts < self.SKIP_MIN_ATTEMPTS:
+            return False
+        if source.success_rate() >= self.SKIP_SUCCESS_RATE:
+            return False
+        source.skipped += 1
+        return source.skipped % self.PROBE_EVERY != 0
+
+    def remote_plan(self) -> list[HistorySource]:
+        remote = [source for source in self.sources.values() if not source.local]
+        return sorted(remote, key=lambda source: source.expected_cost())
+
+    def next_plan(self) -> list[HistorySource]:
+        """Orden de las fuentes remotas para el siguiente jugador (lo comparten los canales síncrono y asíncrono)."""
+        plan = self.remote_plan()
+        self.runs += 1
+        if len(plan) > 1 and self.runs % self.PROBE_EVERY == 0:
+            # Exploración: la fuente relegada va primero de vez en cuando para
+            # que sus estadísticas no se queden congeladas.
+            plan = plan[-1:] + plan[:-1]
+        order = " > ".join(source.name for source in plan)
+        self.orders[order] = self.orders.get(order, 0) + 1
+        return plan
+
+    def usable(self, source: HistorySource) -> bool:
+        if source.available is not None and not source.available():
+            source.unavailable += 1
+            return False
+        return not self.should_skip(source)
+
+    def run_remote(self, page, locator, pid, label: str | None = None) -> list[dict]:
+        if pid is None:
             return []
+        for source in self.next_plan():
+            if not self.usable(source):
+                continue
+            history = self.call(source, page, locator, pid, label)
+            if history:
+                return history
+        return []
 
-    api_history = fetch_points_history_via_api(page, pid, label)
-    if api_history:
-        return api_history
+    def load(self, path: str = HISTORY_SOURCES_PATH, decay: float = 0.5):
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                stored = json.load(fh)
+        except FileNotFoundError:
+            return
+        except Exception as exc:
+            print(f"⚠️  No se pudieron leer las estadísticas de {path}: {exc}")
+            return
+        # Se atenúa lo acumulado para que las ejecuciones recientes pesen más.
+        for name, values in (stored.get("sources") or {}).items():
+            source = self.sources.get(name)
+            if source is None or not isinstance(values, dict):
+                continue
+            with suppress(Exception):
+                source.attempts = float(values.get("attempts", 0)) * decay
+                source.successes = float(values.get("successes", 0)) * decay
+                source.total_ms = float(values.get("total_ms", 0)) * decay
 
-    if pid is None:
+    def save(self, path: str = HISTORY_SOURCES_PATH):
+        payload = {
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "sources": {
+                name: {
+                    "attempts": source.attempts,
+                    "successes": source.successes,
+                    "total_ms": source.total_ms,
+                }
+                for name, source in self.sources.items()
+            },
+        }
+        try:
+            with open(path, "w", encoding="utf-8") as fh:
+                json.dump(payload, fh, ensure_ascii=False, indent=2)
+        except Exception as exc:
+            print(f"⚠️  No se pudieron guardar las estadísticas en {path}: {exc}")
+
+    def print_summary(self):
+        if not any(
+            source.run_attempts or source.skipped or source.unavailable
+            for source in self.sources.values()
+        ):
+            return
+        print("📊 Fuentes de historial:")
+        for source in self.sources.values():
+            mean = source.run_ms / source.run_attempts if source.run_attempts else 0.0
+            rate = source.run_successes / source.run_attempts if source.run_attempts else 0.0
+            print(
+                f"   · {source.name}: {source.run_attempts} consultas, {rate:.0%} con datos, "
+                f"{mean:.0f} ms de media, {source.skipped} omitidas, "
+                f"{source.unavailable} no disponibles (coste esperado {source.expected_cost():.0f} ms)"
+            )
+        for order, count in sorted(self.orders.items(), key=lambda item: -item[1]):
+            print(f"   · Orden {order}: {count} jugadores")
+
+
+def build_history_pipeline(run: "CompetitionRun") -> HistorySourcePipeline:
+    return HistorySourcePipeline([
+        HistorySource("atributos", read_attribute_history, local=True, prior_ms=50),
+        HistorySource(
+            "api",
+            lambda page, locator, pid, label: fetch_points_history_via_api(page, pid, label, run),
+            prior_ms=500,
+            available=lambda: not run.api_breaker.is_open(),
+        ),
+        HistorySource("modal", fetch_points_history_via_modal, prior_ms=2500),
+    ])
+
+
+class CompetitionRun:
+    """
+    Una captura (competición + modo). Sustituye a las antiguas constantes de
+    módulo: cada hilo del planificador trabaja con la suya, con su propio
+    pipeline de historial y el cortocircuito del host de su API.
+    """
+
+    def __init__(self, slug: str, config: dict, mode: str = "market"):
+        self.slug = slug
+        self.config = config
+        self.mode = mode
+        self.fetch_points_history = mode == "points"
+        self.output = config["output"]
+        self.snapshot_output = f"{os.path.splitext(self.output)[0]}.bin"
+        self.history_sources_path = (
+            HISTORY_SOURCES_PATH
+            if slug == DEFAULT_COMPETITION
+            else f"{os.path.splitext(HISTORY_SOURCES_PATH)[0]}.{slug}.json"
+        )
+        self.api_breaker = breaker_for(config["api_base"])
+        self.pipeline = build_history_pipeline(self)
+        RATE_LIMITER.configure(config["url"], config.get("rate_limit"))
+        RATE_LIMITER.configure(config["api_base"], config.get("rate_limit"))
+
+    def __repr__(self) -> str:
+        return f"{self.slug}/{self.mode}"
+
+
+def load_competitions(path: str | None = None) -> dict[str, dict]:
+    competitions = {slug: dict(config) for slug, config in COMPETITIONS.items()}
+    if not path:
+        return competitions
+    with open(path, "r", encoding="utf-8") as fh:
+        stored = json.load(fh)
+    if not isinstance(stored, dict):
+        raise ValueError(f"{path} debe contener un objeto {{slug: configuración}}")
+    for slug, config in stored.items():
+        if not isinstance(config, dict):
+            raise ValueError(f"Configuración no válida para '{slug}' en {path}")
+        merged = dict(competitions.get(slug, {}))
+        merged.update(config)
+        merged.setdefault("output", f"market.{slug}.json")
+        missing = [key for key in ("url", "api_base", "api_competition") if not merged.get(key)]
+        if missing:
+            raise ValueError(f"Faltan {', '.join(missing)} en la competición '{slug}' de {path}")
+        competitions[slug] = merged
+    return competitions
+
+
+def needs_remote_history(attr_history: list[dict], fetch_points_history: bool) -> bool:
+    """El historial de la tarjeta basta en modo mercado o si tiene más de una jornada."""
+    if not fetch_points_history:
+        return False
+    if not attr_history:
+        return True
+    max_matchday = 0
+    try:
+        max_matchday = max(
+            int(float(entry.get("matchday", 0)))
+            if isinstance(entry, dict)
+            else 0
+            for entry in attr_history
+        )
+    except Exception:
+        max_matchday = 0
+    return not (len(attr_history) > 1 or max_matchday > 1)
+
+
+def extract_points_history(page, locator, pid, label: str | None, run: CompetitionRun) -> list[dict]:
+    pipeline = run.pipeline
+    attr_history = pipeline.call(
+        pipeline.sources["atributos"], page, locator, pid, label
+    )
+    fallback_history = attr_history or []
+
+    if not needs_remote_history(attr_history, run.fetch_points_history):
         return fallback_history
 
-    detail_history = fetch_points_history_via_modal(page, locator, pid, label)
-    if detail_history:
-        return detail_history
+    remote_history = pipeline.run_remote(page, locator, pid, label)
+    if remote_history:
+        return remote_history
 
     return fallback_history
 
 
+COOKIE_SELECTORS = [
+    "button:has-text('Aceptar')",
+    "button:has-text('Acepto')",
+    "button:has-text('De acuerdo')",
+    "button:has-text('Agree')",
+    "div[role='dialog'] button:has-text('Aceptar')",
+]
+
+
 def maybe_accept_cookies(page):
-    sels = [
-        "button:has-text('Aceptar')",
-        "button:has-text('Acepto')",
-        "button:has-text('De acuerdo')",
-        "button:has-text('Agree')",
-        "div[role='dialog'] button:has-text('Aceptar')",
-    ]
-    for sel in sels:
+    for sel in COOKIE_SELECTORS:
         try:
             btn = page.locator(sel).first
             if btn.is_visible():
                 print("→ Aceptando cookies…")
                 btn.click(timeout=1000)
-                page.wait_for_timeout(400)
+                started = time.perf_counter()
+                with suppress(Exception):
+                    btn.wait_for(state="hidden", timeout=2000)
+                WAIT_REPORT.record("aviso de cookies", 400, _elapsed_ms(started))
                 break
         except:
             pass
 
-def extract_all(page, target_ids: list[int] | None = None, target_names: list[str] | None = None):
+CARD_SNAPSHOT_SCRIPT = """
+(el) => {
+  const attrs = {};
+  for (const name of el.getAttributeNames()) {
+    attrs[name] = el.getAttribute(name);
+  }
+  const text = (selector) => {
+    const node = el.querySelector(selector);
+    return node ? node.innerText : "";
+  };
+  return { attrs, name: text(".datos-nombre"), team: text(".equipo span") };
+}
+"""
+
+
+def read_card_snapshots(cards) -> list[dict]:
+    # Una sola llamada al navegador para todas las tarjetas en lugar de un
+    # get_attribute por atributo y jugador.
+    try:
+        return cards.evaluate_all(f"(cards) => cards.map({CARD_SNAPSHOT_SCRIPT})") or []
+    except Exception as exc:
+        print(f"⚠️  No se pudieron leer las tarjetas en bloque: {exc}")
+        return []
+
+
+def read_card_snapshot(locator) -> dict:
+    try:
+        return locator.evaluate(CARD_SNAPSHOT_SCRIPT) or {}
+    except Exception:
+        return {}
+
+
+class MarketCardParser(HTMLParser):
+    """
+    Extrae de una página de mercado guardada las mismas lecturas crudas que
+    CARD_SNAPSHOT_SCRIPT obtiene en el navegador: atributos de cada
+    div.elemento_jugador, texto de .datos-nombre y del primer .equipo span.
+    """
+
+    VOID_TAGS = {
+        "area", "base", "br", "col", "embed", "hr", "img",
+        "input", "link", "meta", "source", "track", "wbr",
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.cards: list[dict] = []
+        self._stack: list[tuple[str, set[str]]] = []
+        self._card: dict | None = None
+        self._team_done = False
+
+    def _active(self, flag: str) -> bool:
+        return any(flag in flags for _, flags in self._stack)
+
+    def handle_starttag(self, tag, attrs):
+        attr_map = {name: value if value is not None else "" for name, value in attrs}
+        classes = attr_map.get("class", "").split()
+        flags: set[str] = set()
+        if self._card is None:
+            if tag == "div" and "elemento_jugador" in classes:
+                self._card = {"attrs": attr_map, "name": "", "team": ""}
+                self._team_done = False
+                flags.add("card")
+        else:
+            if "datos-nombre" in classes:
+                flags.add("name")
+            if "equipo" in classes:
+                flags.add("equipo")
+            if tag == "span" and not self._team_done and self._active("equipo"):
+                flags.add("team")
+        if tag not in self.VOID_TAGS:
+            self._stack.append((tag, flags))
+
+    def handle_endtag(self, tag):
+        if not any(open_tag == tag for open_tag, _ in self._stack):
+            return
+        while self._stack:
+            open_tag, flags = self._stack.pop()
+            if "team" in flags:
+                self._team_done = True
+            if "card" in flags and self._card is not None:
+                self.cards.append(self._card)
+                self._card = None
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self._card is None:
+            return
+        if self._active("name"):
+            self._card["name"] += data
+        if self._active("team"):
+            self._card["team"] += data
+
+
+def parse_market_html(html: str) -> list[dict]:
+    parser = MarketCardParser()
+    parser.feed(html)
+    parser.close()
+    return parser.cards
+
+
+def card_fingerprint(snapshot: dict, mode: str) -> str:
+    """
+    Huella de la tarjeta: atributos data-* (más el onclick con el ID), nombre y
+    equipo visibles y el modo de captura. Si no cambia entre ejecuciones, el
+    registro previo de market.json sigue siendo válido.
+    """
+    attrs = snapshot.get("attrs") or {}
+    material = {
+        "mode": mode,
+        "attrs": {
+            key: value
+            for key, value in attrs.items()
+            if key.startswith("data-") or key == "onclick"
+        },
+        "name": normalize_name_text(snapshot.get("name")),
+        "team": normalize_name_text(snapshot.get("team")),
+    }
+    raw = json.dumps(material, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _index_previous_players(players: list[dict] | None) -> dict[int, dict]:
+    by_id: dict[int, dict] = {}
+    for entry in players or []:
+        if not isinstance(entry, dict) or not entry.get("fingerprint"):
+            continue
+        try:
+            by_id[int(entry.get("id"))] = entry
+        except Exception:
+            continue
+    return by_id
+
+
+def _index_previous_stats(players: list[dict] | None) -> dict[int, dict]:
+    """Agregados de puntos del market.json previo, aunque la tarjeta haya cambiado."""
+    by_id: dict[int, dict] = {}
+    for entry in players or []:
+        if not isinstance(entry, dict) or not isinstance(entry.get("points_stats"), dict):
+            continue
+        with suppress(Exception):
+            by_id[int(entry.get("id"))] = entry["points_stats"]
+    return by_id
+
+
+def card_player_id(attrs: dict) -> int | None:
+    # ID del jugador si viene en el onclick: app.Analytics.showPlayerDetail('laliga-fantasy','',8405);
+    onclick = attrs.get("onclick") or ""
+    m = re.search(r",\s*([0-9]+)\s*\)\s*;", onclick)
+    return int(m.group(1)) if m else None
+
+
+def resolve_card_name(snapshot: dict, warn: bool = True) -> str:
+    attrs = snapshot.get("attrs") or {}
+    # Nombre visible (puede venir duplicado visualmente):
+    # Cogemos TODO el bloque del nombre para evitar dobles fuentes internas
+    raw_name_visible = snapshot.get("name") or ""
+    raw_name_attr = attrs.get("data-nombre") or attrs.get("data-name")
+    clean_visible = clean_name_candidate(raw_name_visible)
+    clean_attr = clean_name_candidate(raw_name_attr)
+    clean_name = clean_attr or clean_visible
+    if not clean_name:
+        clean_name = clean_visible or clean_attr
+    if not warn:
+        return clean_name
+    if clean_attr and clean_visible and clean_attr.lower() != clean_visible.lower():
+        print(
+            "⚠️  data-nombre distinto del texto visible:",
+            f"'{clean_attr}' vs '{clean_visible}'",
+        )
+    if re.search(r"(\b\w+\b)\s+\1", clean_name or "", flags=re.IGNORECASE):
+        print("⚠️  Posible repetición en nombre normalizado:", clean_name)
+    return clean_name
+
+
+def build_player_record(snapshot: dict, name: str | None = None, warn: bool = True) -> dict:
+    """
+    Transforma la lectura cruda de una tarjeta ({"attrs", "name", "team"}) en
+    el registro de market.json, sin historial de puntos. No depende del
+    navegador, así que sirve igual para la página en vivo que para archivos.
+    """
+    attrs = snapshot.get("attrs") or {}
+
+    def ga(name):
+        return attrs.get(name)
+
+    def grab_first(*names):
+        for name in names:
+            value = ga(name)
+            if value:
+                return value
+        return None
+
+    if name is None:
+        name = resolve_card_name(snapshot, warn=warn)
+
+    # Equipo visible
+    team_vis = (snapshot.get("team") or "").strip()
+
+    data = {
+        "id": card_player_id(attrs),
+        "name": name,
+        "team_id": (ga("data-equipo") or "").strip(),
+        "team": team_vis,
+        "position": (ga("data-posicion") or "").strip(),
+        "value": to_int(ga("data-valor")),
+    }
+
+    avg_points_attr = grab_first(
+        "data-media",
+        "data-media-total",
+        "data-media_jornada",
+        "data-mediajornada",
+        "data-mediajornadas",
+        "data-media-puntos",
+        "data-promedio",
+        "data-puntos",
+    )
+    recent_points_attr = grab_first(
+        "data-media5",
+        "data-media-5",
+        "data-media5partidos",
+        "data-media5p",
+        "data-media_reciente",
+        "data-media-reciente",
+        "data-mediaultimos5",
+        "data-media-ultimos5",
+        "data-ultimos5",
+        "data-ult5",
+        "data-puntos5",
+    )
+    total_points_attr = grab_first(
+        "data-puntos-total",
+        "data-puntos_total",
+        "data-puntos-totales",
+        "data-puntos_totales",
+        "data-total-puntos",
+        "data-total_puntos",
+        "data-totalpuntos",
+        "data-puntos-temporada",
+        "data-puntos-season",
+        "data-puntos_temporada",
+    )
+
+    data["points_avg"] = to_float(avg_points_attr)
+    data["points_last5"] = to_float(recent_points_attr)
+    data["points_total"] = to_float(total_points_attr)
+    data["points_history"] = []
+
+    # Añadir históricos y variaciones
+    for k in [1, 2, 3, 7, 14, 30]:
+        data[f"value_{k}"] = to_int(ga(f"data-valor{k}"))
+        data[f"diff_{k}"] = to_int(ga(f"data-diferencia{k}"))
+        pct_raw = ga(f"data-diferencia-pct{k}") or "0"
+        try:
+            data[f"diff_pct_{k}"] = float(pct_raw.replace(",", "."))
+        except:
+            data[f"diff_pct_{k}"] = 0.0
+
+    return data
+
+
+def apply_points_history(data: dict, history: list[dict], previous_stats: dict | None = None) -> dict:
+    data["points_history"] = history
+    if not history:
+        data.pop("points_stats", None)
+        return data
+
+    stats = update_points_stats(previous_stats, history)
+    data["points_stats"] = stats
+    avg_from_history, recent_from_history, total_from_history = points_stats_metrics(stats)
+
+    if data.get("points_avg") is None and avg_from_history is not None:
+        data["points_avg"] = avg_from_history
+
+    if data.get("points_last5") is None and recent_from_history is not None:
+        data["points_last5"] = recent_from_history
+
+    if data.get("points_total") is None and total_from_history is not None:
+        data["points_total"] = total_from_history
+
+    return data
+
+
+def parse_attribute_history(attrs: dict) -> list[dict]:
+    """Historial serializado en los atributos data-* de la propia tarjeta."""
+    history: list[dict] = []
+    for name, value in (attrs or {}).items():
+        if not value or not name.startswith("data-"):
+            continue
+        if not any(keyword in name.lower() for keyword in ["punto", "point", "jorn", "match", "score"]):
+            continue
+        history.extend(parse_points_history_payload(value))
+    return dedupe_points_history(history)
+
+
+def renormalize_player_record(entry: dict) -> dict:
+    """Vuelve a pasar un registro ya guardado por la normalización actual."""
+    data = dict(entry)
+    data["name"] = clean_name_candidate(entry.get("name"))
+    with suppress(Exception):
+        if entry.get("id") is not None:
+            data["id"] = int(entry.get("id"))
+    data["team_id"] = str(entry.get("team_id") or "").strip()
+    data["team"] = normalize_name_text(entry.get("team"))
+    data["position"] = str(entry.get("position") or "").strip()
+    data["value"] = to_int(entry.get("value"))
+    for key in ["points_avg", "points_last5", "points_total"]:
+        data[key] = parse_points_value(entry.get(key))
+    for k in [1, 2, 3, 7, 14, 30]:
+        data[f"value_{k}"] = to_int(entry.get(f"value_{k}"))
+        data[f"diff_{k}"] = to_int(entry.get(f"diff_{k}"))
+        data[f"diff_pct_{k}"] = parse_points_value(entry.get(f"diff_pct_{k}")) or 0.0
+    return apply_points_history(
+        data, parse_points_history_payload(entry.get("points_history")), entry.get("points_stats")
+    )
+
+
+def resolve_target_names(snapshots: list[dict], target_names: list[str] | None) -> dict[int, set[str]]:
+    """
+    Asigna cada --player-name a la tarjeta más parecida (índice de la tarjeta →
+    claves normalizadas de los objetivos que resuelven a ella) usando un
+    NameIndex construido una vez.
+    """
+    if not snapshots or not target_names:
+        return {}
+    index = NameIndex(
+        (i, resolve_card_name(snapshot, warn=False)) for i, snapshot in enumerate(snapshots)
+    )
+    matches: dict[int, str] = {}
+    for raw in target_names:
+        key = clean_name_candidate(raw)
+        if not key:
+            continue
+        candidates = index.search(raw, limit=3)
+        ambiguous = (
+            len(candidates) > 1
+            and candidates[0][1] < 1.0
+            and candidates[0][1] - candidates[1][1] < NAME_TARGET_MARGIN
+        )
+        if candidates and candidates[0][1] >= NAME_TARGET_THRESHOLD and not ambiguous:
+            card_idx, score, folded = candidates[0]
+            matches.setdefault(card_idx, set()).add(key.casefold())
+            if score < 1.0:
+                print(f"🔎 '{raw}' → '{folded}' (confianza {score:.2f})")
+        elif candidates:
+            suggestions = ", ".join(f"'{folded}' ({score:.2f})" for _, score, folded in candidates)
+            print(f"⚠️  Sin coincidencia fiable para '{raw}'. Candidatos: {suggestions}")
+        else:
+            print(f"⚠️  Ningún jugador se parece a '{raw}'.")
+    return matches
+
+
+def extract_all(
+    page,
+    run: CompetitionRun,
+    target_ids: list[int] | None = None,
+    target_names: list[str] | None = None,
+    previous_players: list[dict] | None = None,
+):
     # Lee TODOS los jugadores del contenedor (aunque algunos estén ocultos por paginación client-side)
     page.wait_for_selector("div.lista_elementos div.elemento_jugador", timeout=90_000)
     cards = page.locator("div.lista_elementos div.elemento_jugador")
@@ -773,6 +2658,15 @@ def extract_all(page, target_ids: list[int] | None = None, target_names: list[st
 
     players = []
     history_cache: dict[int, list[dict]] = {}
+    mode = run.mode
+    previous_by_id = _index_previous_players(previous_players)
+    previous_stats = _index_previous_stats(previous_players)
+    reused = 0
+
+    snapshots = read_card_snapshots(cards)
+    if len(snapshots) != n:
+        snapshots = []
+    MEMORY_REPORT.checkpoint("extracción", f"{run.slug}, {n} tarjetas leídas")
 
     target_id_set: set[int] = set()
     if target_ids:
@@ -799,13 +2693,21 @@ def extract_all(page, target_ids: list[int] | None = None, target_names: list[st
     filtering = bool(target_id_set or target_name_keys)
     remaining_ids = set(target_id_set)
     remaining_names = set(target_name_keys)
+    name_matches = resolve_target_names(snapshots, target_names) if target_name_keys else {}
     for i in range(n):
         el = cards.nth(i)
+        snapshot = snapshots[i] if snapshots else read_card_snapshot(el)
+        attrs = snapshot.get("attrs") or {}
 
-        # ID del jugador si viene en el onclick: app.Analytics.showPlayerDetail('laliga-fantasy','',8405);
-        onclick = el.get_attribute("onclick") or ""
-        m = re.search(r",\s*([0-9]+)\s*\)\s*;", onclick)
-        pid = int(m.group(1)) if m else None
+        pid = card_player_id(attrs)
+
+        fingerprint = card_fingerprint(snapshot, mode)
+        previous = previous_by_id.get(pid) if pid is not None else None
+        if previous is not None and (
+            previous.get("fingerprint") != fingerprint
+            or (run.fetch_points_history and not previous.get("points_history"))
+        ):
+            previous = None
 
         matches_filter = True
         matched_by_id = False
@@ -817,38 +2719,10 @@ def extract_all(page, target_ids: list[int] | None = None, target_names: list[st
                 matches_filter = True
                 matched_by_id = True
 
-        def ga(name):
-            try:
-                return el.get_attribute(name)
-            except:
-                return None
-
-        def grab_first(*names):
-            for name in names:
-                value = ga(name)
-                if value:
-                    return value
-            return None
-
-        # Nombre visible (puede venir duplicado visualmente):
-        try:
-            # Cogemos TODO el bloque del nombre para evitar dobles fuentes internas
-            raw_name_visible = el.locator(".datos-nombre").inner_text()
-        except:
-            raw_name_visible = ""
-        raw_name_attr = ga("data-nombre") or ga("data-name")
-        clean_visible = clean_name_candidate(raw_name_visible)
-        clean_attr = clean_name_candidate(raw_name_attr)
-        clean_name = clean_attr or clean_visible
-        if not clean_name:
-            clean_name = clean_visible or clean_attr
-        if clean_attr and clean_visible and clean_attr.lower() != clean_visible.lower():
-            print(
-                "⚠️  data-nombre distinto del texto visible:",
-                f"'{clean_attr}' vs '{clean_visible}'",
-            )
-        if re.search(r"(\b\w+\b)\s+\1", clean_name or "", flags=re.IGNORECASE):
-            print("⚠️  Posible repetición en nombre normalizado:", clean_name)
+        if previous is not None:
+            clean_name = previous.get("name") or ""
+        else:
+            clean_name = resolve_card_name(snapshot)
 
         if filtering and not matches_filter:
             name_key_candidate = clean_name_candidate(clean_name)
@@ -861,103 +2735,46 @@ def extract_all(page, target_ids: list[int] | None = None, target_names: list[st
             ):
                 matches_filter = True
                 matched_by_name = True
+            elif name_matches.get(i, set()) & remaining_names:
+                matches_filter = True
+                matched_by_name = True
 
         if filtering and not matches_filter:
             continue
-
-        # Equipo visible
-        try:
-            team_vis = el.locator(".equipo span").inner_text().strip()
-        except:
-            team_vis = ""
-
-        data = {
-            "id": pid,
-            "name": clean_name,
-            "team_id": (ga("data-equipo") or "").strip(),
-            "team": team_vis,
-            "position": (ga("data-posicion") or "").strip(),
-            "value": to_int(ga("data-valor")),
-        }
-
-        avg_points_attr = grab_first(
-            "data-media",
-            "data-media-total",
-            "data-media_jornada",
-            "data-mediajornada",
-            "data-mediajornadas",
-            "data-media-puntos",
-            "data-promedio",
-            "data-puntos",
-        )
-        recent_points_attr = grab_first(
-            "data-media5",
-            "data-media-5",
-            "data-media5partidos",
-            "data-media5p",
-            "data-media_reciente",
-            "data-media-reciente",
-            "data-mediaultimos5",
-            "data-media-ultimos5",
-            "data-ultimos5",
-            "data-ult5",
-            "data-puntos5",
-        )
-        total_points_attr = grab_first(
-            "data-puntos-total",
-            "data-puntos_total",
-            "data-puntos-totales",
-            "data-puntos_totales",
-            "data-total-puntos",
-            "data-total_puntos",
-            "data-totalpuntos",
-            "data-puntos-temporada",
-            "data-puntos-season",
-            "data-puntos_temporada",
-        )
-
-        data["points_avg"] = to_float(avg_points_attr)
-        data["points_last5"] = to_float(recent_points_attr)
-        data["points_total"] = to_float(total_points_attr)
-
-        if pid is not None and pid in history_cache:
-            history = history_cache[pid]
-        else:
-            history = extract_points_history(page, el, pid, clean_name)
+        # Un jugador pedido expresamente en modo puntos se consulta siempre:
+        # la tarjeta no cambia cuando solo hay una jornada nueva en la API.
+        if filtering and run.fetch_points_history:
+            previous = None
+
+        if previous is not None:
+            data = dict(previous)
+            if data.get("points_history") and "points_stats" not in data:
+                data["points_stats"] = update_points_stats(None, data["points_history"])
             if pid is not None:
-                history_cache[pid] = history
-        data["points_history"] = history
-
-        if data["points_avg"] is None:
-            avg_from_history = compute_average_from_history(history)
-            if avg_from_history is not None:
-                data["points_avg"] = avg_from_history
-
-        if data["points_last5"] is None:
-            recent_from_history = compute_average_from_history(history, last=5)
-            if recent_from_history is not None:
-                data["points_last5"] = recent_from_history
-
-        if data["points_total"] is None:
-            total_from_history = compute_total_points(history)
-            if total_from_history is not None:
-                data["points_total"] = total_from_history
+                history_cache[pid] = data.get("points_history") or []
+            reused += 1
+        else:
+            data = build_player_record(snapshot, name=clean_name)
+            if pid is not None and pid in history_cache:
+                history = history_cache[pid]
+            else:
+                started = time.perf_counter()
+                history = extract_points_history(page, el, pid, clean_name, run)
+                HISTORY_TIMES.record(_elapsed_ms(started))
+                if pid is not None:
+                    history_cache[pid] = history
+            apply_points_history(data, history, previous_stats.get(pid))
+            data["fingerprint"] = fingerprint
 
         # Debug de lectura por jugador
         val_fmt = f"{data['value']:,}".replace(",", ".")
         print(f"→ Jugador {i+1}/{n}: {data['name']} ({data['team']}) | {val_fmt} €")
 
-        # Añadir históricos y variaciones
-        for k in [1, 2, 3, 7, 14, 30]:
-            data[f"value_{k}"] = to_int(ga(f"data-valor{k}"))
-            data[f"diff_{k}"] = to_int(ga(f"data-diferencia{k}"))
-            pct_raw = ga(f"data-diferencia-pct{k}") or "0"
-            try:
-                data[f"diff_pct_{k}"] = float(pct_raw.replace(",", "."))
-            except:
-                data[f"diff_pct_{k}"] = 0.0
-
         players.append(data)
+        if (i + 1) % MEMORY_CHECK_EVERY == 0:
+            MEMORY_REPORT.checkpoint("historial", f"{run.slug}, {i + 1}/{n}")
+        else:
+            MEMORY_REPORT.check_budget(f"historial ({run.slug}, {i + 1}/{n})")
 
         if filtering:
             if matched_by_id and pid is not None:
@@ -965,26 +2782,733 @@ def extract_all(page, target_ids: list[int] | None = None, target_names: list[st
                     remaining_ids.discard(int(pid))
             if normalized_name_key:
                 remaining_names.discard(normalized_name_key)
+            # Varios --player-name pueden resolver a la misma tarjeta.
+            remaining_names -= name_matches.get(i, set())
             if not remaining_ids and not remaining_names:
                 break
 
+    MEMORY_REPORT.checkpoint("extracción", f"{run.slug}, {len(players)} jugadores")
+    if reused:
+        print(f"♻️  {reused} jugadores sin cambios reutilizados del market.json previo.")
     if filtering:
         print(f"✅ Lectura completa: {len(players)} jugadores extraídos (filtrado).")
     else:
         print(f"✅ Lectura completa: {len(players)} jugadores extraídos.")
     return players
 
+# --- Canal asíncrono (--async) ---
+# Lectura de tarjetas, historiales y cierre de registros como etapas
+# separadas unidas por colas acotadas: mientras unas peticiones a la API
+# esperan red, el bucle sigue normalizando y guardando otros jugadores. El
+# modal comparte una única página, así que su uso se serializa con un candado.
+
+ASYNC_HISTORY_WORKERS = 8
+
+
+def select_target_cards(
+    snapshots: list[dict],
+    target_ids: list[int] | None,
+    target_names: list[str] | None,
+) -> list[int]:
+    """Índices de las tarjetas pedidas con --player-id/--player-name, con los mismos criterios que extract_all."""
+    remaining_ids = set()
+    for raw in target_ids or []:
+        with suppress(Exception):
+            remaining_ids.add(int(str(raw).strip()))
+    remaining_names = set()
+    for raw in target_names or []:
+        key = clean_name_candidate(raw) if raw else None
+        if key:
+            remaining_names.add(key.casefold())
+    name_matches = resolve_target_names(snapshots, target_names) if remaining_names else {}
+
+    selected = []
+    for i, snapshot in enumerate(snapshots):
+        if not remaining_ids and not remaining_names:
+            break
+        pid = card_player_id(snapshot.get("attrs") or {})
+        card_names = name_matches.get(i, set())
+        if pid is not None and pid in remaining_ids:
+            remaining_ids.discard(pid)
+            remaining_names -= card_names
+            selected.append(i)
+            continue
+        name_key = clean_name_candidate(resolve_card_name(snapshot, warn=False))
+        name_key = name_key.casefold() if name_key else ""
+        if (name_key and name_key in remaining_names) or card_names & remaining_names:
+            remaining_names.discard(name_key)
+            remaining_names -= card_names
+            selected.append(i)
+    return selected
+
+
+async def fetch_points_history_via_api_async(page, pid, label: str | None, run: CompetitionRun) -> list[dict]:
+    request = _api_request(page, pid, label, run)
+    if request is None:
+        return []
+    context, url, breaker, descriptor = request
+    delay = RATE_LIMITER.reserve(url)
+    if delay > 0:
+        await asyncio.sleep(delay)
+    print(f"   ↳ Consultando historial vía API para {descriptor}…")
+    timeout_ms = breaker.timeout_ms()
+    started = time.perf_counter()
+    try:
+        response = await context.request.get(url, timeout=timeout_ms)
+    except Exception as exc:
+        breaker.record_timeout(_elapsed_ms(started), timeout_ms)
+        print(f"   ↳ No se pudo acceder a la API para {descriptor}: {exc}")
+        return []
+
+    if not _record_api_status(breaker, response, started, descriptor):
+        return []
+
+    payload = text = error = None
+    try:
+        payload = await response.json()
+    except Exception as exc:
+        error = exc
+        try:
+            text = await response.text()
+        except Exception:
+            text = None
+    return _api_history_from_body(payload, text, error, descriptor)
+
+
+async def _trigger_player_detail_async(page, locator, pid) -> bool:
+    try:
+        await locator.click(timeout=1500)
+        return True
+    except Exception:
+        pass
+    if pid is None:
+        return False
+    try:
+        return bool(await page.evaluate(SHOW_PLAYER_DETAIL_SCRIPT, pid))
+    except Exception:
+        return False
+
+
+async def open_player_detail_async(page, locator, pid) -> bool:
+    """Versión asíncrona de open_player_detail (mismo tracker y misma espera a la respuesta)."""
+    tracker = MODAL_WAITS["detalle"]
+    if pid is None or not tracker.reliable:
+        return await _trigger_player_detail_async(page, locator, pid)
+
+    started = time.perf_counter()
+    try:
+        async with page.expect_response(_detail_response_matcher(pid), timeout=tracker.timeout()):
+            if not await _trigger_player_detail_async(page, locator, pid):
+                raise _DetailNotOpened()
+    except _DetailNotOpened:
+        return False
+    except Exception:
+        tracker.miss()
+        WAIT_REPORT.record("respuesta del detalle", 0, _elapsed_ms(started))
+        return True
+    tracker.observe(_elapsed_ms(started))
+    WAIT_REPORT.record("respuesta del detalle", 0, _elapsed_ms(started))
+    return True
+
+
+async def _wait_until_hidden_async(target, tracker: LatencyTracker, timeout_ms: float) -> bool:
+    if target is None or not tracker.reliable or timeout_ms <= 0:
+        return False
+    started = time.perf_counter()
+    try:
+        await target.wait_for_element_state("hidden", timeout=timeout_ms)
+    except Exception:
+        tracker.miss()
+        return False
+    tracker.observe(_elapsed_ms(started))
+    return True
+
+
+async def close_detail_modal_async(page, modal=None):
+    started = time.perf_counter()
+    tracker = MODAL_WAITS["cierre"]
+    budget_ms = tracker.timeout()
+    with suppress(Exception):
+        await page.keyboard.press("Escape")
+    if not await _wait_until_hidden_async(modal, tracker, budget_ms):
+        for sel in CLOSE_BUTTON_SELECTORS:
+            try:
+                btn = page.locator(sel).first
+                if await btn.is_visible():
+                    await btn.click(timeout=1000)
+                    await _wait_until_hidden_async(modal, tracker, budget_ms - _elapsed_ms(started))
+                    break
+            except Exception:
+                continue
+    WAIT_REPORT.record("cierre del detalle", 350, _elapsed_ms(started))
+
+
+async def fetch_points_history_via_modal_async(page, locator, pid, label: str | None, modal_lock) -> list[dict]:
+    """Mismos pasos que fetch_points_history_via_modal; el modal es único en la página, de ahí ``modal_lock``."""
+    descriptor = f"{label} (ID {pid})" if label and pid is not None else (label or f"ID {pid}")
+    async with modal_lock:
+        print(f"   ↳ Cargando historial de puntos para {descriptor}…")
+        with suppress(Exception):
+            await locator.scroll_into_view_if_needed(timeout=1000)
+        if not await open_player_detail_async(page, locator, pid):
+            print(f"   ↳ No se pudo abrir el detalle para {descriptor}.")
+            return []
+
+        history: list[dict] = []
+        modal = None
+        try:
+            started = time.perf_counter()
+            tracker = MODAL_WAITS["apertura"]
+            try:
+                modal = await page.wait_for_selector(MODAL_SELECTOR, state="visible", timeout=tracker.timeout())
+            except Exception:
+                tracker.miss()
+                raise
+            tracker.observe(_elapsed_ms(started))
+            settled = time.perf_counter()
+            with suppress(Exception):
+                await modal.wait_for_element_state("stable", timeout=1000)
+            WAIT_REPORT.record("apertura del detalle", 300, _elapsed_ms(settled))
+            payloads = await modal.evaluate(DATASET_COLLECTOR_SCRIPT, False) or {}
+            history = history_from_payloads({"entries": payloads.get("entries")})
+            if not history:
+                with suppress(Exception):
+                    history = parse_points_history_payload(await modal.inner_text(timeout=1000))
+        except Exception:
+            try:
+                history = parse_points_history_payload(await page.evaluate(PLAYER_DETAIL_STATE_SCRIPT))
+            except Exception:
+                history = []
+        finally:
+            await close_detail_modal_async(page, modal)
+    return dedupe_points_history(history)
+
+
+async def _timed_source(run: CompetitionRun, name: str, coro) -> list[dict]:
+    started = time.perf_counter()
+    try:
+        history = await coro or []
+    except Exception as exc:
+        print(f"   ↳ Falló la fuente '{name}': {exc}")
+        history = []
+    run.pipeline.sources[name].record(bool(history), _elapsed_ms(started))
+    return history
+
+
+async def extract_points_history_async(page, locator, pid, label, run: CompetitionRun, modal_lock) -> list[dict]:
+    """
+    Mismo criterio que extract_points_history: atributos primero y después
+    las fuentes remotas en el orden (y con las omisiones) del pipeline.
+    """
+
+    async def read_attributes():
+        return history_from_payloads(await locator.evaluate(DATASET_COLLECTOR_SCRIPT, True) or {})
+
+    remote = {
+        "api": lambda: fetch_points_history_via_api_async(page, pid, label, run),
+        "modal": lambda: fetch_points_history_via_modal_async(page, locator, pid, label, modal_lock),
+    }
+    pipeline = run.pipeline
+    attr_history = await _timed_source(run, "atributos", read_attributes())
+    if not needs_remote_history(attr_history, run.fetch_points_history) or pid is None:
+        return attr_history
+    for source in pipeline.next_plan():
+        if not pipeline.usable(source):
+            continue
+        history = await _timed_source(run, source.name, remote[source.name]())
+        if history:
+            return history
+    return attr_history
+
+
+async def extract_all_async(
+    page,
+    run: CompetitionRun,
+    target_ids: list[int] | None = None,
+    target_names: list[str] | None = None,
+    previous_players: list[dict] | None = None,
+    workers: int = ASYNC_HISTORY_WORKERS,
+):
+    await page.wait_for_selector("div.lista_elementos div.elemento_jugador", timeout=90_000)
+    cards = page.locator("div.lista_elementos div.elemento_jugador")
+    snapshots = await cards.evaluate_all(f"(cards) => cards.map({CARD_SNAPSHOT_SCRIPT})") or []
+    n = len(snapshots)
+    print(f"🔍 Detectados {n} elementos .elemento_jugador")
+    MEMORY_REPORT.checkpoint("extracción", f"{run.slug}, {n} tarjetas leídas")
+
+    filtering = bool(target_ids or target_names)
+    selected = select_target_cards(snapshots, target_ids, target_names) if filtering else range(n)
+    previous_by_id = _index_previous_players(previous_players)
+    previous_stats = _index_previous_stats(previous_players)
+
+    history_jobs: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    finished: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    modal_lock = asyncio.Lock()
+    # Un mismo ID repetido en varias tarjetas se consulta una sola vez.
+    pending_histories: dict[int, asyncio.Future] = {}
+    results: dict[int, dict] = {}
+    reused = 0
+
+    async def read_cards():
+        nonlocal reused
+        for i in selected:
+            snapshot = snapshots[i]
+            pid = card_player_id(snapshot.get("attrs") or {})
+            fingerprint = card_fingerprint(snapshot, run.mode)
+            previous = previous_by_id.get(pid) if pid is not None else None
+            # Como en extract_all: los jugadores pedidos en modo puntos no se reutilizan.
+            if filtering and run.fetch_points_history:
+                previous = None
+            if previous is not None and (
+                previous.get("fingerprint") == fingerprint
+                and (not run.fetch_points_history or previous.get("points_history"))
+            ):
+                reused += 1
+                data = dict(previous)
+                if data.get("points_history") and "points_stats" not in data:
+                    data["points_stats"] = update_points_stats(None, data["points_history"])
+                await finished.put((i, data, None))
+                continue
+            data = build_player_record(snapshot)
+            data["fingerprint"] = fingerprint
+            await history_jobs.put((i, pid, data))
+        for _ in range(workers):
+            await history_jobs.put(None)
+
+    async def fetch_histories():
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await history_jobs.get()
+            if job is None:
+                # Lo que read_cards pasó directo a finished ya está en la cola.
+                await finished.put(None)
+                return
+            i, pid, data = job
+            if pid is not None and pid in pending_histories:
+                history = await pending_histories[pid]
+            else:
+                future = loop.create_future()
+                if pid is not None:
+                    pending_histories[pid] = future
+                started = time.perf_counter()
+                try:
+                    history = await extract_points_history_async(
+                        page, cards.nth(i), pid, data.get("name"), run, modal_lock
+                    )
+                except Exception as exc:
+                    print(f"   ↳ Falló el historial de {data.get('name')}: {exc}")
+                    history = []
+                HISTORY_TIMES.record(_elapsed_ms(started))
+                future.set_result(history)
+            await finished.put((i, data, history))
+
+    async def finalize():
+        done = 0
+        open_workers = workers
+        while open_workers:
+            item = await finished.get()
+            if item is None:
+                open_workers -= 1
+                continue
+            i, data, history = item
+            if history is not None:
+                apply_points_history(data, history, previous_stats.get(data.get("id")))
+            results[i] = data
+            done += 1
+            val_fmt = f"{data['value']:,}".replace(",", ".")
+            print(f"→ Jugador {i+1}/{n}: {data['name']} ({data['team']}) | {val_fmt} €")
+            if done % MEMORY_CHECK_EVERY == 0:
+                MEMORY_REPORT.checkpoint("historial", f"{run.slug}, {done}/{n}")
+            else:
+                MEMORY_REPORT.check_budget(f"historial ({run.slug}, {done}/{n})")
+
+    # Si una etapa falla (p. ej. MemoryBudgetExceeded al cerrar registros) se
+    # cancelan las demás: con las colas acotadas se quedarían esperando.
+    stages = [
+        asyncio.create_task(read_cards()),
+        *(asyncio.create_task(fetch_histories()) for _ in range(workers)),
+        asyncio.create_task(finalize()),
+    ]
+    try:
+        await asyncio.gather(*stages)
+    except BaseException:
+        for stage in stages:
+            stage.cancel()
+        await asyncio.gather(*stages, return_exceptions=True)
+        raise
+
+    players = [results[i] for i in sorted(results)]
+    MEMORY_REPORT.checkpoint("extracción", f"{run.slug}, {len(players)} jugadores")
+    if reused:
+        print(f"♻️  {reused} jugadores sin cambios reutilizados del market.json previo.")
+    suffix = " (filtrado)" if filtering else ""
+    print(f"✅ Lectura completa: {len(players)} jugadores extraídos{suffix}.")
+    return players
+
+
+async def maybe_accept_cookies_async(page):
+    for sel in COOKIE_SELECTORS:
+        try:
+            btn = page.locator(sel).first
+            if await btn.is_visible():
+                print("→ Aceptando cookies…")
+                await btn.click(timeout=1000)
+                started = time.perf_counter()
+                with suppress(Exception):
+                    await btn.wait_for(state="hidden", timeout=2000)
+                WAIT_REPORT.record("aviso de cookies", 400, _elapsed_ms(started))
+                break
+        except Exception:
+            pass
+
+
+async def scrape_competition_async(
+    browser,
+    run: CompetitionRun,
+    target_ids: list[int] | None = None,
+    target_names: list[str] | None = None,
+    full_refresh: bool = False,
+    streaming_merge: bool = False,
+    history_store: HistoryStore | None = None,
+    verify_aggregates: bool = False,
+):
+    filtering = bool(target_ids or target_names)
+    if run.fetch_points_history:
+        print(
+            f"🔁 [{run.slug}] Modo puntos: se capturará el historial de puntuaciones de cada jugador."
+        )
+    else:
+        print(
+            f"ℹ️ [{run.slug}] Modo mercado: se omite la lectura detallada del historial de puntuaciones."
+        )
+
+    streaming, existing_payload, existing_players = load_run_inputs(run, filtering, streaming_merge)
+    if run.fetch_points_history:
+        run.pipeline.load(run.history_sources_path)
+
+    url = run.config["url"]
+    ctx = await browser.new_context()
+    try:
+        page = await ctx.new_page()
+        delay = RATE_LIMITER.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        print(f"🌐 [{run.slug}] Abriendo {url} (modo asíncrono) …")
+        await page.goto(url, wait_until="domcontentloaded", timeout=90_000)
+        await maybe_accept_cookies_async(page)
+        await page.wait_for_selector("div.lista_elementos", timeout=90_000)
+        MEMORY_REPORT.checkpoint("carga de página", run.slug)
+        players = await extract_all_async(
+            page,
+            run,
+            target_ids=target_ids or None,
+            target_names=target_names or None,
+            previous_players=None if full_refresh else existing_players,
+        )
+    finally:
+        with suppress(Exception):
+            await ctx.close()
+
+    run.pipeline.print_summary()
+    if run.fetch_points_history:
+        run.pipeline.save(run.history_sources_path)
+    if verify_aggregates:
+        verify_points_stats(players)
+    # Escritura y serialización fuera del bucle para no frenar otras competiciones.
+    await asyncio.to_thread(
+        save_run_output,
+        run, players, existing_payload, existing_players, filtering, streaming, history_store,
+    )
+
+
+async def run_competition_jobs_async(runs: list[CompetitionRun], workers: int = 1, headless: bool = False, **options):
+    """
+    Variante de run_competition_jobs sobre playwright.async_api: un único
+    navegador compartido por todas las capturas del bucle, con hasta
+    ``workers`` capturas a la vez.
+    """
+    failures: list[tuple] = []
+    limit = asyncio.Semaphore(max(1, workers))
+    output_locks = {run.output: asyncio.Lock() for run in runs}
+
+    async def run_job(browser, run):
+        async with limit, output_locks[run.output]:
+            started = time.perf_counter()
+            try:
+                await scrape_competition_async(browser, run, **options)
+            except Exception as exc:
+                print(f"⚠️  Falló la captura {run}: {exc}")
+                failures.append((run, exc))
+                return
+            print(f"✅ Captura {run} completada en {time.perf_counter() - started:.0f}s.")
+
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=headless)
+            try:
+                await asyncio.gather(*(run_job(browser, run) for run in runs))
+            finally:
+                with suppress(Exception):
+                    await browser.close()
+    except Exception as exc:
+        print(f"⚠️  No se pudo iniciar el navegador: {exc}")
+        done = {id(run) for run, _ in failures}
+        failures.extend((run, exc) for run in runs if id(run) not in done)
+    return failures
+
+
+def load_run_inputs(run: CompetitionRun, filtering: bool, streaming_merge: bool):
+    streaming = False
+    if filtering:
+        with suppress(OSError):
+            streaming = streaming_merge or os.path.getsize(run.output) >= STREAMING_MERGE_MIN_BYTES
+        streaming = streaming and os.path.isfile(run.output)
+
+    if streaming:
+        # Sin carga previa: se pierde la reutilización por huella, que en una
+        # actualización puntual afecta a pocas tarjetas.
+        print(f"🌊 Fusión en streaming: {run.output} no se carga en memoria.")
+        return True, None, []
+    existing_payload = load_existing_market_payload(run.output)
+    existing_players = (
+        existing_payload.get("players")
+        if isinstance(existing_payload, dict)
+        and isinstance(existing_payload.get("players"), list)
+        else []
+    )
+    return False, existing_payload, existing_players
+
+
+def save_run_output(
+    run: CompetitionRun,
+    players: list[dict],
+    existing_payload: dict | None,
+    existing_players: list[dict],
+    filtering: bool,
+    streaming: bool,
+    history_store: HistoryStore | None = None,
+):
+    timestamp = datetime.now(timezone.utc).isoformat()
+
+    if streaming:
+        writer = history_store.snapshot_writer(run.slug, timestamp) if history_store else None
+        try:
+            if writer is not None:
+                with writer:
+                    meta, count, updated_count = stream_merge_market_payload(
+                        players,
+                        {"updated_at": timestamp, "mode": run.mode},
+                        path=run.output,
+                        on_player=writer.add,
+                    )
+                    writer.meta = dict(meta)
+            else:
+                meta, count, updated_count = stream_merge_market_payload(
+                    players,
+                    {"updated_at": timestamp, "mode": run.mode},
+                    path=run.output,
+                )
+        except Exception as exc:
+            print(f"⚠️  No se pudo fusionar {run.output} en streaming: {exc}")
+            raise
+        MEMORY_REPORT.checkpoint("merge", run.slug)
+        if updated_count:
+            print(f"💾 Actualizados {updated_count} jugadores en {run.output}.")
+        else:
+            print("ℹ️ No se modificó ningún jugador con los criterios indicados.")
+        print(f"💾 {run.output} guardado con {count} jugadores.")
+        # market.bin guarda todas las columnas en memoria hasta escribirse, así
+        # que no se genera aquí para mantener la fusión en memoria constante; se
+        # borra el anterior para no servir datos viejos.
+        with suppress(FileNotFoundError):
+            os.remove(run.snapshot_output)
+            print(
+                f"ℹ️ {run.snapshot_output} eliminado por desactualizado; regenéralo con "
+                f"'python market_snapshot.py from-json {run.output} {run.snapshot_output}'."
+            )
+        MEMORY_REPORT.checkpoint("serialización", run.slug)
+        return
+
+    if filtering:
+        merged_players, updated_count = merge_player_payload(existing_players, players)
+
+        if not merged_players and not updated_count and not existing_players:
+            print(
+                f"⚠️  No se encontraron jugadores con los criterios indicados y no existe un {run.output} previo."
+            )
+            return
+
+        payload = dict(existing_payload) if isinstance(existing_payload, dict) else {}
+        payload["players"] = merged_players
+        payload["count"] = len(merged_players)
+        payload["updated_at"] = timestamp
+        payload["mode"] = run.mode
+
+        if updated_count:
+            print(f"💾 Actualizados {updated_count} jugadores en {run.output}.")
+        else:
+            print("ℹ️ No se modificó ningún jugador con los criterios indicados.")
+    else:
+        payload = {
+            "updated_at": timestamp,
+            "count": len(players),
+            "players": players,
+            "mode": run.mode,
+        }
+    MEMORY_REPORT.checkpoint("merge", run.slug)
+    write_market_payload(payload, run.output)
+    print(f"💾 {run.output} guardado con {payload['count']} jugadores.")
+    try:
+        write_snapshot(payload, run.snapshot_output)
+    except Exception as exc:
+        print(f"⚠️  No se pudo escribir {run.snapshot_output}: {exc}")
+    if history_store is not None:
+        try:
+            path = history_store.write_snapshot(payload, run.slug)
+            print(f"🗃️  Snapshot compacto en {path}.")
+        except Exception as exc:
+            print(f"⚠️  No se pudo guardar el snapshot en {history_store.path}: {exc}")
+    MEMORY_REPORT.checkpoint("serialización", run.slug)
+
+
+def scrape_competition(
+    browser,
+    run: CompetitionRun,
+    target_ids: list[int] | None = None,
+    target_names: list[str] | None = None,
+    full_refresh: bool = False,
+    streaming_merge: bool = False,
+    history_store: HistoryStore | None = None,
+    verify_aggregates: bool = False,
+):
+    filtering = bool(target_ids or target_names)
+    if run.fetch_points_history:
+        print(
+            f"🔁 [{run.slug}] Modo puntos: se capturará el historial de puntuaciones de cada jugador."
+        )
+    else:
+        print(
+            f"ℹ️ [{run.slug}] Modo mercado: se omite la lectura detallada del historial de puntuaciones."
+        )
+
+    streaming, existing_payload, existing_players = load_run_inputs(run, filtering, streaming_merge)
+
+    if run.fetch_points_history:
+        run.pipeline.load(run.history_sources_path)
+
+    url = run.config["url"]
+    ctx = None
+    page = None
+    try:
+        ctx = browser.new_context()
+        page = ctx.new_page()
+
+        RATE_LIMITER.wait(url)
+        print(f"🌐 Abriendo {url} …")
+        page.goto(url, wait_until="domcontentloaded", timeout=90_000)
+        maybe_accept_cookies(page)
+
+        page.wait_for_selector("div.lista_elementos", timeout=90_000)
+        MEMORY_REPORT.checkpoint("carga de página", run.slug)
+        players = extract_all(
+            page,
+            run,
+            target_ids=target_ids or None,
+            target_names=target_names or None,
+            previous_players=None if full_refresh else existing_players,
+        )
+    finally:
+        if page is not None:
+            with suppress(Exception):
+                page.close()
+        if ctx is not None:
+            with suppress(Exception):
+                ctx.close()
+
+    run.pipeline.print_summary()
+    if run.fetch_points_history:
+        run.pipeline.save(run.history_sources_path)
+    if verify_aggregates:
+        verify_points_stats(players)
+
+    save_run_output(
+        run, players, existing_payload, existing_players, filtering, streaming, history_store
+    )
+
+
+def run_competition_jobs(runs: list[CompetitionRun], workers: int = 1, headless: bool = False, **options):
+    """
+    Reparte las capturas entre ``workers`` hilos. Cada hilo arranca su propio
+    sync_playwright y su navegador y los reutiliza para todas las capturas que
+    toma de la cola: los objetos de la API síncrona de Playwright (y su
+    cliente HTTP, ``context.request``) están ligados al hilo que los creó y no
+    se pueden compartir. Lo compartido entre hilos es el límite de peticiones
+    por host y los cortocircuitos. Las capturas que escriben el mismo fichero
+    se serializan.
+    """
+    jobs: queue.Queue = queue.Queue()
+    for run in runs:
+        jobs.put(run)
+    output_locks = {run.output: threading.Lock() for run in runs}
+    failures: list[tuple] = []
+
+    def worker():
+        PROFILER.register_thread()
+        try:
+            with sync_playwright() as p:
+                browser = p.chromium.launch(headless=headless)
+                try:
+                    while True:
+                        try:
+                            run = jobs.get_nowait()
+                        except queue.Empty:
+                            return
+                        started = time.perf_counter()
+                        with output_locks[run.output]:
+                            try:
+                                scrape_competition(browser, run, **options)
+                            except Exception as exc:
+                                print(f"⚠️  Falló la captura {run}: {exc}")
+                                failures.append((run, exc))
+                                continue
+                        print(f"✅ Captura {run} completada en {time.perf_counter() - started:.0f}s.")
+                finally:
+                    with suppress(Exception):
+                        browser.close()
+        except Exception as exc:
+            print(f"⚠️  No se pudo iniciar el navegador del hilo: {exc}")
+            failures.append((None, exc))
+
+    workers = max(1, min(workers, len(runs)))
+    if workers == 1:
+        worker()
+    else:
+        threads = [
+            threading.Thread(target=worker, name=f"captura-{i + 1}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    while not jobs.empty():
+        failures.append((jobs.get_nowait(), RuntimeError("sin navegador disponible")))
+    return failures
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Genera market.json a partir del mercado web de FutbolFantasy"
     )
     parser.add_argument(
         "--mode",
-        choices=["market", "points"],
+        choices=["market", "points", "both"],
         default="market",
         help=(
-            "Selecciona 'market' para capturar solo valores de mercado o 'points' "
-            "para capturar también los historiales de puntos"
+            "Selecciona 'market' para capturar solo valores de mercado, 'points' "
+            "para capturar también los historiales de puntos o 'both' para "
+            "obtener ambos (equivale a 'points', que ya incluye los valores de mercado)"
         ),
     )
     parser.add_argument(
@@ -1011,8 +3535,100 @@ def main():
         action="store_false",
         help="Fuerza el modo visible del navegador",
     )
+    parser.add_argument(
+        "--full-refresh",
+        dest="full_refresh",
+        action="store_true",
+        help=(
+            "Ignora las huellas del market.json previo y vuelve a procesar todas "
+            "las tarjetas"
+        ),
+    )
+    parser.add_argument(
+        "--streaming-merge",
+        dest="streaming_merge",
+        action="store_true",
+        help=(
+            "Con --player-id/--player-name, fusiona market.json en streaming sin "
+            f"cargarlo entero (automático a partir de {STREAMING_MERGE_MIN_BYTES // (1024 * 1024)} MiB); "
+            "no genera market.bin"
+        ),
+    )
+    parser.add_argument(
+        "--competition",
+        dest="competitions",
+        action="append",
+        help=f"Competición a capturar (puede repetirse; por defecto {DEFAULT_COMPETITION})",
+    )
+    parser.add_argument(
+        "--competitions-file",
+        dest="competitions_file",
+        help="JSON {slug: {url, api_base, api_competition, output, rate_limit}} con competiciones adicionales",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Capturas simultáneas (un navegador por hilo)",
+    )
+    parser.add_argument(
+        "--memory-report",
+        dest="memory_report",
+        action="store_true",
+        help="Mide memoria Python (tracemalloc) y RSS propio y de hijos en cada fase",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        dest="memory_budget",
+        type=float,
+        help="MiB máximos de RSS (proceso + hijos); se aborta al superarlos",
+    )
+    parser.add_argument(
+        "--history-store",
+        dest="history_store",
+        help=(
+            "Directorio del almacén de historiales; guarda un snapshot compacto por "
+            "captura además de market.json, que se sigue escribiendo completo"
+        ),
+    )
+    parser.add_argument(
+        "--async",
+        dest="async_mode",
+        action="store_true",
+        help="Usa el canal asíncrono (playwright.async_api) con historiales en paralelo",
+    )
+    parser.add_argument(
+        "--verify-aggregates",
+        dest="verify_aggregates",
+        action="store_true",
+        help="Comprueba los agregados de puntos (points_stats) recalculándolos con el historial completo",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=(
+            "Perfila toda la ejecución por muestreo (Python frente a esperas de "
+            "Playwright) y guarda un flamegraph speedscope y un resumen junto a market.json"
+        ),
+    )
+    parser.add_argument(
+        "--profile-interval",
+        dest="profile_interval",
+        type=float,
+        default=5.0,
+        help="Milisegundos entre muestras de --profile",
+    )
+    parser.add_argument(
+        "--profile-top",
+        dest="profile_top",
+        type=int,
+        default=25,
+        help="Funciones listadas en el resumen de --profile",
+    )
     parser.set_defaults(headless=False)
     args = parser.parse_args()
+    PROFILER.configure(args.profile, args.profile_interval, args.profile_top)
+    PROFILER.start()
 
     target_ids: list[int] = []
     if getattr(args, "player_ids", None):
@@ -1031,89 +3647,61 @@ def main():
                 continue
             target_names.append(str(raw))
 
-    filtering = bool(target_ids or target_names)
-
-    global FETCH_POINTS_HISTORY
-    FETCH_POINTS_HISTORY = args.mode == "points"
-
-    if FETCH_POINTS_HISTORY:
-        print(
-            "🔁 Modo puntos: se capturará el historial de puntuaciones de cada jugador."
-        )
-    else:
-        print(
-            "ℹ️ Modo mercado: se omite la lectura detallada del historial de puntuaciones."
-        )
-
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=args.headless)
-            ctx = None
-            page = None
-            try:
-                ctx = browser.new_context()
-                page = ctx.new_page()
-
-                print(f"🌐 Abriendo {URL} …")
-                page.goto(URL, wait_until="domcontentloaded", timeout=90_000)
-                maybe_accept_cookies(page)
-
-                page.wait_for_selector("div.lista_elementos", timeout=90_000)
-                players = extract_all(
-                    page,
-                    target_ids=target_ids if target_ids else None,
-                    target_names=target_names if target_names else None,
-                )
-            finally:
-                if page is not None:
-                    with suppress(Exception):
-                        page.close()
-                if ctx is not None:
-                    with suppress(Exception):
-                        ctx.close()
-                with suppress(Exception):
-                    browser.close()
-    except Exception:
-        raise
-
-    timestamp = datetime.now(timezone.utc).isoformat()
-
-    if filtering:
-        existing_payload = load_existing_market_payload() or {}
-        existing_players = (
-            existing_payload.get("players")
-            if isinstance(existing_payload, dict)
-            and isinstance(existing_payload.get("players"), list)
-            else []
+        competitions = load_competitions(args.competitions_file)
+    except Exception as exc:
+        parser.error(f"No se pudo leer --competitions-file: {exc}")
+    slugs = args.competitions or [DEFAULT_COMPETITION]
+    unknown = [slug for slug in slugs if slug not in competitions]
+    if unknown:
+        parser.error(
+            f"Competición desconocida: {', '.join(unknown)} (disponibles: {', '.join(competitions)})"
         )
-        merged_players, updated_count = merge_player_payload(existing_players, players)
-
-        if not merged_players and not updated_count and not existing_players:
-            print(
-                "⚠️  No se encontraron jugadores con los criterios indicados y no existe un market.json previo."
-            )
-            return
-
-        payload = dict(existing_payload) if isinstance(existing_payload, dict) else {}
-        payload["players"] = merged_players
-        payload["count"] = len(merged_players)
-        payload["updated_at"] = timestamp
-        payload["mode"] = args.mode
-
-        if updated_count:
-            print(f"💾 Actualizados {updated_count} jugadores en market.json.")
+    # Una captura de puntos ya incluye los valores de mercado; dos capturas de
+    # la misma competición escribirían el mismo fichero y la de mercado
+    # podría pisar los historiales.
+    mode = "points" if args.mode == "both" else args.mode
+    runs = [CompetitionRun(slug, competitions[slug], mode) for slug in dict.fromkeys(slugs)]
+
+    MEMORY_REPORT.configure(args.memory_report, args.memory_budget)
+    history_store = HistoryStore(args.history_store) if args.history_store else None
+
+    job_options = dict(
+        workers=args.workers,
+        headless=args.headless,
+        target_ids=target_ids,
+        target_names=target_names,
+        full_refresh=args.full_refresh,
+        streaming_merge=args.streaming_merge,
+        history_store=history_store,
+        verify_aggregates=args.verify_aggregates,
+    )
+    try:
+        if args.async_mode:
+            PROFILER.register_thread()
+            failures = asyncio.run(run_competition_jobs_async(runs, **job_options))
         else:
-            print("ℹ️ No se modificó ningún jugador con los criterios indicados.")
-    else:
-        payload = {
-            "updated_at": timestamp,
-            "count": len(players),
-            "players": players,
-            "mode": args.mode,
-        }
-    with open("market.json", "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-    print(f"💾 market.json guardado con {payload['count']} jugadores.")
+            failures = run_competition_jobs(runs, **job_options)
+
+        WAIT_REPORT.print_summary()
+        HISTORY_TIMES.print_summary()
+        for breaker in list(_BREAKERS.values()):
+            breaker.print_summary()
+        RATE_LIMITER.print_summary()
+        MEMORY_REPORT.print_summary()
+        if history_store is not None:
+            history_store.print_summary()
+    finally:
+        # El perfil se guarda también si la captura se interrumpe.
+        PROFILER.stop()
+        PROFILER.print_summary(runs[0].output)
+
+    if failures:
+        if len(runs) == 1:
+            raise failures[0][1]
+        failed = ", ".join(str(run) if run is not None else "navegador" for run, _ in failures)
+        print(f"⚠️  Capturas fallidas: {failed}")
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,423 @@
+# standin_server.py
+"""
+Sustituto local de FutbolFantasy para pruebas de carga y resistencia del
+sniffer sin tocar la web real:
+
+    GET /analytics/laliga-fantasy/mercado   página con N tarjetas div.elemento_jugador
+    GET /detalle/{id}                        contenido del modal de detalle
+    GET /api/v3/player/{id}                  historial de puntos (API de jugadores)
+
+La latencia (base + cola exponencial), la tasa de errores 5xx/429 y la forma
+de la respuesta de la API se configuran por línea de comandos. Con
+``--harness`` arranca el servidor, lanza el sniffer contra él mediante un
+--competitions-file temporal y mide rendimiento, latencias por jugador y el
+pico de RSS del proceso y sus hijos (Chromium incluido).
+
+    python standin_server.py --players 6000 --port 8010
+    python standin_server.py --harness --players 6000 --mode points --latency-ms 80 --error-rate 0.05
+    python standin_server.py --harness --compare-async --players 2000
+"""
+import argparse
+import html
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from proc_memory import process_tree_pids, read_status_kib
+
+SNIFFER_SCRIPT = "sniff_market_json_v3_debug.py"
+MARKET_PATH = "/analytics/laliga-fantasy/mercado"
+API_PREFIX = "/api/v3/player/"
+DETAIL_PREFIX = "/detalle/"
+
+POSITIONS = ["Portero", "Defensa", "Mediocampista", "Delantero"]
+TEAMS = [
+    "Alavés", "Athletic", "Atlético", "Barcelona", "Betis", "Celta", "Elche",
+    "Espanyol", "Getafe", "Girona", "Levante", "Mallorca", "Osasuna", "Oviedo",
+    "Rayo Vallecano", "Real Madrid", "Real Sociedad", "Sevilla", "Valencia", "Villarreal",
+]
+WINDOWS = [1, 2, 3, 7, 14, 30]
+PAYLOAD_SHAPES = ["list", "jornadas", "text", "empty", "mixed"]
+
+PAGE_SCRIPT = """
+window.app = window.app || {};
+window.app.Analytics = {
+  showPlayerDetail: async (competition, extra, playerId) => {
+    const modal = document.getElementById('detalle-jugador');
+    const response = await fetch('/detalle/' + playerId);
+    modal.innerHTML = await response.text();
+    modal.style.display = 'block';
+  },
+};
+document.addEventListener('keydown', (event) => {
+  if (event.key === 'Escape') {
+    document.getElementById('detalle-jugador').style.display = 'none';
+  }
+});
+"""
+
+
+class StandinMarket:
+    """Jugadores sintéticos deterministas (semilla) con su historial de puntos."""
+
+    def __init__(self, players: int, matchdays: int = 10, seed: int = 0, attr_history_ratio: float = 0.0):
+        rng = random.Random(seed)
+        self.players = []
+        for i in range(players):
+            pid = 100_000 + i
+            value = rng.randint(150, 12_000) * 10_000
+            history = [
+                {"matchday": md, "points": rng.choice([-2, 0, 1, 2, 2, 4, 6, 8, 10, 14])}
+                for md in range(1, matchdays + 1)
+            ]
+            windows = {}
+            for k in WINDOWS:
+                previous = max(100_000, int(value * (1 - rng.gauss(0, 0.015 * k ** 0.5))))
+                windows[k] = (previous, value - previous, (value - previous) / previous * 100)
+            self.players.append(
+                {
+                    "id": pid,
+                    "name": f"Jugador Sintético {i}",
+                    "team_id": str(i % len(TEAMS) + 1),
+                    "team": TEAMS[i % len(TEAMS)],
+                    "position": POSITIONS[i % len(POSITIONS)],
+                    "value": value,
+                    "windows": windows,
+                    "history": history,
+                    "attr_history": rng.random() < attr_history_ratio,
+                }
+            )
+        self.by_id = {player["id"]: player for player in self.players}
+
+    def card_html(self, player: dict) -> str:
+        attrs = {
+            "class": "elemento_jugador",
+            "onclick": f"app.Analytics.showPlayerDetail('laliga-fantasy','',{player['id']});",
+            "data-nombre": player["name"],
+            "data-equipo": player["team_id"],
+            "data-posicion": player["position"],
+            "data-valor": str(player["value"]),
+        }
+        for k, (previous, diff, pct) in player["windows"].items():
+            attrs[f"data-valor{k}"] = str(previous)
+            attrs[f"data-diferencia{k}"] = str(diff)
+            attrs[f"data-diferencia-pct{k}"] = f"{pct:.4f}".replace(".", ",")
+        if player["attr_history"]:
+            attrs["data-puntos"] = ", ".join(
+                f"J{entry['matchday']}: {entry['points']}" for entry in player["history"]
+            )
+        rendered = " ".join(f'{key}="{html.escape(value, quote=True)}"' for key, value in attrs.items())
+        return (
+            f"<div {rendered}>"
+            f'<div class="datos-nombre">{html.escape(player["name"])}</div>'
+            f'<div class="equipo"><span>{html.escape(player["team"])}</span></div>'
+            "</div>"
+        )
+
+    def page_html(self) -> bytes:
+        cards = "\n".join(self.card_html(player) for player in self.players)
+        return (
+            "<!doctype html><html><head><meta charset='utf-8'><title>Mercado</title></head><body>"
+            f"<div class='lista_elementos'>\n{cards}\n</div>"
+            "<div id='detalle-jugador' class='modal' style='display:none'></div>"
+            f"<script>{PAGE_SCRIPT}</script></body></html>"
+        ).encode("utf-8")
+
+    def detail_html(self, player: dict) -> bytes:
+        rows = "".join(
+            f"<div data-jornada='{entry['matchday']}' data-puntos='{entry['points']}'>"
+            f"J{entry['matchday']}: {entry['points']}</div>"
+            for entry in player["history"]
+        )
+        return f"<h2>{html.escape(player['name'])}</h2>{rows}".encode("utf-8")
+
+    def api_payload(self, player: dict, shape: str, rng: random.Random) -> dict:
+        if shape == "mixed":
+            shape = rng.choice(["list", "jornadas", "text", "empty"])
+        history = player["history"]
+        if shape == "jornadas":
+            return {"id": player["id"], "jornadas": {f"j{e['matchday']}": e["points"] for e in history}}
+        if shape == "text":
+            return {"id": player["id"], "historial": ", ".join(f"J{e['matchday']}: {e['points']}" for e in history)}
+        if shape == "empty":
+            return {"id": player["id"]}
+        return {"id": player["id"], "history": [{"jornada": e["matchday"], "puntos": e["points"]} for e in history]}
+
+
+class StandinStats:
+    def __init__(self):
+        self.requests: dict[str, int] = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def count(self, route: str, error: bool = False):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            if error:
+                self.errors += 1
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, market: StandinMarket, options):
+        super().__init__(address, StandinHandler)
+        self.market = market
+        self.options = options
+        self.stats = StandinStats()
+        self.page_body = market.page_html()
+        self.rng = random.Random(options.seed)
+        self.rng_lock = threading.Lock()
+
+    def latency_s(self) -> float:
+        with self.rng_lock:
+            tail = self.rng.expovariate(1 / self.options.latency_jitter_ms) if self.options.latency_jitter_ms > 0 else 0.0
+        return (self.options.latency_ms + tail) / 1000
+
+    def roll(self, probability: float) -> bool:
+        with self.rng_lock:
+            return self.rng.random() < probability
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server: StandinServer = self.server
+        path = urlsplit(self.path).path
+        if path.rstrip("/") == MARKET_PATH:
+            time.sleep(server.options.page_latency_ms / 1000)
+            server.stats.count("mercado")
+            self._send(200, server.page_body, "text/html; charset=utf-8")
+            return
+
+        match = re.fullmatch(rf"({re.escape(API_PREFIX)}|{re.escape(DETAIL_PREFIX)})(\d+)", path)
+        player = server.market.by_id.get(int(match.group(2))) if match else None
+        if player is None:
+            server.stats.count("404")
+            self._send(404, b'{"error": "not found"}', "application/json")
+            return
+
+        time.sleep(server.latency_s())
+        if match.group(1) == DETAIL_PREFIX:
+            server.stats.count("detalle")
+            self._send(200, server.market.detail_html(player), "text/html; charset=utf-8")
+            return
+
+        if server.roll(server.options.error_rate):
+            status = 429 if server.roll(0.2) else 503
+            server.stats.count("api", error=True)
+            self._send(status, b'{"error": "upstream"}', "application/json")
+            return
+        with server.rng_lock:
+            payload = server.market.api_payload(player, server.options.payload_shape, server.rng)
+        server.stats.count("api")
+        self._send(200, json.dumps(payload).encode("utf-8"), "application/json")
+
+
+def start_server(options) -> StandinServer:
+    market = StandinMarket(options.players, options.matchdays, options.seed, options.attr_history_ratio)
+    server = StandinServer((options.host, options.port), market, options)
+    threading.Thread(target=server.serve_forever, name="standin", daemon=True).start()
+    return server
+
+
+def run_harness(server: StandinServer, options, extra_args: tuple = ()) -> int:
+    host, port = server.server_address[:2]
+    base = f"http://{host}:{port}"
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory(prefix="standin-") as workdir:
+        competitions_path = os.path.join(workdir, "competitions.json")
+        output = os.path.join(workdir, "market.standin.json")
+        with open(competitions_path, "w", encoding="utf-8") as fh:
+            json.dump(
+                {
+                    "standin": {
+                        "url": f"{base}{MARKET_PATH}",
+                        "api_base": f"{base}{API_PREFIX.rstrip('/')}",
+                        "api_competition": "laliga-fantasy",
+                        "output": output,
+                        "rate_limit": options.rate_limit,
+                    }
+                },
+                fh,
+            )
+        command = [
+            options.python,
+            os.path.join(base_dir, SNIFFER_SCRIPT),
+            "--competition", "standin",
+            "--competitions-file", competitions_path,
+            "--mode", options.mode,
+            "--headless",
+            *options.sniffer_args,
+            *extra_args,
+        ]
+        print(f"🧪 {options.players} tarjetas en {base}; lanzando: {' '.join(command)}")
+        env = dict(os.environ, PYTHONUNBUFFERED="1", PYTHONIOENCODING="utf-8")
+        started = time.perf_counter()
+        child = subprocess.Popen(
+            command, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env
+        )
+
+        # Muestreado por proceso de este sniffer: getrusage(RUSAGE_CHILDREN)
+        # acumularía el máximo de todas las variantes lanzadas antes.
+        peak_rss = 0
+        peak_process_rss = 0
+        done = threading.Event()
+
+        def sample_rss():
+            nonlocal peak_rss, peak_process_rss
+            while not done.is_set():
+                sizes = [read_status_kib(pid, "VmRSS") for pid in process_tree_pids(child.pid)]
+                peak_rss = max(peak_rss, sum(sizes))
+                peak_process_rss = max(peak_process_rss, max(sizes, default=0))
+                done.wait(options.rss_interval)
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+
+        player_times: list[float] = []
+        first_card = None
+        tail_lines: list[str] = []
+        # La latencia por jugador la mide el propio sniffer alrededor de cada
+        # consulta: con --async las líneas "→ Jugador" llegan intercaladas.
+        history_line = ""
+        for line in child.stdout:
+            now = time.perf_counter()
+            if line.startswith("→ Jugador"):
+                if first_card is None:
+                    first_card = now
+                player_times.append(now)
+            else:
+                if line.startswith("⏱️  Historial por jugador:"):
+                    history_line = line.split(":", 1)[1].strip()
+                tail_lines.append(line.rstrip())
+                tail_lines = tail_lines[-40:]
+            if options.verbose:
+                print(line, end="")
+        returncode = child.wait()
+        done.set()
+        sampler.join()
+        elapsed = time.perf_counter() - started
+
+        saved = 0
+        with_history = 0
+        try:
+            with open(output, "r", encoding="utf-8") as fh:
+                players = json.load(fh).get("players") or []
+            saved = len(players)
+            with_history = sum(1 for player in players if player.get("points_history"))
+        except Exception:
+            pass
+
+    if returncode != 0 and not options.verbose:
+        print("\n".join(tail_lines))
+    extraction_s = (player_times[-1] - first_card) if len(player_times) > 1 else 0.0
+    print(f"📊 Resultado (código {returncode}) en {elapsed:.1f}s:")
+    print(
+        f"   · Jugadores: {len(player_times)} leídos, {saved} guardados, {with_history} con historial"
+    )
+    if extraction_s:
+        print(
+            f"   · Rendimiento: {len(player_times) / extraction_s:.1f} jugadores/s en extracción, "
+            f"{len(player_times) / elapsed:.1f} jugadores/s de extremo a extremo"
+        )
+    print(f"   · Latencia del historial por jugador: {history_line or 'sin consultas de historial'}")
+    print(
+        f"   · Memoria: pico de RSS del árbol {peak_rss / 1024:.0f} MiB, "
+        f"máximo de un solo proceso {peak_process_rss / 1024:.0f} MiB (muestreados cada {options.rss_interval:g}s)"
+    )
+    requests = ", ".join(f"{route} {count}" for route, count in sorted(server.stats.requests.items()))
+    print(f"   · Servidor: {requests or 'sin peticiones'}; {server.stats.errors} errores inyectados")
+    return returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Web y API sustitutas para pruebas de carga del sniffer")
+    parser.add_argument("--host", default="127.0.0.1", help="Interfaz de escucha")
+    parser.add_argument("--port", type=int, default=8010, help="Puerto HTTP (0 = libre)")
+    parser.add_argument("--players", type=int, default=622, help="Número de tarjetas")
+    parser.add_argument("--matchdays", type=int, default=10, help="Jornadas de historial por jugador")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los datos y de los fallos")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latencia base de API y detalle")
+    parser.add_argument("--latency-jitter-ms", type=float, default=25.0, help="Media de la cola exponencial añadida")
+    parser.add_argument("--page-latency-ms", type=float, default=200.0, help="Latencia de la página de mercado")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 5xx/429 de la API")
+    parser.add_argument(
+        "--payload-shape",
+        choices=PAYLOAD_SHAPES,
+        default="list",
+        help="Forma del historial en la API ('empty' obliga a recurrir al modal)",
+    )
+    parser.add_argument(
+        "--attr-history-ratio",
+        type=float,
+        default=0.0,
+        help="Fracción de tarjetas con historial en data-puntos",
+    )
+    parser.add_argument("--harness", action="store_true", help="Lanza el sniffer contra el servidor y mide")
+    parser.add_argument("--mode", choices=["market", "points"], default="points", help="Modo del sniffer")
+    parser.add_argument("--rate-limit", type=float, default=1000.0, help="Peticiones/s por host en el sniffer")
+    parser.add_argument("--python", default=sys.executable, help="Intérprete para el sniffer")
+    parser.add_argument("--rss-interval", type=float, default=0.2, help="Segundos entre muestras de RSS")
+    parser.add_argument("--verbose", action="store_true", help="Muestra la salida completa del sniffer")
+    parser.add_argument(
+        "--compare-async",
+        action="store_true",
+        help="Con --harness, ejecuta el sniffer en modo síncrono y con --async y compara",
+    )
+    parser.add_argument(
+        "sniffer_args",
+        nargs=argparse.REMAINDER,
+        help="Argumentos extra para el sniffer tras '--'",
+    )
+    args = parser.parse_args()
+    if args.sniffer_args and args.sniffer_args[0] == "--":
+        args.sniffer_args = args.sniffer_args[1:]
+    if args.harness and args.port == 8010:
+        args.port = 0
+
+    server = start_server(args)
+    host, port = server.server_address[:2]
+    if args.harness:
+        variants = [("síncrono", ()), ("asíncrono", ("--async",))] if args.compare_async else [("", ())]
+        try:
+            returncode = 0
+            for label, extra_args in variants:
+                if label:
+                    print(f"▶️  Canal {label}")
+                server.stats = StandinStats()
+                returncode = run_harness(server, args, extra_args) or returncode
+            raise SystemExit(returncode)
+        finally:
+            server.shutdown()
+    print(f"🌐 Sustituto escuchando en http://{host}:{port}{MARKET_PATH} ({args.players} jugadores)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()